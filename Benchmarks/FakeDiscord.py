@@ -0,0 +1,328 @@
+# Stand-in for the parts of Discord that LanguageBot talks to, so the bot can be
+# driven and measured in-process without a token or a network connection.
+# Every API call goes through FakeGateway.api_call, which adds the configured
+# latency, enforces the configured rate limit and counts the call by endpoint.
+# Gateways in different processes can share the bot's messages and reactions through
+# two dictionaries (like multiprocessing.Manager ones), so a message one bot process sent
+# can be fetched by another, as with the real Discord.
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+
+import discord
+
+
+class FakeResponse:
+    """
+    The parts of an HTTP response that discord.HTTPException reads.
+    """
+
+    def __init__(self, status, reason):
+        self.status = status
+        self.reason = reason
+
+
+def unknown_message():
+    """
+    :return: The error Discord gives for a message that doesn't exist (or was deleted).
+    """
+
+    return discord.NotFound(FakeResponse(404, "Not Found"), {"code": 10008, "message": "Unknown Message"})
+
+
+class FakeEmoji:
+    def __init__(self, name):
+        self.name = name
+
+
+class RawReactionEvent:
+    """
+    Same fields the bot reads from discord.RawReactionActionEvent.
+    """
+
+    def __init__(self, message_id, channel_id, user_id, emoji):
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.emoji = FakeEmoji(emoji)
+
+
+class FakeReaction:
+    def __init__(self, emoji):
+        self.emoji = emoji
+        self.count = 0
+        self.me = False
+        self.users = set()
+
+
+class FakeUser:
+    def __init__(self, gateway, user_id, name):
+        self.gateway = gateway
+        self.id = user_id
+        self.name = name
+        self.dm_channel = None
+
+    async def create_dm(self):
+        await self.gateway.api_call("create_dm")
+        if self.dm_channel is None:
+            self.dm_channel = self.gateway.create_channel(is_dm=True)
+        return self.dm_channel
+
+
+class FakeAttachment:
+    def __init__(self, gateway, filename, data):
+        self.gateway = gateway
+        self.filename = filename
+        self.size = len(data)
+        self.data = data
+
+    async def read(self):
+        await self.gateway.api_call("fetch_attachment")
+        return self.data
+
+
+class FakeMessage:
+    def __init__(self, gateway, channel, message_id, author, content, attachments=()):
+        self.gateway = gateway
+        self.channel = channel
+        self.id = message_id
+        self.author = author
+        self.content = content
+        self.attachments = list(attachments)
+        self.reactions = []
+        self.files = []
+
+    def get_reaction(self, emoji):
+        for reaction in self.reactions:
+            if reaction.emoji == emoji:
+                return reaction
+        reaction = FakeReaction(emoji)
+        self.reactions.append(reaction)
+        return reaction
+
+    async def edit(self, content=None):
+        await self.gateway.api_call("edit_message", self.channel.id)
+        self.content = content
+
+    async def delete(self):
+        await self.gateway.api_call("delete_message", self.channel.id)
+        self.channel.messages.pop(self.id, None)
+
+    async def add_reaction(self, emoji):
+        await self.gateway.api_call("add_reaction", self.channel.id)
+        reaction = self.get_reaction(emoji)
+        if self.gateway.bot_user.id not in reaction.users:
+            reaction.users.add(self.gateway.bot_user.id)
+            reaction.count += 1
+            reaction.me = True
+        self.gateway.share_reaction(self.id, self.gateway.bot_user.id, emoji)
+
+
+class FakePartialMessage:
+    """
+    What channel.get_partial_message returns: just enough to edit or delete without fetching.
+    """
+
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, content=None):
+        await self.channel.gateway.api_call("edit_message", self.channel.id)
+        message = self.channel.get_message(self.id)
+        if message is None:
+            raise unknown_message()
+        message.content = content
+        self.channel.gateway.share_message(message)
+
+    async def delete(self):
+        await self.channel.gateway.api_call("delete_message", self.channel.id)
+        if self.channel.get_message(self.id) is None:
+            raise unknown_message()
+        self.channel.messages.pop(self.id, None)
+        self.channel.gateway.unshare_message(self.id)
+
+
+class FakeChannel:
+    def __init__(self, gateway, channel_id, is_dm=False):
+        self.gateway = gateway
+        self.id = channel_id
+        self.is_dm = is_dm
+        self.messages = {}  # Message id -> FakeMessage
+
+    async def send(self, content=None, file=None):
+        await self.gateway.api_call("send_message", self.id)
+        message = FakeMessage(self.gateway, self, self.gateway.next_id(), self.gateway.bot_user, content)
+        if file is not None:
+            message.files.append(file)
+        self.messages[message.id] = message
+        self.gateway.share_message(message)
+        return message
+
+    def get_message(self, message_id):
+        """
+        :param message_id: A message id.
+        :return: The message, or None. With a shared store, the bot's messages are read back from it,
+                 reactions and all, since another process could have sent them.
+        """
+
+        if self.gateway.shared_messages is not None and message_id in self.gateway.shared_messages:
+            return self.gateway.load_shared_message(self, message_id)
+        return self.messages.get(message_id)
+
+    async def fetch_message(self, message_id):
+        await self.gateway.api_call("fetch_message", self.id)
+        message = self.get_message(message_id)
+        if message is None:
+            raise unknown_message()
+        return message
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+
+class FakeGateway:
+    """
+    FakeGateway
+
+    Holds the fake channels, users and messages, and delivers events to the bot.
+    Everything random comes from one seeded generator, so runs can be repeated.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit=None, seed=0, first_id=1000, bot_user_id=None,
+                 shared_messages=None, shared_reactions=None):
+        self.latency = latency  # Seconds each API call takes.
+        self.jitter = jitter  # Up to this many extra seconds per call, at random.
+        self.rate_limit = rate_limit  # (calls, seconds) allowed per endpoint and channel, or None for no limit.
+        self.channel_latency = {}  # Channel id -> extra seconds every call for that channel takes, for slow channels.
+        self.random = random.Random(seed)
+        self.ids = itertools.count(first_id)  # Give gateways in different processes different ranges.
+        self.bot = None
+        self.bot_user = FakeUser(self, self.next_id() if bot_user_id is None else bot_user_id, "LanguageBot")
+        self.channels = {}  # Channel id -> FakeChannel
+        self.users = []
+        self.shared_messages = shared_messages  # Message id -> (channel id, content) for every message the bot sent, or None.
+        self.shared_reactions = shared_reactions  # (message id, user id, emoji) -> True for every reaction on them, or None.
+        self.running = True
+
+        self.api_calls = Counter()  # Endpoint -> number of calls.
+        self.api_time = Counter()  # Endpoint -> total seconds spent.
+        self.rate_limited = Counter()  # Endpoint -> calls that had to wait for the rate limit.
+        self.buckets = {}  # (endpoint, channel id) -> list of call times inside the current window.
+
+    def next_id(self):
+        return next(self.ids)
+
+    def attach(self, bot):
+        self.bot = bot
+
+    def create_channel(self, is_dm=False, channel_id=None):
+        channel = FakeChannel(self, self.next_id() if channel_id is None else channel_id, is_dm)
+        self.channels[channel.id] = channel
+        return channel
+
+    def create_attachment(self, filename, data):
+        return FakeAttachment(self, filename, data)
+
+    def create_users(self, count):
+        for index in range(count):
+            self.users.append(FakeUser(self, self.next_id(), "user" + str(index)))
+        return self.users
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def share_message(self, message):
+        if self.shared_messages is not None:
+            self.shared_messages[message.id] = (message.channel.id, message.content)
+
+    def unshare_message(self, message_id):
+        if self.shared_messages is not None:
+            self.shared_messages.pop(message_id, None)
+
+    def share_reaction(self, message_id, user_id, emoji):
+        if self.shared_reactions is not None:
+            self.shared_reactions[(message_id, user_id, emoji)] = True  # One key per reaction, so processes never overwrite each other's.
+
+    def load_shared_message(self, channel, message_id):
+        """
+        Rebuilds one of the bot's messages from the shared store.
+        :return: The message, or None if it isn't there.
+        """
+
+        data = self.shared_messages.get(message_id)
+        if data is None:
+            return None
+        message = FakeMessage(self, channel, message_id, self.bot_user, data[1])
+        for reaction_message_id, user_id, emoji in list(self.shared_reactions.keys()):
+            if reaction_message_id == message_id:
+                reaction = message.get_reaction(emoji)
+                reaction.users.add(user_id)
+                reaction.count += 1
+                reaction.me = reaction.me or user_id == self.bot_user.id
+        return message
+
+    async def api_call(self, endpoint, channel_id=None):
+        """
+        Every fake API call comes through here.
+        :param endpoint: Name of the endpoint, for counting.
+        :param channel_id: Channel the call is for, since rate limits are per channel.
+        :return: nothing.
+        """
+
+        start = time.perf_counter()
+        if self.rate_limit is not None:
+            calls, window = self.rate_limit
+            bucket = self.buckets.setdefault((endpoint, channel_id), [])
+            while True:
+                now = time.monotonic()
+                while len(bucket) > 0 and bucket[0] <= now - window:
+                    bucket.pop(0)
+                if len(bucket) < calls:
+                    break
+                self.rate_limited[endpoint] += 1
+                await asyncio.sleep(bucket[0] + window - now)  # Like retrying after a 429.
+            bucket.append(time.monotonic())
+
+        delay = self.latency + self.channel_latency.get(channel_id, 0.0)
+        if self.jitter > 0:
+            delay += self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
+        self.api_calls[endpoint] += 1
+        self.api_time[endpoint] += time.perf_counter() - start
+
+    async def send_user_message(self, channel, user, content, attachments=()):
+        """
+        Has a user post a message and hands it to the bot's on_message.
+        :return: Seconds on_message took.
+        """
+
+        message = FakeMessage(self, channel, self.next_id(), user, content, attachments)
+        channel.messages[message.id] = message
+        start = time.perf_counter()
+        await self.bot.on_message(message)
+        return time.perf_counter() - start
+
+    async def react(self, channel, message_id, user, emoji, add=True):
+        """
+        Has a user add or remove a reaction, and sends the bot the raw event.
+        :return: nothing.
+        """
+
+        message = channel.messages.get(message_id)
+        if message is None:
+            return
+        reaction = message.get_reaction(emoji)
+        if add and user.id not in reaction.users:
+            reaction.users.add(user.id)
+            reaction.count += 1
+            await self.bot.on_raw_reaction_add(RawReactionEvent(message_id, channel.id, user.id, emoji))
+        elif not add and user.id in reaction.users:
+            reaction.users.discard(user.id)
+            reaction.count -= 1
+            await self.bot.on_raw_reaction_remove(RawReactionEvent(message_id, channel.id, user.id, emoji))
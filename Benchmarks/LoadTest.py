@@ -0,0 +1,235 @@
+# Load test for LanguageBot's hot paths: on_message, background_tasks and saving.
+# The bot runs in-process against FakeDiscord, so no token or network is needed.
+# Run from the repository root (discord.py still has to be installed):
+#     python Benchmarks/LoadTest.py --languages 10 --amendments 200 --burst 500
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Module"))
+
+import LanguageBot
+from FakeDiscord import FakeGateway
+
+
+def percentile(values, percent):
+    """
+    :param values: A list of numbers.
+    :param percent: Which percentile, 0 to 100.
+    :return: The percentile, or 0 for an empty list.
+    """
+
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100.0 * (len(ordered) - 1))))]
+
+
+class TimedStorage:
+    """
+    Wraps a storage backend and times every write the bot makes through it.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.save_times = defaultdict(list)  # Method name -> list of seconds.
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    async def timed(self, name, *args):
+        start = time.perf_counter()
+        result = await getattr(self.storage, name)(*args)
+        self.save_times[name].append(time.perf_counter() - start)
+        return result
+
+    async def add_language(self, language):
+        return await self.timed("add_language", language)
+
+    async def add_amendment(self, language, change):
+        return await self.timed("add_amendment", language, change)
+
+    async def resolve_amendment(self, language, change, accepted):
+        return await self.timed("resolve_amendment", language, change, accepted)
+
+
+class BenchmarkBot(LanguageBot.LanguageBot):
+    """
+    LanguageBot with the parts that need a real connection pointed at the fake gateway.
+    Also times each pass of background_tasks.
+    """
+
+    def __init__(self, gateway, storage, shard_name=None):
+        self.gateway = gateway
+        super().__init__(storage=storage, metrics_port=None, shard_name=shard_name)
+        gateway.attach(self)
+
+        self.loop_times = []
+        self.iteration_start = None
+        wait = self.scheduler.wait
+
+        async def timed_wait(timeout):
+            if self.iteration_start is not None:
+                self.loop_times.append(time.perf_counter() - self.iteration_start)
+            await wait(timeout)
+            self.iteration_start = time.perf_counter()
+
+        self.scheduler.wait = timed_wait
+
+    @property
+    def user(self):
+        return self.gateway.bot_user
+
+    def get_channel(self, channel_id):
+        return self.gateway.get_channel(channel_id)
+
+    async def wait_until_ready(self):
+        return
+
+    def is_ready(self):
+        return self.gateway.running
+
+
+async def run_scenarios(bot, gateway, arguments):
+    """
+    Runs every scenario against the bot.
+    :return: A dictionary of command name -> list of on_message latencies, and the total run time.
+    """
+
+    command_times = defaultdict(list)
+    start = time.perf_counter()
+    random = gateway.random
+    users = gateway.create_users(arguments.users)
+    channels = [gateway.create_channel() for _ in range(arguments.languages)]
+    slow_channels = channels[:arguments.slow_channels]
+
+    # N languages.
+    for index, channel in enumerate(channels):
+        command_times["createlanguage"].append(await gateway.send_user_message(channel, users[0], '\\createlanguage "Language ' + str(index) + '"'))
+
+    # A burst of addword commands all at once.
+    async def add_word(index):
+        channel = channels[index % len(channels)]
+        content = '\\addword "word' + str(index) + '" "pron' + str(index % 50) + '" "definition number ' + str(index) + '"'
+        command_times["addword"].append(await gateway.send_user_message(channel, random.choice(users), content))
+
+    await asyncio.gather(*[add_word(index) for index in range(arguments.burst)])
+
+    # M concurrent amendments of mixed types.
+    templates = [
+        ("addrule", '\\addrule "Rule {0}"'),
+        ("editrule", '\\editrule "1" "Edited rule {0}"'),
+        ("changename", '\\changename "Renamed {0}"'),
+        ("addrelatedword", '\\addrelatedword "word{0}" "word{1}"'),
+        ("editword", '\\editword "word{0}" "definition" "New definition {0}"'),
+    ]
+
+    async def propose(index):
+        name, template = templates[index % len(templates)]
+        channel = channels[index % len(channels)]
+        content = template.format(index, index + len(channels))
+        command_times[name].append(await gateway.send_user_message(channel, random.choice(users), content))
+
+    await asyncio.gather(*[propose(index) for index in range(arguments.amendments)])
+
+    # One big word list imported as a single amendment.
+    if arguments.import_words > 0:
+        lines = ["text,pronunciation,definition,related_words"]
+        for index in range(arguments.import_words):
+            lines.append("imported" + str(index) + ",pron" + str(index % 50) + ",imported definition " + str(index) + ",imported" + str(index // 2))
+        attachment = gateway.create_attachment("words.csv", "\n".join(lines).encode("utf-8"))
+        command_times["importwords"].append(await gateway.send_user_message(channels[0], users[0], "\\importwords", [attachment]))
+
+    # Slow channels only get slow once they're set up, so it's the votes that wait on them.
+    for channel in slow_channels:
+        gateway.channel_latency[channel.id] = arguments.slow_latency
+
+    # Everyone votes on everything, mostly yes.
+    reactions = []
+    for message_id, (language, amendment) in list(bot.open_votes.items()):
+        channel = gateway.get_channel(language.channel_id)
+        for user in users:
+            emoji = "✅" if random.random() < 0.7 else "❌"
+            reactions.append(gateway.react(channel, message_id, user, emoji))
+    await asyncio.gather(*reactions)
+
+    # Wait for every vote to end.
+    give_up = time.perf_counter() + LanguageBot.VOTE_DURATION + arguments.timeout
+    while len(bot.open_votes) > 0 and time.perf_counter() < give_up:
+        await asyncio.sleep(0.05)
+
+    return command_times, time.perf_counter() - start
+
+
+def print_report(bot, gateway, storage, command_times, total_time):
+    all_times = [value for values in command_times.values() for value in values]
+    print("Total time: %.2fs" % total_time)
+    print("Languages: %d, words: %d, votes still open: %d" % (len(bot.languages), sum(len(language.words) for language in bot.languages), len(bot.open_votes)))
+
+    print("\nCommand latency (ms)       count     p50     p99     max")
+    for name in sorted(command_times):
+        times = command_times[name]
+        print("  %-22s %7d %7.2f %7.2f %7.2f" % (name, len(times), percentile(times, 50) * 1000, percentile(times, 99) * 1000, max(times) * 1000))
+    print("  %-22s %7d %7.2f %7.2f %7.2f" % ("all", len(all_times), percentile(all_times, 50) * 1000, percentile(all_times, 99) * 1000, max(all_times + [0]) * 1000))
+
+    print("\nbackground_tasks pass (ms) count     p50     p99     max")
+    print("  %-22s %7d %7.2f %7.2f %7.2f" % ("iteration", len(bot.loop_times), percentile(bot.loop_times, 50) * 1000, percentile(bot.loop_times, 99) * 1000, max(bot.loop_times + [0]) * 1000))
+
+    print("\nAPI calls                  count  avg ms  rate limited")
+    for endpoint in sorted(gateway.api_calls):
+        count = gateway.api_calls[endpoint]
+        print("  %-22s %7d %7.2f %7d" % (endpoint, count, gateway.api_time[endpoint] / count * 1000, gateway.rate_limited[endpoint]))
+    print("  %-22s %7d" % ("total", sum(gateway.api_calls.values())))
+
+    print("\nSaving (ms)                count     p50     p99     max")
+    for name in sorted(storage.save_times):
+        times = storage.save_times[name]
+        print("  %-22s %7d %7.2f %7.2f %7.2f" % (name, len(times), percentile(times, 50) * 1000, percentile(times, 99) * 1000, max(times) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test LanguageBot against a fake Discord gateway.")
+    parser.add_argument("--languages", type=int, default=10, help="Languages (channels) to create.")
+    parser.add_argument("--amendments", type=int, default=200, help="Mixed amendments proposed at once.")
+    parser.add_argument("--burst", type=int, default=500, help="addword commands sent at once.")
+    parser.add_argument("--import-words", type=int, default=0, help="Size of a word list imported with importwords.")
+    parser.add_argument("--users", type=int, default=5, help="Users sending commands and voting.")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds each API call takes.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds per API call.")
+    parser.add_argument("--rate-limit", type=int, nargs=2, metavar=("CALLS", "SECONDS"), help="API calls allowed per endpoint and channel.")
+    parser.add_argument("--slow-channels", type=int, default=0, help="Languages whose channel answers slowly while votes end.")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Extra seconds each call to a slow channel takes.")
+    parser.add_argument("--vote-duration", type=float, default=2.0, help="Seconds each vote lasts.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Extra seconds to wait for votes to finish.")
+    parser.add_argument("--storage", choices=("sqlite", "pickle"), default="sqlite")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    LanguageBot.VOTE_DURATION = arguments.vote_duration
+    gateway = FakeGateway(latency=arguments.latency, jitter=arguments.jitter, rate_limit=arguments.rate_limit, seed=arguments.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if arguments.storage == "sqlite":
+            storage = TimedStorage(LanguageBot.SQLiteStorage(os.path.join(directory, "languages.db")))
+        else:
+            storage = TimedStorage(LanguageBot.PickleStorage(os.path.join(directory, "languages.cam"), os.path.join(directory, "languages.journal")))
+
+        bot = BenchmarkBot(gateway, storage)
+        loop = asyncio.get_event_loop()
+        command_times, total_time = loop.run_until_complete(run_scenarios(bot, gateway, arguments))
+
+        gateway.running = False
+        bot.scheduler.wake_event.set()
+        loop.run_until_complete(asyncio.wait_for(bot.run_task, 10))
+        bot.edit_task.cancel()
+        loop.run_until_complete(storage.close())
+
+    print_report(bot, gateway, storage, command_times, total_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Times looking up a word by its text (Language.get_word) and a language by its channel
+# (LanguageBot.get_language_from_channel) as the number of words and languages grows.
+# Both are dictionary lookups, so the time per lookup should stay flat. The linear scans
+# they replaced are timed alongside them.
+# Run from the repository root (discord.py still has to be installed):
+#     python Benchmarks/LookupBenchmark.py --words 1000 10000 100000 1000000
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Module"))
+
+import LanguageBot
+from FakeDiscord import FakeGateway
+from LoadTest import BenchmarkBot
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+FIRST_CHANNEL_ID = 5000
+
+
+async def old_get_word(words, text):
+    """
+    How Language.get_word used to find a word: a scan over every word.
+    """
+
+    for word in words:
+        if word.text == text:
+            return word
+    return None
+
+
+async def old_get_language_from_channel(languages, channel_id):
+    """
+    How LanguageBot.get_language_from_channel used to find a language: a scan over every language.
+    """
+
+    for language in languages:
+        if language.channel_id == channel_id:
+            return language
+    return None
+
+
+async def time_lookups(lookup, keys, budget):
+    """
+    Looks up each key in turn, as many times as fit in the time budget.
+    :return: The average seconds per lookup.
+    """
+
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for key in keys:
+            await lookup(key)
+        count += len(keys)
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / count
+
+
+def format_time(seconds):
+    return "%.2f us" % (seconds * 1e6) if seconds < 1e-3 else "%.2f ms" % (seconds * 1e3)
+
+
+async def benchmark_words(arguments):
+    print("%-10s %14s %14s %14s" % ("words", "get_word", "miss", "old scan"))
+    generator = random.Random(arguments.seed)
+    for count in arguments.words:
+        language = LanguageBot.Language("Benchmark")
+        for index in range(count):
+            text = "".join(generator.choice(LETTERS) for _ in range(6)) + str(index)
+            await language.add_word(LanguageBot.Word(text, "/" + text + "/", "definition number " + str(index)))
+
+        texts = [word.text for word in generator.sample(list(language.words.values()), min(count, 1000))]
+        missing = [text + "?" for text in texts]
+        found = await time_lookups(language.get_word, texts, arguments.budget)
+        missed = await time_lookups(language.get_word, missing, arguments.budget)
+        old = "-"
+        if count <= arguments.old_up_to:
+            words = list(language.words.values())
+            old = format_time(await time_lookups(lambda text: old_get_word(words, text), texts[:20], arguments.budget))
+        print("%-10d %14s %14s %14s" % (count, format_time(found), format_time(missed), old))
+
+
+async def benchmark_languages(bot, arguments):
+    print("%-10s %14s %14s" % ("languages", "by channel", "old scan"))
+    for count in arguments.languages:
+        while len(bot.languages) < count:
+            language = LanguageBot.Language("Language " + str(len(bot.languages)))
+            language.channel_id = FIRST_CHANNEL_ID + len(bot.languages)
+            bot.languages.append(language)
+            bot.language_index[language.channel_id] = language
+            bot.language_channels.add(language.channel_id)
+
+        channel_ids = [FIRST_CHANNEL_ID + index for index in random.Random(arguments.seed).sample(range(count), min(count, 1000))]
+        found = await time_lookups(bot.get_language_from_channel, channel_ids, arguments.budget)
+        old = await time_lookups(lambda channel_id: old_get_language_from_channel(bot.languages, channel_id), channel_ids[:20], arguments.budget)
+        print("%-10d %14s %14s" % (count, format_time(found), format_time(old)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time word and language lookups as they grow.")
+    parser.add_argument("--words", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="Words in the language, one run each.")
+    parser.add_argument("--languages", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Languages loaded, one run each.")
+    parser.add_argument("--old-up-to", type=int, default=100000, help="Most words to time the old scan with.")
+    parser.add_argument("--budget", type=float, default=0.5, help="Seconds to spend timing each kind of lookup.")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        gateway = FakeGateway(latency=0.0)
+        bot = BenchmarkBot(gateway, LanguageBot.SQLiteStorage(os.path.join(directory, "languages.db")))
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(benchmark_words(arguments))
+        loop.run_until_complete(benchmark_languages(bot, arguments))
+
+        gateway.running = False
+        bot.scheduler.wake_event.set()
+        loop.run_until_complete(asyncio.wait_for(bot.run_task, 10))
+        bot.edit_task.cancel()
+        loop.run_until_complete(bot.storage.close())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Measures how much memory a language with a lot of words takes up, with the slotted
+# Word (pronunciations interned) against the plain Word it replaced (an instance
+# dictionary per word, every pronunciation its own string). Each kind is built in a
+# fresh process so they can't share memory, and the resident size is compared from
+# just before the words are made to just after.
+# Run from the repository root (discord.py still has to be installed):
+#     python Benchmarks/MemoryBenchmark.py --words 1000000
+import argparse
+import asyncio
+import gc
+import os
+import random
+import resource
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Module"))
+
+import LanguageBot
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+class PlainWord:
+    """
+    The Word class as it was before it had __slots__.
+    """
+
+    def __init__(self, text, pronunciation, definition):
+        self.text = text
+        self.pronunciation = pronunciation
+        self.definition = definition
+        self.id = None
+
+
+WORD_CLASSES = {"plain": PlainWord, "slotted": LanguageBot.Word}
+
+
+def get_resident_size():
+    """
+    :return: The process's resident size in bytes. Where /proc isn't there, its peak instead.
+    """
+
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # Linux gives kilobytes, macOS bytes.
+
+
+async def build_language(word_class, count, pronunciations, seed):
+    """
+    Adds made up words to a new language. Pronunciations come from a small set, like real
+    ones, but each is built up afresh, as if it was read from a message or a file.
+    :return: The language.
+    """
+
+    generator = random.Random(seed)
+    syllables = ["".join(generator.choice(LETTERS) for _ in range(3)) for _ in range(pronunciations)]
+    language = LanguageBot.Language("Benchmark")
+    for index in range(count):
+        text = "".join(generator.choice(LETTERS) for _ in range(6)) + str(index)
+        pronunciation = "/" + generator.choice(syllables) + "/"
+        await language.add_word(word_class(text, pronunciation, "definition number " + str(index)))
+    return language
+
+
+def measure(word_class_name, count, pronunciations, seed):
+    """
+    Builds a language in this process.
+    :return: How many bytes the resident size went up by.
+    """
+
+    gc.collect()
+    before = get_resident_size()
+    language = asyncio.get_event_loop().run_until_complete(build_language(WORD_CLASSES[word_class_name], count, pronunciations, seed))
+    gc.collect()
+    after = get_resident_size()
+    assert len(language.words) == count
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory used by plain and slotted words.")
+    parser.add_argument("--words", type=int, default=1000000, help="Words in the language.")
+    parser.add_argument("--pronunciations", type=int, default=5000, help="Different pronunciations the words share.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--word-class", choices=sorted(WORD_CLASSES), help="Only measure this one, in this process. Used by the parent run.")
+    arguments = parser.parse_args()
+
+    if arguments.word_class is not None:
+        print(measure(arguments.word_class, arguments.words, arguments.pronunciations, arguments.seed))
+        return
+
+    sizes = {}
+    for name in ("plain", "slotted"):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--word-class", name, "--words", str(arguments.words),
+                                 "--pronunciations", str(arguments.pronunciations), "--seed", str(arguments.seed)],
+                                stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+        sizes[name] = int(output.split()[-1])
+        print("%-8s %8.1f MB  %6.1f bytes per word" % (name, sizes[name] / 2 ** 20, sizes[name] / arguments.words))
+    print("Slotted words use %.0f%% less" % (100.0 * (1 - sizes["slotted"] / sizes["plain"])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Times get_command_list on huge, badly formed commands, at doubling sizes from 100 KB.
+# The time per KB should stay about the same as the size goes up (one pass over the
+# string). The parser it replaced, which sliced the rest of the string after every
+# parameter, is timed alongside it on the smaller sizes for comparison.
+# Run from the repository root (discord.py still has to be installed):
+#     python Benchmarks/ParserBenchmark.py --sizes 100000 200000 400000 800000
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Module"))
+
+import LanguageBot
+
+
+def old_get_command_list(full_command):
+    """
+    The parser get_command_list replaced, without its print.
+    """
+
+    original_command = full_command
+    first_command_index = original_command.find('\"')
+    if first_command_index == -1:
+        return [full_command]
+    command_list = [original_command[:first_command_index].replace(' ', '')]
+    original_command = original_command[first_command_index:]
+    while len(original_command) > 0:
+        check_same = original_command
+        command_list.append(original_command[1:original_command.find('\"', 1)])
+        original_command = original_command[original_command.find('\"', 1) + 1:]
+        original_command = original_command[original_command.find('\"'):]
+        if check_same == original_command:
+            return None
+    return command_list
+
+
+# Name -> function making a command of about the given number of characters.
+INPUTS = {
+    "one long parameter": lambda size: 'addword "' + "a" * size + '"',
+    "many empty parameters": lambda size: "addword " + '"" ' * (size // 3),
+    "many short parameters": lambda size: "addword " + '"ab" ' * (size // 5),
+    "escaped quotes": lambda size: 'addword "' + '\\"' * (size // 2) + '"',
+    "escaped backslashes": lambda size: 'addword "' + "\\\\" * (size // 2) + '"',
+    "lone backslashes": lambda size: 'addword "' + "a\\" * (size // 2) + '"',
+    "spaces between": lambda size: 'addword "a"' + " " * size + '"b"',
+    "unclosed quote": lambda size: 'addword "a" "' + "b" * size,
+    "unclosed after escapes": lambda size: 'addword "' + '\\"' * (size // 2),
+    "many unclosed quotes": lambda size: "addword " + ' "' * (size // 2),
+}
+
+
+def time_parse(parse, command, repeat):
+    """
+    :return: The fastest of a few runs, in seconds.
+    """
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            parse(command)
+        except LanguageBot.CommandParseError:
+            pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the command parser on huge, badly formed commands.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 200000, 400000, 800000], help="Command sizes in characters.")
+    parser.add_argument("--old-up-to", type=int, default=200000, help="Biggest size to time the old parser on, since it's quadratic.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each, keeping the fastest.")
+    arguments = parser.parse_args()
+
+    print("%-22s %8s %10s %10s %12s" % ("input", "KB", "ms", "us per KB", "old ms"))
+    for name, make_command in INPUTS.items():
+        for size in arguments.sizes:
+            command = make_command(size)
+            elapsed = time_parse(LanguageBot.get_command_list, command, arguments.repeat)
+            old = "-"
+            if size <= arguments.old_up_to:
+                old = "%.1f" % (time_parse(old_get_command_list, command, 1) * 1000)
+            print("%-22s %8.0f %10.1f %10.1f %12s" % (name, len(command) / 1000, elapsed * 1000, elapsed * 1e6 / (len(command) / 1000), old))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Times Language.search on a large made up dictionary: how long the first search takes
+# (that's when the index gets built), how long the event loop is held up while it
+# happens, and then each kind of query on its own.
+# Run from the repository root (discord.py still has to be installed):
+#     python Benchmarks/SearchBenchmark.py --words 100000
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Module"))
+
+import LanguageBot
+from LoadTest import percentile
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+# Definitions are mostly made of a few very common words, like real ones, so the
+# common tokens each show up in a good part of the dictionary.
+COMMON_WORDS = ["a", "the", "of", "to", "and", "or", "in", "that", "is", "for", "something", "thing", "person", "used"]
+
+
+def make_text(generator, index):
+    return "".join(generator.choice(LETTERS) for _ in range(generator.randint(3, 8))) + str(index)
+
+
+def make_words(count, seed):
+    """
+    :return: A list of (text, pronunciation, definition, related word texts), and the list of rare definition words used.
+    """
+
+    generator = random.Random(seed)
+    rare_words = ["".join(generator.choice(LETTERS) for _ in range(7)) for _ in range(count // 20 + 1)]
+    rows = []
+    for index in range(count):
+        text = make_text(generator, index)
+        definition = " ".join(generator.sample(COMMON_WORDS, 4) + [generator.choice(rare_words)])
+        rows.append((text, text.upper(), definition, []))
+    return rows, rare_words
+
+
+def make_typo(generator, text):
+    position = generator.randrange(len(text))
+    return text[:position] + generator.choice(LETTERS) + text[position + 1:]
+
+
+async def time_loop_stall(work):
+    """
+    Runs work while a ticker checks how often the event loop gets to run.
+    :return: The work's result, how long it took, and the longest the loop went without running.
+    """
+
+    stalls = [0.0]
+    done = asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stalls[0] = max(stalls[0], now - last)
+            last = now
+
+    ticker_task = asyncio.get_event_loop().create_task(ticker())
+    await asyncio.sleep(0)  # Lets the ticker start before the work does.
+    start = time.perf_counter()
+    result = await work
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker_task
+    return result, elapsed, stalls[0]
+
+
+async def run(arguments):
+    generator = random.Random(arguments.seed)
+    rows, rare_words = make_words(arguments.words, arguments.seed)
+    language = LanguageBot.Language("Benchmark")
+    start = time.perf_counter()
+    await language.add_words(rows)
+    print("Added %d words in %.2fs" % (len(rows), time.perf_counter() - start))
+
+    _, elapsed, stall = await time_loop_stall(language.search(rows[0][0]))
+    print("First search (builds the index): %.3fs, longest the event loop was held up: %.3fs" % (elapsed, stall))
+
+    texts = [row[0] for row in rows]
+    queries = {
+        "exact": lambda: generator.choice(texts),
+        "prefix": lambda: generator.choice(texts)[:3],
+        "substring": lambda: generator.choice(texts)[1:5],
+        "typo": lambda: make_typo(generator, generator.choice(texts)),
+        "rare definition": lambda: generator.choice(rare_words),
+        "common definition": lambda: " ".join(generator.sample(COMMON_WORDS, 2)),
+        "mixed definition": lambda: generator.choice(COMMON_WORDS) + " " + generator.choice(rare_words),
+    }
+    print("%-18s %10s %10s %10s" % ("query", "p50 ms", "p99 ms", "max ms"))
+    for name, make_query in queries.items():
+        times = []
+        for _ in range(arguments.queries):
+            query = make_query()
+            start = time.perf_counter()
+            await language.search(query)
+            times.append(time.perf_counter() - start)
+        print("%-18s %10.2f %10.2f %10.2f" % (name, percentile(times, 50) * 1000, percentile(times, 99) * 1000, max(times) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time searches on a large dictionary.")
+    parser.add_argument("--words", type=int, default=100000, help="Words in the dictionary.")
+    parser.add_argument("--queries", type=int, default=200, help="Searches of each kind to time.")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(run(arguments))
+
+
+if __name__ == "__main__":
+    main()
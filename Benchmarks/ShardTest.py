@@ -0,0 +1,222 @@
+# Runs LanguageBot as several processes sharing one database, with the coordinator from
+# Sharding.py handing out the languages, then kills one of them while votes are open to
+# check that another process takes its languages over and finishes the votes. Processes
+# can also be started while the votes are open, so languages get handed over live.
+# Every process gets its own FakeDiscord gateway and is sent every event, like real
+# gateway connections; the bot's messages and reactions are shared between them.
+# Run from the repository root (discord.py still has to be installed):
+#     python Benchmarks/ShardTest.py --workers 3 --languages 12 --amendments 60
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Module"))
+
+import LanguageBot
+from FakeDiscord import FakeGateway, FakeUser, RawReactionEvent
+from LoadTest import BenchmarkBot
+from Sharding import ShardCoordinator
+
+BOT_USER_ID = 1  # Same in every process, like the real bot's account.
+FIRST_CHANNEL_ID = 5000
+FIRST_USER_ID = 9000
+WORKER_ID_RANGE = 10 ** 9  # Each process's gateway makes its message ids in its own range.
+
+
+def run_coordinator(path, partition_count, worker_timeout, interval):
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    coordinator = ShardCoordinator(path, partition_count, worker_timeout, interval)
+    asyncio.get_event_loop().run_until_complete(coordinator.run())
+
+
+def run_worker(name, index, settings, events, shared_messages, shared_reactions):
+    """
+    One bot process. Takes events from the driver until it's told to stop.
+    """
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    LanguageBot.VOTE_DURATION = settings["vote_duration"]
+    gateway = FakeGateway(latency=settings["latency"], seed=index, first_id=(index + 1) * WORKER_ID_RANGE, bot_user_id=BOT_USER_ID,
+                          shared_messages=shared_messages, shared_reactions=shared_reactions)
+    bot = BenchmarkBot(gateway, LanguageBot.SQLiteStorage(settings["db"]), shard_name=name)
+    bot.membership.heartbeat_interval = settings["heartbeat"]
+    asyncio.get_event_loop().run_until_complete(handle_events(bot, gateway, events))
+
+
+async def handle_events(bot, gateway, events):
+    loop = asyncio.get_event_loop()
+    users = {}
+    tasks = []
+    while True:
+        event = await loop.run_in_executor(None, events.get)
+        if event[0] == "stop":
+            break
+        elif event[0] == "channel":  # Channels made before this process started, which Discord would send on connecting.
+            gateway.create_channel(channel_id=event[1])
+        elif event[0] == "message":
+            _, channel_id, user_id, content = event
+            channel = gateway.get_channel(channel_id) or gateway.create_channel(channel_id=channel_id)
+            if user_id not in users:
+                users[user_id] = FakeUser(gateway, user_id, "user" + str(user_id))
+            tasks.append(loop.create_task(gateway.send_user_message(channel, users[user_id], content)))
+        elif event[0] == "react":
+            _, channel_id, message_id, user_id, emoji = event
+            tasks.append(loop.create_task(bot.on_raw_reaction_add(RawReactionEvent(message_id, channel_id, user_id, emoji))))
+
+    await asyncio.gather(*tasks)
+    gateway.running = False
+    bot.scheduler.wake_event.set()
+    await asyncio.wait_for(bot.run_task, 10)
+    bot.edit_task.cancel()
+    bot.membership_task.cancel()
+    await bot.membership.leave()
+    await bot.storage.close()
+
+
+def query(connection, sql, *args):
+    """
+    :return: The query's rows, or an empty list if the tables aren't made yet.
+    """
+
+    try:
+        return connection.execute(sql, args).fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+
+def wait_for(condition, timeout, interval=0.05):
+    """
+    :return: Whether the condition came true before the timeout.
+    """
+
+    give_up = time.perf_counter() + timeout
+    while time.perf_counter() < give_up:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run LanguageBot as several processes and kill one part way through.")
+    parser.add_argument("--workers", type=int, default=3, help="Bot processes to run.")
+    parser.add_argument("--late-workers", type=int, default=0, help="Bot processes started once the votes are open.")
+    parser.add_argument("--partitions", type=int, default=16, help="Partitions to split the languages into.")
+    parser.add_argument("--languages", type=int, default=12, help="Languages (channels) to create.")
+    parser.add_argument("--amendments", type=int, default=60, help="addword amendments proposed, spread over the languages.")
+    parser.add_argument("--users", type=int, default=5, help="Users voting on every amendment.")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds each API call takes.")
+    parser.add_argument("--vote-duration", type=float, default=6.0, help="Seconds each vote lasts.")
+    parser.add_argument("--heartbeat", type=float, default=0.5, help="Seconds between heartbeats and rebalances.")
+    parser.add_argument("--worker-timeout", type=float, default=2.0, help="Seconds without a heartbeat before a process counts as dead.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for each step.")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    generator = random.Random(arguments.seed)
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    shared_messages = manager.dict()
+    shared_reactions = manager.dict()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "languages.db")
+        settings = {"db": path, "latency": arguments.latency, "vote_duration": arguments.vote_duration, "heartbeat": arguments.heartbeat}
+        coordinator = context.Process(target=run_coordinator, args=(path, arguments.partitions, arguments.worker_timeout, arguments.heartbeat), daemon=True)
+        coordinator.start()
+        workers = {}  # Name -> (process, event queue)
+
+        channel_ids = [FIRST_CHANNEL_ID + index for index in range(arguments.languages)]
+        user_ids = [FIRST_USER_ID + index for index in range(arguments.users)]
+
+        def start_worker(index):
+            name = "worker" + str(index)
+            events = context.Queue()
+            for channel_id in channel_ids:
+                events.put(("channel", channel_id))
+            workers[name] = (context.Process(target=run_worker, args=(name, index, settings, events, shared_messages, shared_reactions)), events)
+            workers[name][0].start()
+
+        for index in range(arguments.workers):
+            start_worker(index)
+
+        def broadcast(event):
+            for process, events in workers.values():
+                if process.is_alive():
+                    events.put(event)
+
+        connection = sqlite3.connect(path, timeout=30.0)
+        count = lambda sql: (query(connection, sql) or [(0,)])[0][0]
+
+        def owners():
+            return dict(query(connection, "SELECT partition, owner FROM shard_partitions"))
+
+        ok = wait_for(lambda: sum(owner is not None for owner in owners().values()) == arguments.partitions
+                      and len(set(owners().values())) == arguments.workers, arguments.timeout)
+        print("Partitions handed out: " + str(ok))
+        start = time.perf_counter()
+
+        for index, channel_id in enumerate(channel_ids):
+            broadcast(("message", channel_id, user_ids[0], '\\createlanguage "Language ' + str(index) + '"'))
+        ok = wait_for(lambda: count("SELECT COUNT(*) FROM languages") == arguments.languages, arguments.timeout) and ok
+
+        for index in range(arguments.amendments):
+            content = '\\addword "word' + str(index) + '" "pron' + str(index) + '" "definition number ' + str(index) + '"'
+            broadcast(("message", channel_ids[index % len(channel_ids)], generator.choice(user_ids), content))
+        ok = wait_for(lambda: count("SELECT COUNT(*) FROM amendments") == arguments.amendments, arguments.timeout) and ok
+
+        # New processes only get their languages once the old owners have saved and let go of them.
+        if arguments.late_workers > 0:
+            for index in range(arguments.workers, arguments.workers + arguments.late_workers):
+                start_worker(index)
+            ok = wait_for(lambda: len(set(owners().values())) == len(workers) and None not in owners().values(), arguments.timeout) and ok
+            print("Partitions handed over to the new processes: " + str(ok))
+
+        # The process with the most languages is the one that dies.
+        partition_owners = owners()
+        languages_per_worker = dict((name, 0) for name in workers)
+        for channel_id in channel_ids:
+            languages_per_worker[partition_owners[channel_id % arguments.partitions]] += 1
+        victim = max(sorted(languages_per_worker), key=lambda name: languages_per_worker[name])
+        print("Languages per process: " + str(languages_per_worker))
+
+        # Everyone votes yes on everything, then the victim is killed before any vote ends.
+        for message_id, channel_id in query(connection, "SELECT voting_message_id, channel_id FROM amendments"):
+            for user_id in user_ids:
+                shared_reactions[(message_id, user_id, "✅")] = True
+                broadcast(("react", channel_id, message_id, user_id, "✅"))
+        workers[victim][0].kill()
+        killed_at = time.perf_counter()
+        print("Killed " + victim + " with " + str(count("SELECT COUNT(*) FROM amendments")) + " votes open")
+
+        taken_over = wait_for(lambda: victim not in owners().values() and None not in owners().values(), arguments.timeout)
+        takeover_time = time.perf_counter() - killed_at
+        finished = wait_for(lambda: count("SELECT COUNT(*) FROM amendments") == 0, arguments.vote_duration + arguments.timeout)
+        total_time = time.perf_counter() - start
+
+        open_votes = count("SELECT COUNT(*) FROM amendments")
+        words = count("SELECT COUNT(*) FROM words")
+        print("Partitions taken over: %s in %.2fs" % (taken_over, takeover_time))
+        print("Total time: %.2fs" % total_time)
+        print("Words: %d of %d, votes still open: %d" % (words, arguments.amendments, open_votes))
+
+        broadcast(("stop",))
+        for name, (process, events) in workers.items():
+            process.join(30)
+        coordinator.terminate()
+        connection.close()
+    manager.shutdown()
+
+    passed = ok and taken_over and finished and words == arguments.amendments
+    print("PASSED" if passed else "FAILED")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Finds words that are probably the same as one already in a language: spelled the same
+# apart from case, accents, punctuation and doubled letters, or pronounced the same.
+# Each word's keys are worked out once when it's added and kept in dictionaries, so
+# checking a new word is a couple of lookups, not a pass over the whole dictionary.
+import unicodedata
+
+
+# Consonants that sound alike share a code, like Soundex. Vowels are kept, since made up
+# words are often short and only differ in them.
+SOUND_CODES = {}
+for letters, code in (("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6")):
+    for letter in letters:
+        SOUND_CODES[letter] = code
+VOWELS = {"a": "a", "e": "e", "i": "i", "o": "o", "u": "u", "y": "i"}
+DIGRAPHS = (("ph", "f"), ("ck", "k"), ("qu", "kw"))
+
+
+def strip_accents(text):
+    return "".join(character for character in unicodedata.normalize("NFKD", text) if not unicodedata.combining(character))
+
+
+def collapse_repeats(characters):
+    return "".join(character for index, character in enumerate(characters) if index == 0 or character != characters[index - 1])
+
+
+def normalize_spelling(text):
+    """
+    :param text: A word's text.
+    :return: The text lowercased, without accents, spaces or punctuation, and with doubled letters made single.
+    """
+
+    return collapse_repeats([character for character in strip_accents(text).casefold() if character.isalnum()])
+
+
+def get_phonetic_key(pronunciation):
+    """
+    :param pronunciation: A word's pronunciation.
+    :return: A key that pronunciations which sound alike share, or "" if there are no letters in it.
+    """
+
+    text = "".join(character for character in strip_accents(pronunciation).casefold() if character.isalpha())
+    for digraph, replacement in DIGRAPHS:
+        text = text.replace(digraph, replacement)
+    return collapse_repeats([SOUND_CODES.get(letter) or VOWELS.get(letter, "") for letter in text if letter in SOUND_CODES or letter in VOWELS])
+
+
+def get_keys(text, pronunciation):
+    """
+    :return: The normalised spelling and phonetic key of a word.
+    """
+
+    return normalize_spelling(text), get_phonetic_key(pronunciation)
+
+
+def get_keys_for_words(words):
+    """
+    Works out the keys for a batch of words. Safe to run off the event loop.
+    :param words: A list of (text, pronunciation).
+    :return: A list of (normalised spelling, phonetic key), in the same order.
+    """
+
+    return [get_keys(text, pronunciation) for text, pronunciation in words]
+
+
+class DuplicateIndex:
+    """
+    DuplicateIndex
+
+    Every word's normalised spelling and phonetic key, for finding near duplicates.
+    Only deals with texts, so the language maps them back to its words.
+    """
+
+    def __init__(self):
+        self.spellings = {}  # Normalised spelling -> set of word texts
+        self.sounds = {}  # Phonetic key -> set of word texts
+
+    def add(self, text, pronunciation, keys=None):
+        spelling, sound = get_keys(text, pronunciation) if keys is None else keys
+        self.spellings.setdefault(spelling, set()).add(text)
+        if sound != "":
+            self.sounds.setdefault(sound, set()).add(text)
+
+    def remove(self, text, pronunciation):
+        for index, key in zip((self.spellings, self.sounds), get_keys(text, pronunciation)):
+            texts = index.get(key)
+            if texts is not None:
+                texts.discard(text)
+                if len(texts) == 0:
+                    del index[key]
+
+    def find_similar(self, text, pronunciation, limit=5, keys=None):
+        """
+        :param text: The text of a new word.
+        :param pronunciation: Its pronunciation.
+        :param limit: Most words to return.
+        :param keys: The word's keys from get_keys, if they were already worked out.
+        :return: A list of (text, how it's similar) for words that are spelled or sound the same, spelled alike first.
+                 The word's own text is left out.
+        """
+
+        similar = []
+        seen = {text}
+        spelling, sound = get_keys(text, pronunciation) if keys is None else keys
+        for reason, texts in (("spelled alike", self.spellings.get(spelling, ())),
+                              ("sounds alike", self.sounds.get(sound, ()) if sound != "" else ())):
+            for similar_text in texts:
+                if len(similar) >= limit:
+                    return similar
+                if similar_text not in seen:
+                    seen.add(similar_text)
+                    similar.append((similar_text, reason))
+        return similar
@@ -0,0 +1,206 @@
+# Queue for the edits the bot makes to its own messages (vote countdowns, the rules message).
+# Discord rate limits message edits per channel, and most countdown ticks don't change
+# what's shown anyway, so edits are collected here, deduplicated and sent at a steady rate.
+# Each channel's edits go out on their own task, so a slow channel only holds up itself.
+import asyncio
+import math
+import time
+
+
+class ChannelBudget:
+    """
+    ChannelBudget
+
+    Token bucket for how many edits a channel is allowed to get.
+    """
+
+    def __init__(self, edits_per_period, period):
+        self.capacity = edits_per_period
+        self.period = period
+        self.tokens = float(edits_per_period)
+        self.last_refill = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.capacity / self.period)
+        self.last_refill = now
+
+    def try_spend(self):
+        """
+        :return: True if there was an edit left to spend, False if the channel has to wait.
+        """
+
+        self.refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def time_until_available(self):
+        """
+        :return: Seconds until the channel can be edited again.
+        """
+
+        self.refill()
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) * self.period / self.capacity
+
+
+class MessageEditQueue:
+    """
+    MessageEditQueue
+
+    Holds at most one pending edit per message (the newest one wins), skips
+    edits that wouldn't change what the message says, and sends them without
+    going over each channel's budget.
+
+    The client only needs get_channel(channel_id), returning something with
+    get_partial_message(message_id), returning something with an async edit(content=...).
+    That's a discord.Client, or a fake that records the calls.
+    """
+
+    def __init__(self, client, edits_per_period=5, period=5.0, latency_histogram=None, timeout=None):
+        self.client = client
+        self.latency_histogram = latency_histogram  # Optional Metrics.Histogram to time each edit with.
+        self.timeout = timeout  # Seconds to wait on an edit before giving up on it. None to wait as long as it takes.
+        self.edits_per_period = edits_per_period  # Edits each channel is allowed every period.
+        self.period = period
+        self.pending = {}  # Message id -> (channel id, content). Oldest requests first.
+        self.last_content = {}  # Message id -> content the message was last edited to.
+        self.budgets = {}  # Channel id -> ChannelBudget
+        self.senders = {}  # Channel id -> task sending that channel's edits.
+        self.wake_event = asyncio.Event()
+        self.edit_count = 0
+
+    def get_budget(self, channel_id):
+        budget = self.budgets.get(channel_id)
+        if budget is None:
+            budget = ChannelBudget(self.edits_per_period, self.period)
+            self.budgets[channel_id] = budget
+        return budget
+
+    def countdown_granularity(self, open_messages, base_granularity):
+        """
+        Works out how coarse a channel's countdowns have to be so that updating all of
+        them fits in the channel's budget.
+        :param open_messages: How many countdowns are showing in the channel.
+        :param base_granularity: The finest granularity wanted, in seconds.
+        :return: Granularity in seconds, a multiple of base_granularity.
+        """
+
+        needed = open_messages * self.period / self.edits_per_period
+        return base_granularity * max(1, math.ceil(needed / base_granularity))
+
+    async def request(self, channel_id, message_id, content):
+        """
+        Asks for a message to be edited. Replaces any edit still waiting for the same message.
+        :param channel_id: The channel the message is in.
+        :param message_id: The message to edit.
+        :param content: What the message should say.
+        :return: nothing.
+        """
+
+        if message_id not in self.pending and self.last_content.get(message_id) == content:
+            return  # Already says that.
+        self.pending[message_id] = (channel_id, content)
+        self.wake_event.set()
+
+    async def remember(self, message_id, content):
+        """
+        Records what a message already says (like when the bot just sent it), so
+        requests for the same text are skipped.
+        :param message_id: The message.
+        :param content: What it says.
+        :return: nothing.
+        """
+
+        self.last_content[message_id] = content
+
+    async def forget(self, message_id):
+        """
+        Drops everything known about a message, for when it gets deleted.
+        :param message_id: The message.
+        :return: nothing.
+        """
+
+        self.pending.pop(message_id, None)
+        self.last_content.pop(message_id, None)
+
+    async def send_edit(self, channel_id, message_id, content):
+        channel = self.client.get_channel(channel_id)
+        if channel is None:
+            return
+        try:
+            if self.latency_histogram is None:
+                await asyncio.wait_for(channel.get_partial_message(message_id).edit(content=content), self.timeout)
+            else:
+                with self.latency_histogram.time(endpoint="edit_message"):
+                    await asyncio.wait_for(channel.get_partial_message(message_id).edit(content=content), self.timeout)
+            self.last_content[message_id] = content
+            self.edit_count += 1
+        except Exception as error:  # A deleted message or a failed request shouldn't stop the other edits.
+            print("Error editing message " + str(message_id) + ": " + repr(error))
+
+    async def process(self):
+        """
+        Starts sending the pending edits of every channel that has budget left and isn't already being sent to.
+        :return: Seconds until a channel that is out of budget can be edited again, or None if nothing is waiting on that.
+        """
+
+        waiting = {}  # Channel id -> its pending message ids, oldest first.
+        for message_id, (channel_id, content) in list(self.pending.items()):
+            if content == self.last_content.get(message_id):
+                del self.pending[message_id]
+            elif channel_id not in self.senders:  # A channel being sent to gets looked at again when that's done.
+                waiting.setdefault(channel_id, []).append(message_id)
+
+        wait_time = None
+        for channel_id, message_ids in waiting.items():
+            channel_wait = self.get_budget(channel_id).time_until_available()
+            if channel_wait == 0.0:
+                self.senders[channel_id] = asyncio.get_event_loop().create_task(self.send_channel_edits(channel_id, message_ids))
+            elif wait_time is None or channel_wait < wait_time:
+                wait_time = channel_wait
+        return wait_time
+
+    async def send_channel_edits(self, channel_id, message_ids):
+        """
+        Sends a channel's edits one after another, for as long as its budget lasts.
+        :param channel_id: The channel.
+        :param message_ids: The messages in it with pending edits, oldest first.
+        :return: nothing.
+        """
+
+        budget = self.get_budget(channel_id)
+        try:
+            for message_id in message_ids:
+                edit = self.pending.get(message_id)
+                if edit is None or edit[0] != channel_id:
+                    continue  # Forgotten while the earlier edits were being sent.
+                if edit[1] != self.last_content.get(message_id):
+                    if not budget.try_spend():
+                        break
+                    await self.send_edit(channel_id, message_id, edit[1])
+                if self.pending.get(message_id) == edit:  # Unless it was replaced while being sent.
+                    del self.pending[message_id]
+        finally:
+            del self.senders[channel_id]
+            self.wake_event.set()  # For edits requested meanwhile, and whatever the budget ran out on.
+
+    async def run(self):
+        """
+        Keeps sending edits as they come in, for as long as the bot is running.
+        :return: nothing.
+        """
+
+        while True:
+            self.wake_event.clear()
+            wait_time = await self.process()
+            if wait_time is None:
+                await self.wake_event.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self.wake_event.wait(), wait_time)
+                except asyncio.TimeoutError:
+                    pass
@@ -0,0 +1,87 @@
+# Builds downloadable dictionaries of a language in a few formats.
+# Everything is written to memory in chunks, never to a shared file on disk,
+# so it can run off the event loop and two people can ask at the same time.
+import csv
+import gzip
+import io
+import json
+
+
+COMPRESS_THRESHOLD = 1024 * 1024  # Exports bigger than this (in bytes) are gzipped.
+
+
+def render_text(name, rules, rows):
+    yield name + "\nRules:\n"
+    for index, rule in enumerate(rules):
+        yield str(index + 1) + ": " + rule + "\n"
+    yield "--------------------------\nWords:\n"
+    for text, pronunciation, definition, related_texts in rows:
+        yield text + "\nPronunciation: " + pronunciation + "\nDefinition: " + definition + "\nRelated Words: "
+        for related_text in related_texts:
+            yield related_text + ", "
+        yield "\n\n"
+
+
+def render_csv(name, rules, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["text", "pronunciation", "definition", "related_words"])
+    for text, pronunciation, definition, related_texts in rows:
+        writer.writerow([text, pronunciation, definition, "; ".join(related_texts)])
+        if buffer.tell() > 65536:  # Hand over the rows in chunks instead of one giant string.
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_json(name, rules, rows):
+    yield '{"name": ' + json.dumps(name) + ', "rules": ' + json.dumps(rules) + ', "words": ['
+    for index, (text, pronunciation, definition, related_texts) in enumerate(rows):
+        if index > 0:
+            yield ", "
+        yield json.dumps({"text": text, "pronunciation": pronunciation, "definition": definition, "related_words": related_texts})
+    yield "]}\n"
+
+
+def render_markdown(name, rules, rows):
+    yield "# " + name + "\n\n## Rules\n\n"
+    for index, rule in enumerate(rules):
+        yield str(index + 1) + ". " + rule + "\n"
+    yield "\n## Words\n"
+    for text, pronunciation, definition, related_texts in rows:
+        yield "\n### " + text + "\n\n*Pronunciation:* " + pronunciation + "\n\n" + definition + "\n"
+        if len(related_texts) > 0:
+            yield "\n*Related words:* " + ", ".join(related_texts) + "\n"
+
+
+# Format name -> (file extension, renderer)
+EXPORT_FORMATS = {
+    "text": ("txt", render_text),
+    "csv": ("csv", render_csv),
+    "json": ("json", render_json),
+    "markdown": ("md", render_markdown),
+}
+
+
+def build_export(name, rules, rows, export_format):
+    """
+    Renders a whole dictionary into bytes, gzipping it if it's big.
+    :param name: The language's name.
+    :param rules: The language's rules.
+    :param rows: The words, as (text, pronunciation, definition, list of related word texts).
+    :param export_format: One of EXPORT_FORMATS.
+    :return: The file's bytes and its file name.
+    """
+
+    extension, renderer = EXPORT_FORMATS[export_format]
+    buffer = io.BytesIO()
+    for chunk in renderer(name, rules, rows):
+        buffer.write(chunk.encode("utf-8"))
+    data = buffer.getvalue()
+    filename = "dictionary." + extension
+
+    if len(data) > COMPRESS_THRESHOLD:
+        data = gzip.compress(data)
+        filename += ".gz"
+    return data, filename
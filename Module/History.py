@@ -0,0 +1,121 @@
+# Version history for languages. Every change that's made records what it is about
+# to overwrite (only the words, relations, rules or name it touches), so older versions
+# can be rebuilt on top of the current one instead of keeping a full copy of each.
+import bisect
+import time
+
+
+class VersionDelta:
+    """
+    VersionDelta
+
+    What one version changed, as the values from just before it. A word that
+    didn't exist yet is remembered as None.
+    """
+
+    __slots__ = ("version", "description", "time", "words", "related", "rules", "name")
+
+    def __init__(self, version, description=""):
+        self.version = version  # The version this change made.
+        self.description = description
+        self.time = time.time()
+        self.words = {}  # Word id -> (text, pronunciation, definition) before the change, or None if it was added.
+        self.related = {}  # Word id -> frozenset of the related word ids before the change.
+        self.rules = None  # Tuple of the rules before the change, or None if they weren't touched.
+        self.name = None  # Name before the change, or None if it wasn't touched.
+
+    def get_data(self):
+        """
+        :return: The delta as plain data, for saving.
+        """
+
+        return (self.version, self.description, self.time, self.words,
+                dict((word_id, tuple(related_ids)) for word_id, related_ids in self.related.items()), self.rules, self.name)
+
+    @classmethod
+    def from_data(cls, data):
+        delta = cls(data[0], data[1])
+        delta.time = data[2]
+        delta.words = dict(data[3])
+        delta.related = dict((word_id, frozenset(related_ids)) for word_id, related_ids in data[4].items())
+        delta.rules = None if data[5] is None else tuple(data[5])
+        delta.name = data[6]
+        return delta
+
+
+class LanguageHistory:
+    """
+    LanguageHistory
+
+    Every version's delta, oldest first. Version numbers only go up, so finding
+    where to start rebuilding an old version is a binary search.
+    """
+
+    def __init__(self):
+        self.deltas = []
+        self.versions = []  # Version of each delta, for bisect.
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def add(self, delta):
+        self.deltas.append(delta)
+        self.versions.append(delta.version)
+
+    def remove_newest(self):
+        self.deltas.pop()
+        self.versions.pop()
+
+    def get_oldest_version(self, current_version):
+        """
+        :param current_version: The language's version right now.
+        :return: The oldest version that can still be rebuilt.
+        """
+
+        if len(self.deltas) == 0:
+            return current_version
+        return self.deltas[0].version - 1
+
+    def get_deltas_after(self, version):
+        """
+        :param version: A version number.
+        :return: The deltas of every version after it, oldest first.
+        """
+
+        return self.deltas[bisect.bisect_right(self.versions, version):]
+
+    def get_overrides(self, version):
+        """
+        Works out how the language at a version differs from the language now.
+        Only goes through the versions since then, not through the words.
+        :param version: The version to rebuild.
+        :return: Dictionaries of word id -> word state and word id -> related ids that were
+                 different back then, plus the rules and name back then (None if they're the same as now).
+        """
+
+        words = {}
+        related = {}
+        rules = None
+        name = None
+        for delta in reversed(self.get_deltas_after(version)):  # Newest first, so the oldest value is the one left.
+            words.update(delta.words)
+            related.update(delta.related)
+            if delta.rules is not None:
+                rules = delta.rules
+            if delta.name is not None:
+                name = delta.name
+        return words, related, rules, name
+
+    def get_data(self):
+        """
+        :return: The history as plain data, for saving.
+        """
+
+        return [delta.get_data() for delta in self.deltas]
+
+    @classmethod
+    def from_data(cls, data):
+        history = cls()
+        for delta_data in data:
+            history.add(VersionDelta.from_data(delta_data))
+        return history
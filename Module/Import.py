@@ -0,0 +1,215 @@
+# Reads word lists people upload for the importwords command.
+# Files are checked one row at a time as they are read, so a bad file is reported
+# line by line and a huge one stops at the limit instead of being loaded whole first.
+# Takes the same CSV and JSON that the dictionary command exports.
+import csv
+import gzip
+import io
+import json
+
+
+MAX_IMPORT_BYTES = 8 * 1024 * 1024  # Biggest attachment that will be read.
+MAX_IMPORT_WORDS = 10000  # Most words one import can add.
+MAX_IMPORT_ERRORS = 100  # Stop reading a file after this many bad rows.
+
+
+class WordFileError(Exception):
+    """
+    Raised when a whole file can't be read, as opposed to a bad row in it.
+    """
+
+
+def read_csv_rows(text):
+    """
+    :param text: The file's text. Needs a header row with text, pronunciation and definition (and optionally related_words).
+    :return: A generator of (line number, dictionary of the row's fields).
+    """
+
+    reader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames is None or not {"text", "pronunciation", "definition"}.issubset(name.strip().lower() for name in reader.fieldnames):
+        raise WordFileError("CSV files need a header row with text, pronunciation and definition columns.")
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    for row in reader:
+        related_words = row.get("related_words") or ""
+        row["related_words"] = [related_text for related_text in related_words.split(";")]
+        yield reader.line_num, row
+
+
+def skip_json_separators(text, position, separators=" \t\r\n,"):
+    """
+    :return: The position of the next character in the text that isn't a separator.
+    """
+
+    while position < len(text) and text[position] in separators:
+        position += 1
+    return position
+
+
+def find_json_words(decoder, text, position):
+    """
+    Goes through an object's keys until it finds "words". Other values are decoded only to skip past them,
+    so a name or a rule that happens to say "words" isn't mistaken for the key.
+    :param decoder: A json.JSONDecoder.
+    :param text: The file's text.
+    :param position: Just inside the object's opening brace.
+    :return: Where the value of "words" starts.
+    """
+
+    while True:
+        position = skip_json_separators(text, position)
+        if position >= len(text) or text[position] == "}":
+            raise WordFileError('JSON files need a list of words, or an object with a "words" list.')
+        try:
+            key, position = decoder.raw_decode(text, position)
+            if not isinstance(key, str):
+                raise WordFileError("Bad JSON: object keys have to be strings.")
+            position = skip_json_separators(text, position, " \t\r\n")
+            if not text.startswith(":", position):
+                raise WordFileError('Bad JSON: expected ":" after "' + key + '".')
+            position = skip_json_separators(text, position + 1, " \t\r\n")
+            if key == "words":
+                return position
+            _, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError as error:
+            raise WordFileError("Bad JSON before the words: " + error.msg)
+
+
+def read_json_rows(text):
+    """
+    Decodes the words one at a time instead of building the whole document first.
+    :param text: The file's text. Either a list of words or an object with a "words" list, like the JSON export.
+    :return: A generator of (word number, dictionary of the word's fields).
+    """
+
+    decoder = json.JSONDecoder()
+    position = skip_json_separators(text, 0, " \t\r\n")
+    if text.startswith("{", position):
+        position = find_json_words(decoder, text, position + 1)
+    if not text.startswith("[", position):
+        raise WordFileError('JSON files need a list of words, or an object with a "words" list.')
+
+    position += 1
+    number = 0
+    while True:
+        position = skip_json_separators(text, position)
+        if position >= len(text):
+            raise WordFileError("The JSON file ends before its list of words does.")
+        if text[position] == "]":
+            return
+        try:
+            row, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError as error:
+            raise WordFileError("Bad JSON after word " + str(number) + ": " + error.msg)
+        number += 1
+        yield number, row
+
+
+def clean_row(row):
+    """
+    :param row: The fields read for one word.
+    :return: (text, pronunciation, definition, tuple of related word texts), or a string saying what's wrong.
+    """
+
+    if not isinstance(row, dict):
+        return "not a word (expected an object with text, pronunciation and definition)"
+    fields = []
+    for name in ("text", "pronunciation", "definition"):
+        value = row.get(name)
+        if not isinstance(value, str) or value.strip() == "":
+            return "missing " + name
+        fields.append(value.strip())
+
+    related_words = row.get("related_words") or []
+    if isinstance(related_words, str):
+        related_words = related_words.split(";")
+    if not isinstance(related_words, list) or not all(isinstance(related_text, str) for related_text in related_words):
+        return "related_words has to be a list of words"
+    related_words = tuple(related_text.strip() for related_text in related_words if related_text.strip() != "")
+    return fields[0], fields[1], fields[2], related_words
+
+
+def parse_word_file(data, filename, existing_texts, pending_texts=()):
+    """
+    Reads and checks an uploaded word list. Safe to run off the event loop.
+    :param data: The file's bytes. Gzipped files (like big exports) are unzipped.
+    :param filename: The file's name, used to tell CSV from JSON.
+    :param existing_texts: Texts of the words already in the language, which are skipped.
+    :param pending_texts: Texts of words already up for a vote, which are skipped too.
+    :return: A list of the good words as (text, pronunciation, definition, tuple of related word texts),
+             and a list of (line or word number, problem) for everything that was skipped.
+    """
+
+    filename = filename.lower()
+    if filename.endswith(".gz"):
+        try:
+            data = gzip.decompress(data)
+        except (OSError, EOFError):
+            raise WordFileError("Couldn't unzip the file.")
+        filename = filename[:-3]
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise WordFileError("The file has to be UTF-8 text.")
+
+    if filename.endswith(".json") or (not filename.endswith(".csv") and text.lstrip()[:1] in ("[", "{")):
+        rows = read_json_rows(text)
+    else:
+        rows = read_csv_rows(text)
+
+    words = []
+    errors = []
+    seen_texts = set()
+    try:
+        for number, row in rows:
+            word = clean_row(row)
+            if isinstance(word, str):
+                errors.append((number, word))
+            elif word[0] in seen_texts:
+                errors.append((number, '"' + word[0] + '" is in the file twice'))
+            elif word[0] in existing_texts:
+                errors.append((number, '"' + word[0] + '" is already in the language'))
+            elif word[0] in pending_texts:
+                errors.append((number, '"' + word[0] + '" is already up for a vote'))
+            elif len(words) >= MAX_IMPORT_WORDS:
+                errors.append((number, "more than " + str(MAX_IMPORT_WORDS) + " words, stopped reading"))
+                break
+            else:
+                seen_texts.add(word[0])
+                words.append(word)
+
+            if len(errors) >= MAX_IMPORT_ERRORS:
+                errors.append((number, "too many problems, stopped reading"))
+                break
+    except csv.Error as error:
+        raise WordFileError("Bad CSV: " + str(error))
+
+    # Related words can point at words earlier or later in the file, so they're only checked once everything is read.
+    for index, (text, pronunciation, definition, related_words) in enumerate(words):
+        known = tuple(related_text for related_text in related_words if related_text in seen_texts or related_text in existing_texts)
+        if len(known) < len(related_words):
+            unknown = [related_text for related_text in related_words if related_text not in known]
+            errors.append((text, "unknown related words left out: " + ", ".join(unknown)))
+            words[index] = (text, pronunciation, definition, known)
+    return words, errors
+
+
+def build_import_diff(words, errors, similar=None):
+    """
+    Lays out what an import would do, for people to read before voting.
+    :param words: The words that would be added.
+    :param errors: The problems found, as (line or word number, problem).
+    :param similar: Dictionary of word text -> list of (text, how it's similar) for words that look like ones already there.
+    :return: The diff as bytes.
+    """
+
+    buffer = io.StringIO()
+    for text, pronunciation, definition, related_words in words:
+        buffer.write("+ " + text + " (" + pronunciation + "): " + definition)
+        if len(related_words) > 0:
+            buffer.write(" [related: " + ", ".join(related_words) + "]")
+        buffer.write("\n")
+        if similar is not None and text in similar:
+            buffer.write("~ " + text + " is similar to " + ", ".join(similar_text + " (" + reason + ")" for similar_text, reason in similar[text]) + "\n")
+    for number, problem in errors:
+        buffer.write("! " + str(number) + ": " + problem + "\n")
+    return buffer.getvalue().encode("utf-8")
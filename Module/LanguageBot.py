@@ -4,11 +4,34 @@
 # Pickle is used for saving languages to binary file.
 import discord
 import asyncio
+import io
 import pickle
 import time
 from enum import Enum
 from enum import auto
+import os
 import os.path
+import sys
+import sqlite3
+import heapq
+import itertools
+from collections import deque
+from collections import Counter
+import math
+import re
+import argparse
+from EditQueue import MessageEditQueue
+from Search import SearchIndex, prepare_words
+from Duplicates import DuplicateIndex, get_keys_for_words
+from Export import EXPORT_FORMATS, build_export
+from History import LanguageHistory, VersionDelta
+from Import import MAX_IMPORT_BYTES, WordFileError, parse_word_file, build_import_diff
+from Metrics import MetricsRegistry, MetricsServer, SamplingProfiler
+from Sharding import PartitionLostError, ShardMembership, check_owner
+from concurrent.futures import ThreadPoolExecutor
+
+
+VOTE_DURATION = 60.0  # Seconds each amendment is voted on. 172,800.0 normally. Lower for testing.
 
 
 # Enum to classify all the different types of amendments that can occur.
@@ -22,14 +45,179 @@ class ChangeType(Enum):
     EDITWORD = auto()
     ADDRELATEDWORD = auto()
     REMOVERELATEDWORD = auto()
+    BULKADDWORD = auto()
+    REVERT = auto()
+
+
+class ChangePayload:
+    """
+    ChangePayload
+
+    Base for the data each type of change carries. Every payload class
+    lists its fields in __slots__, so amendments don't each carry a __dict__.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            value = fields.get(name)
+            if isinstance(value, str):
+                value = sys.intern(value)  # The same texts show up again and again across amendments.
+            setattr(self, name, value)
+
+    def get_fields(self):
+        """
+        :return: A dictionary of field name -> value.
+        """
+
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):  # Slotted objects pickle as (None, dictionary of slots).
+            state = state[1]
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))  # Fields added since the payload was saved are None.
+
+
+class AddRulePayload(ChangePayload):
+    __slots__ = ("rule_desc",)
+
+
+class EditRulePayload(ChangePayload):
+    __slots__ = ("rule_number", "rule_desc")
+
+
+class RemoveRulePayload(ChangePayload):
+    __slots__ = ("rule_number",)
+
+
+class ChangeNamePayload(ChangePayload):
+    __slots__ = ("new_name",)
+
+
+class AddWordPayload(ChangePayload):
+    __slots__ = ("text", "pronunciation", "definition", "related_words", "similar_words")  # similar_words is a tuple of (text, how it's similar).
+
+
+class RemoveWordPayload(ChangePayload):
+    __slots__ = ("text",)
+
+
+class EditWordPayload(ChangePayload):
+    __slots__ = ("text", "parameter", "modification")
+
+
+class RelatedWordPayload(ChangePayload):
+    __slots__ = ("text", "related_word_text")
+
+
+class BulkAddWordPayload(ChangePayload):
+    __slots__ = ("words", "source_name")  # words is a tuple of (text, pronunciation, definition, tuple of related word texts).
+
+
+class RevertPayload(ChangePayload):
+    __slots__ = ("version",)
 
 
 class Change:
 
-    def __init__(self, change_type=None):
+    __slots__ = ("change_type", "deadline", "voting_message_id", "payload")
+
+    # The payload class that goes with each type of change.
+    payload_types = {
+        ChangeType.ADDRULE: AddRulePayload,
+        ChangeType.EDITRULE: EditRulePayload,
+        ChangeType.REMOVERULE: RemoveRulePayload,
+        ChangeType.CHANGENAME: ChangeNamePayload,
+        ChangeType.ADDWORD: AddWordPayload,
+        ChangeType.REMOVEWORD: RemoveWordPayload,
+        ChangeType.EDITWORD: EditWordPayload,
+        ChangeType.ADDRELATEDWORD: RelatedWordPayload,
+        ChangeType.REMOVERELATEDWORD: RelatedWordPayload,
+        ChangeType.BULKADDWORD: BulkAddWordPayload,
+        ChangeType.REVERT: RevertPayload,
+    }
+
+    # How each type of change describes itself on its voting message. Filled in from the payload's fields.
+    voting_text_formats = {
+        ChangeType.ADDRULE: "Change:\nAdd Rule: {rule_desc}",
+        ChangeType.EDITRULE: 'Change:\nChange rule {rule_number} to "{rule_desc}"',
+        ChangeType.REMOVERULE: "Change:\nRemove Rule {rule_number}",
+        ChangeType.CHANGENAME: 'Change:\nChange language name to "{new_name}"',
+        ChangeType.ADDWORD: "Change: Add Word\nText: {text}\nPronunciation: {pronunciation}\nDefinition: {definition}\nRelated Words: {related_words_list}{similar_words_note}",
+        ChangeType.REMOVEWORD: "Change:\nRemove Word: {text}",
+        ChangeType.EDITWORD: 'Change:\nChange "{text}"\'s {parameter} to {modification}',
+        ChangeType.ADDRELATEDWORD: 'Change:\nAdd "{related_word_text}" as a related word to "{text}"',
+        ChangeType.REMOVERELATEDWORD: 'Change:\nRemove "{related_word_text}" as a related word to "{text}"',
+        ChangeType.BULKADDWORD: 'Change: Import {word_count} words from "{source_name}"\nIncluding: {sample_list}\nEvery word is in the attached diff.',
+        ChangeType.REVERT: "Change:\nRevert the language to version {version}",
+    }
+
+    def __init__(self, change_type=None, payload=None):
         self.change_type = change_type
-        self.time_remaining = 60.0  # 172,800.0 normally. Lower for testing.
+        self.deadline = time.time() + VOTE_DURATION  # Absolute time the vote ends.
         self.voting_message_id = None
+        self.payload = payload
+
+    @property
+    def time_remaining(self):
+        return max(0.0, self.deadline - time.time())
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):  # Slotted objects pickle as (None, dictionary of slots).
+            state = state[1]
+        state = dict(state)
+
+        # Amendments saved before payloads, deadlines, etc. had every field loose on the object.
+        if "deadline" not in state:  # They also counted a time_remaining float down instead of keeping a deadline.
+            state["deadline"] = time.time() + state.get("time_remaining", 0.0)
+        if "payload" not in state:
+            payload_type = self.payload_types[state["change_type"]]
+            state["payload"] = payload_type(**state)
+
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))
+
+    def get_voting_text(self):
+        """
+        Describes the change for its voting message.
+        :return: The voting message minus its "Time Remaining" line.
+        """
+
+        fields = self.payload.get_fields()
+        if self.change_type == ChangeType.ADDWORD:
+            fields["related_words_list"] = "".join(related_word + ", " for related_word in self.payload.related_words)
+            fields["similar_words_note"] = ""
+            if self.payload.similar_words:
+                fields["similar_words_note"] = "\nSimilar to: " + ", ".join(text + " (" + reason + ")" for text, reason in self.payload.similar_words)
+        elif self.change_type == ChangeType.BULKADDWORD:
+            fields["word_count"] = len(self.payload.words)
+            fields["sample_list"] = ", ".join(word[0] for word in self.payload.words[:10])
+        return self.voting_text_formats[self.change_type].format(**fields)
+
+    def get_new_texts(self):
+        """
+        :return: The word texts this change would add to the language if it passed.
+        """
+
+        if self.change_type == ChangeType.ADDWORD:
+            return (self.payload.text,)
+        elif self.change_type == ChangeType.BULKADDWORD:
+            return tuple(word[0] for word in self.payload.words)
+        elif self.change_type == ChangeType.EDITWORD and self.payload.parameter == "text":
+            return (self.payload.modification,)
+        return ()
+
+    def get_voting_message(self, granularity=1.0):
+        """
+        Builds the full text of the voting message.
+        :param granularity: How coarse the countdown is, in seconds. It is rounded up so it never shows zero early.
+        :return: The message text.
+        """
+
+        countdown = granularity * math.ceil(self.time_remaining / granularity)
+        return "Time Remaining: " + str(round(countdown)) + "\n" + self.get_voting_text()
 
     def __str__(self):
         return str(self.change_type)
@@ -40,17 +228,28 @@ class Word:
     Word
 
     Really just a storage class for all the information
-    that makes up a word.
+    that makes up a word. Related words are kept by the language, by id.
     """
 
-    def __init__(self, text, pronunciation, definition, related_words=None):
+    # related_words is only ever set on words loaded from files saved before
+    # related words moved into the language, until the language converts them.
+    __slots__ = ("text", "pronunciation", "definition", "id", "related_words")
+
+    def __init__(self, text, pronunciation, definition):
         self.text = text
-        self.pronunciation = pronunciation
+        self.pronunciation = sys.intern(pronunciation)  # Lots of words share pronunciations.
         self.definition = definition
-        if related_words is None:  # None is needed because of this: https://stackoverflow.com/questions/41686829/warning-about-mutable-default-argument-in-pycharm
-            self.related_words = []
-        else:
-            self.related_words = related_words
+        self.id = None  # Given out by the language the word is added to. Never changes after that.
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):  # Slotted objects pickle as (None, dictionary of slots).
+            state = state[1]
+        self.text = state["text"]
+        self.pronunciation = sys.intern(state["pronunciation"])
+        self.definition = state["definition"]
+        self.id = state.get("id")  # Words saved before ids get one from the language.
+        if "related_words" in state:
+            self.related_words = state["related_words"]
 
 
 class Language:
@@ -61,14 +260,52 @@ class Language:
     as well as some searching and serialization helper methods.
     """
 
+    __slots__ = ("words", "word_index", "related", "next_word_id", "name", "channel_id", "rules", "intro_message_id",
+                 "amendments", "should_update_rules", "search_index", "version", "export_cache", "history", "recording", "lock",
+                 "pending_texts", "duplicate_index")
+
     def __init__(self, name="New Language"):
-        self.words = []
+        self.words = {}  # Word id -> Word, in the order they were added.
+        self.word_index = {}  # Word text -> Word, kept in step with self.words so lookups don't scan the list.
+        self.related = {}  # Word id -> set of ids of related words. Always goes both ways.
+        self.next_word_id = 0
         self.name = name
         self.channel_id = None
         self.rules = []
         self.intro_message_id = None
         self.amendments = []
         self.should_update_rules = False
+        self.search_index = None  # Built the first time someone searches, then kept up to date.
+        self.version = 0  # Goes up every time a change is made. Old versions can be looked at through the history.
+        self.export_cache = {}  # Export format -> (version, bytes, file name)
+        self.history = LanguageHistory()
+        self.recording = None  # The VersionDelta of the change being made right now, if one is.
+        self.lock = asyncio.Lock()  # Held while the language or its stored copy is being changed.
+        self.pending_texts = Counter()  # Word text -> open amendments that would add a word with it.
+        self.duplicate_index = None  # Built the first time a word is checked for near duplicates, then kept up to date.
+
+    def remember_word(self, word_id):
+        """
+        Notes down a word as it is before the change being made touches it, the first time it's touched.
+        :param word_id: The word's id.
+        :return: Nothing.
+        """
+
+        if self.recording is not None and word_id not in self.recording.words:
+            word = self.words.get(word_id)
+            self.recording.words[word_id] = None if word is None else (word.text, word.pronunciation, word.definition)
+
+    def remember_related(self, word_id):
+        if self.recording is not None and word_id not in self.recording.related:
+            self.recording.related[word_id] = frozenset(self.related.get(word_id, ()))
+
+    def remember_rules(self):
+        if self.recording is not None and self.recording.rules is None:
+            self.recording.rules = tuple(self.rules)
+
+    def remember_name(self):
+        if self.recording is not None and self.recording.name is None:
+            self.recording.name = self.name
 
     async def get_word(self, text):
         """
@@ -77,19 +314,584 @@ class Language:
         :return: The gotten word, or None if it wasn't found.
         """
 
-        for word in self.words:
-            if word.text == text:
-                return word
+        return self.word_index.get(text)
+
+    async def claim_texts(self, texts):
+        """
+        Reserves word texts for a new amendment that would add them, unless any of them are
+        already words or up for a vote. Checks and reserves in one go, so two proposals of
+        the same word can't both get through.
+        :param texts: The texts.
+        :return: The texts that were taken. Nothing is reserved unless this is empty.
+        """
+
+        taken = [text for text in texts if text in self.word_index or text in self.pending_texts]
+        if len(taken) == 0:
+            await self.reserve_texts(texts)
+        return taken
+
+    async def reserve_texts(self, texts):
+        for text in texts:
+            self.pending_texts[text] += 1
+
+    async def release_texts(self, texts):
+        for text in texts:
+            self.pending_texts[text] -= 1
+            if self.pending_texts[text] <= 0:
+                del self.pending_texts[text]
+
+    async def find_similar_words(self, text, pronunciation, limit=5, keys=None):
+        """
+        Finds words that a new word is probably a duplicate of, even though its text is different.
+        :param text: The new word's text.
+        :param pronunciation: Its pronunciation.
+        :param limit: Most words to return.
+        :param keys: The new word's duplicate keys, if they were worked out already.
+        :return: A list of (text, how it's similar).
+        """
+
+        if self.duplicate_index is None:
+            self.duplicate_index = DuplicateIndex()
+            for word in self.words.values():
+                self.duplicate_index.add(word.text, word.pronunciation)
+        return self.duplicate_index.find_similar(text, pronunciation, limit, keys)
+
+    async def add_word(self, word):
+        """
+        Adds a word to the language, gives it an id and indexes it by its text.
+        :param word: The word to add.
+        :return: Nothing.
+        """
+
+        if word.id is None:
+            word.id = self.next_word_id
+        self.next_word_id = max(self.next_word_id, word.id + 1)
+        self.remember_word(word.id)
+        self.words[word.id] = word
+        self.word_index.setdefault(word.text, word)  # Keep the first word with this text, same as the old linear search.
+        if self.search_index is not None:
+            self.search_index.add(word.text, word.pronunciation, word.definition)
+        if self.duplicate_index is not None:
+            self.duplicate_index.add(word.text, word.pronunciation)
+
+    async def add_words(self, rows):
+        """
+        Adds a batch of words, then relates them, so words in the batch can be related to each other.
+        Words whose text is already in the language are skipped.
+        :param rows: The words, as (text, pronunciation, definition, related word texts).
+        :return: The words that were added.
+        """
+
+        new_rows = []
+        new_texts = set()
+        for text, pronunciation, definition, _ in rows:
+            if text not in self.word_index and text not in new_texts:
+                new_texts.add(text)
+                new_rows.append((text, pronunciation, definition))
+
+        # Everything the search and duplicate indexes need for the batch is worked out on another thread
+        # before anything changes. Then each index is updated once for the whole batch.
+        search_batch = None
+        keys = {}
+        if self.search_index is not None:
+            search_batch = await asyncio.get_event_loop().run_in_executor(None, prepare_words, new_rows)
+        if self.duplicate_index is not None:
+            word_keys = await asyncio.get_event_loop().run_in_executor(None, get_keys_for_words, [(text, pronunciation) for text, pronunciation, _ in new_rows])
+            keys = dict(zip((text for text, _, _ in new_rows), word_keys))
+
+        added_words = []
+        related_texts = dict((text, related_words) for text, _, _, related_words in reversed(rows))  # The first row with a text is the one added.
+        for text, pronunciation, definition in new_rows:
+            new_word = Word(text, pronunciation, definition)
+            new_word.id = self.next_word_id
+            self.next_word_id += 1
+            self.remember_word(new_word.id)
+            self.words[new_word.id] = new_word
+            self.word_index[text] = new_word
+            added_words.append((new_word, related_texts[text]))
+
+        if self.search_index is not None:
+            self.search_index.add_prepared(search_batch if search_batch is not None else prepare_words(new_rows))
+        if self.duplicate_index is not None:
+            for new_word, _ in added_words:
+                self.duplicate_index.add(new_word.text, new_word.pronunciation, keys.get(new_word.text))
+
+        for new_word, related_words in added_words:
+            for related_text in related_words:
+                related_word = self.word_index.get(related_text)
+                if related_word is not None:
+                    await self.relate_words(new_word, related_word)
+        return [new_word for new_word, _ in added_words]
+
+    async def remove_word(self, word):
+        """
+        Removes a word from the language, from the index, and from every word it was related to.
+        :param word: The word to remove.
+        :return: Nothing.
+        """
+
+        self.remember_word(word.id)
+        self.remember_related(word.id)
+        for related_id in self.related.get(word.id, ()):
+            self.remember_related(related_id)
+
+        del self.words[word.id]
+        if self.word_index.get(word.text) is word:
+            del self.word_index[word.text]
+        for related_id in self.related.pop(word.id, ()):
+            self.related[related_id].discard(word.id)
+            if len(self.related[related_id]) == 0:
+                del self.related[related_id]
+        if self.search_index is not None:
+            self.search_index.remove(word.text, word.pronunciation, word.definition)
+        if self.duplicate_index is not None:
+            self.duplicate_index.remove(word.text, word.pronunciation)
+
+    async def unindex_word(self, word):
+        """
+        Takes a word out of the text, search and duplicate indexes, but not out of the language.
+        :param word: The word.
+        :return: Nothing.
+        """
+
+        if self.word_index.get(word.text) is word:
+            del self.word_index[word.text]
+        if self.search_index is not None:
+            self.search_index.remove(word.text, word.pronunciation, word.definition)
+        if self.duplicate_index is not None:
+            self.duplicate_index.remove(word.text, word.pronunciation)
+
+    async def index_word(self, word):
+        """
+        Puts a word back into the text, search and duplicate indexes under its current values.
+        :param word: The word.
+        :return: Nothing.
+        """
+
+        self.word_index[word.text] = word
+        if self.search_index is not None:
+            self.search_index.add(word.text, word.pronunciation, word.definition)
+        if self.duplicate_index is not None:
+            self.duplicate_index.add(word.text, word.pronunciation)
+
+    async def edit_word(self, word, parameter, value):
+        """
+        Changes the text, pronunciation or definition of a word, keeping the indexes in step.
+        :param word: The word to edit.
+        :param parameter: "text", "pronunciation" or "definition".
+        :param value: The new value.
+        :return: Nothing.
+        """
+
+        if parameter not in ("text", "pronunciation", "definition"):
+            return
+
+        self.remember_word(word.id)
+        if self.search_index is not None:
+            self.search_index.remove(word.text, word.pronunciation, word.definition)
+        if self.duplicate_index is not None:
+            self.duplicate_index.remove(word.text, word.pronunciation)
+
+        if parameter == "text":
+            if self.word_index.get(word.text) is word:
+                del self.word_index[word.text]
+            word.text = value
+            self.word_index.setdefault(value, word)
+        elif parameter == "pronunciation":
+            word.pronunciation = sys.intern(value)
+        elif parameter == "definition":
+            word.definition = value
+
+        if self.search_index is not None:
+            self.search_index.add(word.text, word.pronunciation, word.definition)
+        if self.duplicate_index is not None:
+            self.duplicate_index.add(word.text, word.pronunciation)
+
+    async def relate_words(self, word, related_word):
+        """
+        Marks two words as related to each other.
+        :return: Nothing.
+        """
+
+        if word.id == related_word.id:
+            return
+        self.remember_related(word.id)
+        self.remember_related(related_word.id)
+        self.related.setdefault(word.id, set()).add(related_word.id)
+        self.related.setdefault(related_word.id, set()).add(word.id)
+
+    async def unrelate_words(self, word, related_word):
+        """
+        Marks two words as no longer related.
+        :return: Nothing.
+        """
+
+        self.remember_related(word.id)
+        self.remember_related(related_word.id)
+        for first, second in ((word.id, related_word.id), (related_word.id, word.id)):
+            related_ids = self.related.get(first)
+            if related_ids is not None:
+                related_ids.discard(second)
+                if len(related_ids) == 0:
+                    del self.related[first]
+
+    async def get_related_words(self, word):
+        """
+        :param word: A word of this language.
+        :return: A list of the words related to it, oldest first.
+        """
+
+        return [self.words[related_id] for related_id in sorted(self.related.get(word.id, ()))]
+
+    async def get_word_family(self, word, max_words=None):
+        """
+        Finds every word connected to a word through related words, closest first (breadth first search).
+        :param word: The word to start from.
+        :param max_words: Stop after finding this many. None for no limit.
+        :return: A list of (word, distance) pairs, not including the word itself.
+        """
+
+        distances = {word.id: 0}
+        queue = deque([word.id])
+        family = []
+        while len(queue) > 0:
+            current_id = queue.popleft()
+            for related_id in self.related.get(current_id, ()):
+                if related_id not in distances:
+                    distances[related_id] = distances[current_id] + 1
+                    family.append((self.words[related_id], distances[related_id]))
+                    if max_words is not None and len(family) >= max_words:
+                        return family
+                    queue.append(related_id)
+        return family
+
+    async def get_relation_path(self, start_word, end_word):
+        """
+        Finds the shortest chain of related words between two words. Searches from
+        both ends at once, always growing the smaller side, so it only looks at a
+        small part of a big graph.
+        :param start_word: The word to start from.
+        :param end_word: The word to get to.
+        :return: A list of words from start_word to end_word, or None if they aren't connected.
+        """
+
+        if start_word.id == end_word.id:
+            return [start_word]
+
+        forward_parents = {start_word.id: None}
+        backward_parents = {end_word.id: None}
+        forward_frontier = [start_word.id]
+        backward_frontier = [end_word.id]
+
+        while len(forward_frontier) > 0 and len(backward_frontier) > 0:
+            grow_forward = len(forward_frontier) <= len(backward_frontier)
+            if grow_forward:
+                frontier, parents, other_parents = forward_frontier, forward_parents, backward_parents
+            else:
+                frontier, parents, other_parents = backward_frontier, backward_parents, forward_parents
+
+            next_frontier = []
+            meeting_id = None
+            for current_id in frontier:
+                for related_id in self.related.get(current_id, ()):
+                    if related_id not in parents:
+                        parents[related_id] = current_id
+                        next_frontier.append(related_id)
+                        if related_id in other_parents:
+                            meeting_id = related_id
+                            break
+                if meeting_id is not None:
+                    break
+
+            if meeting_id is not None:
+                path = []
+                current_id = meeting_id
+                while current_id is not None:
+                    path.append(current_id)
+                    current_id = forward_parents[current_id]
+                path.reverse()
+                current_id = backward_parents[meeting_id]
+                while current_id is not None:
+                    path.append(current_id)
+                    current_id = backward_parents[current_id]
+                return [self.words[word_id] for word_id in path]
+
+            if grow_forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
 
         return None
 
+    async def get_word_groups(self):
+        """
+        Splits the words into groups that are connected through related words (connected components).
+        Words with no related words aren't included.
+        :return: A list of lists of words, biggest group first.
+        """
+
+        seen = set()
+        groups = []
+        for word_id in self.related:
+            if word_id in seen:
+                continue
+            seen.add(word_id)
+            group = [word_id]
+            queue = deque([word_id])
+            while len(queue) > 0:
+                for related_id in self.related.get(queue.popleft(), ()):
+                    if related_id not in seen:
+                        seen.add(related_id)
+                        group.append(related_id)
+                        queue.append(related_id)
+            groups.append([self.words[member_id] for member_id in group])
+
+        groups.sort(key=len, reverse=True)
+        return groups
+
+    async def rebuild_word_index(self):
+        """
+        Builds the word index from scratch. Only needed after loading.
+        :return: Nothing.
+        """
+
+        self.word_index = {}
+        for word in self.words.values():
+            self.word_index.setdefault(word.text, word)
+
+    async def search(self, query, limit=10, version=None):
+        """
+        Searches the dictionary by spelling, close spelling, and definition.
+        :param query: What to look for.
+        :param limit: Most results to return.
+        :param version: Search the language as it was at this version. None for now.
+        :return: A list of the words found, best match first.
+        """
+
+        if self.search_index is None:
+            # Built on another thread. The lock keeps the words from changing until the index is in place to follow them.
+            async with self.lock:
+                if self.search_index is None:
+                    rows = [(word.text, word.pronunciation, word.definition) for word in self.words.values()]
+                    search_index = SearchIndex()
+                    await asyncio.get_event_loop().run_in_executor(None, search_index.add_many, rows)
+                    self.search_index = search_index
+
+        if version is not None and version != self.version:
+            language_version = await self.get_version(version)
+            return await language_version.search(query, limit)
+
+        results = []
+        for text, _ in self.search_index.search(query, limit):
+            word = self.word_index.get(text)
+            if word is not None:
+                results.append(word)
+        return results
+
+    async def export(self, export_format, version=None):
+        """
+        Gets a downloadable dictionary of the language, reusing the last one
+        if nothing has changed since. It is built off the event loop.
+        :param export_format: One of "text", "csv", "json" or "markdown".
+        :param version: Export the language as it was at this version. None for now.
+        :return: The file's bytes and its file name.
+        """
+
+        if version is None:
+            version = self.version
+        cached = self.export_cache.get(export_format)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+
+        # Copied out so the export can be built on another thread without the words changing underneath it.
+        if version == self.version:
+            name, rules = self.name, list(self.rules)
+            rows = []
+            for word in self.words.values():
+                related_texts = [related_word.text for related_word in await self.get_related_words(word)]
+                rows.append((word.text, word.pronunciation, word.definition, related_texts))
+        else:
+            language_version = await self.get_version(version)
+            name, rules, rows = language_version.name, list(language_version.rules), await language_version.get_rows()
+
+        data, filename = await asyncio.get_event_loop().run_in_executor(None, build_export, name, rules, rows, export_format)
+        if version == self.version:  # Old versions are asked for rarely, so they aren't worth keeping around.
+            self.export_cache[export_format] = (version, data, filename)
+        return data, filename
+
+    async def has_version(self, version):
+        """
+        :param version: A version number.
+        :return: Whether the language can be shown as it was at that version.
+        """
+
+        return self.history.get_oldest_version(self.version) <= version <= self.version
+
+    async def get_version(self, version):
+        """
+        :param version: A version number. (Check it with has_version first.)
+        :return: A LanguageVersion showing the language as it was at that version.
+        """
+
+        return LanguageVersion(self, version)
+
+    async def diff_versions(self, old_version, new_version):
+        """
+        Lists what changed between two versions, only looking at what those versions touched.
+        :param old_version: The earlier version.
+        :param new_version: The later version.
+        :return: A list of lines, "+" for added, "-" for removed and "~" for changed.
+        """
+
+        old = await self.get_version(old_version)
+        new = await self.get_version(new_version)
+        word_ids = set()
+        related_ids = set()
+        for delta in self.history.get_deltas_after(old_version):
+            if delta.version > new_version:
+                break
+            word_ids.update(delta.words)
+            related_ids.update(delta.related)
+
+        lines = []
+        if old.name != new.name:
+            lines.append('~ name: "' + old.name + '" -> "' + new.name + '"')
+        if old.rules != new.rules:
+            for index, rule in enumerate(old.rules):
+                if rule not in new.rules:
+                    lines.append("- rule " + str(index + 1) + ": " + rule)
+            for index, rule in enumerate(new.rules):
+                if rule not in old.rules:
+                    lines.append("+ rule " + str(index + 1) + ": " + rule)
+
+        for word_id in sorted(word_ids):
+            old_state = old.get_word_state(word_id)
+            new_state = new.get_word_state(word_id)
+            if old_state == new_state:
+                continue
+            if old_state is None:
+                lines.append("+ " + new_state[0] + " (" + new_state[1] + "): " + new_state[2])
+            elif new_state is None:
+                lines.append("- " + old_state[0] + " (" + old_state[1] + "): " + old_state[2])
+            else:
+                for parameter, old_value, new_value in zip(("text", "pronunciation", "definition"), old_state, new_state):
+                    if old_value != new_value:
+                        lines.append("~ " + new_state[0] + " " + parameter + ": " + old_value + " -> " + new_value)
+
+        for word_id in sorted(related_ids):
+            new_state = new.get_word_state(word_id) or old.get_word_state(word_id)
+            old_related = old.get_related_ids(word_id)
+            new_related = new.get_related_ids(word_id)
+            for related_id in sorted(new_related - old_related):
+                if word_id < related_id or related_id not in related_ids:  # Each pair only once.
+                    lines.append("+ related: " + new_state[0] + " <-> " + (new.get_word_state(related_id) or old.get_word_state(related_id))[0])
+            for related_id in sorted(old_related - new_related):
+                if word_id < related_id or related_id not in related_ids:
+                    lines.append("- related: " + new_state[0] + " <-> " + (new.get_word_state(related_id) or old.get_word_state(related_id))[0])
+        return lines
+
+    async def revert_to(self, version):
+        """
+        Puts the language back how it was at an older version. This is a change like any other,
+        so it gets its own version and can be reverted too.
+        :param version: The version to go back to.
+        :return: Nothing.
+        """
+
+        if not await self.has_version(version):
+            return
+        target = await self.get_version(version)
+        await self.restore(target.word_states, target.related_ids, list(target.rules), target.name)
+
+    async def undo_change(self, delta):
+        """
+        Takes back the last change made, from what it recorded overwriting. Used when the change
+        couldn't be saved, so nothing of it is recorded in turn and the version goes back down.
+        :param delta: The VersionDelta make_change returned. Has to be the newest one.
+        :return: Nothing.
+        """
+
+        await self.restore(delta.words, delta.related, None if delta.rules is None else list(delta.rules), delta.name)
+        self.history.remove_newest()
+        self.version = delta.version - 1
+        self.export_cache = {}
+
+    async def restore(self, word_states, related_ids, rules, name):
+        """
+        Puts words, relations, rules and the name back to earlier values.
+        :param word_states: Word id -> (text, pronunciation, definition), or None for a word that didn't exist.
+        :param related_ids: Word id -> set of the ids it was related to.
+        :param rules: The rules, or None to leave them.
+        :param name: The name, or None to leave it.
+        :return: Nothing.
+        """
+
+        # Texts can move between words from one version to another (a word renamed, then another renamed to its old text).
+        # Done one word at a time, a word could take a text that another still holds in the indexes, and lose it when
+        # that one moves on. So the changed words come out of the indexes first, words that go are removed before
+        # words that come back are added, and the changed words go back in once they all have their old values.
+        changed_words = []
+        for word_id in sorted(word_states):
+            state = word_states[word_id]
+            word = self.words.get(word_id)
+            if word is not None and state is not None and (word.text, word.pronunciation, word.definition) != state:
+                changed_words.append((word, state))
+                await self.unindex_word(word)
+
+        for word_id in sorted(word_states):
+            word = self.words.get(word_id)
+            if word_states[word_id] is None and word is not None:
+                await self.remove_word(word)
+        for word_id in sorted(word_states):
+            state = word_states[word_id]
+            if state is not None and word_id not in self.words:
+                word = Word(state[0], state[1], state[2])
+                word.id = word_id
+                await self.add_word(word)
+
+        for word, state in changed_words:
+            self.remember_word(word.id)
+            word.text = state[0]
+            word.pronunciation = sys.intern(state[1])
+            word.definition = state[2]
+        for word, state in changed_words:
+            await self.index_word(word)
+
+        for word_id in sorted(related_ids):
+            word = self.words.get(word_id)
+            if word is None:
+                continue
+            wanted = related_ids[word_id]
+            current = set(self.related.get(word_id, ()))
+            for related_id in current - wanted:
+                await self.unrelate_words(word, self.words[related_id])
+            for related_id in wanted - current:
+                if related_id in self.words:
+                    await self.relate_words(word, self.words[related_id])
+
+        if rules is not None and rules != self.rules:
+            self.remember_rules()
+            self.rules = rules
+            self.should_update_rules = True
+        if name is not None and name != self.name:
+            self.remember_name()
+            self.name = name
+            self.should_update_rules = True
+
     async def get_pickle_data(self):
         """
         Gets data from the language for pickling.
+        Related words are saved as pairs of ids, so pickling never has to walk from word to word.
         :return: The data.
         """
 
-        return [self.name, self.words, self.channel_id, self.rules, self.intro_message_id, self.amendments]
+        edges = []
+        for word_id, related_ids in self.related.items():
+            for related_id in related_ids:
+                if word_id < related_id:
+                    edges.append((word_id, related_id))
+        return [self.name, list(self.words.values()), self.channel_id, self.rules, self.intro_message_id, self.amendments, edges, self.next_word_id,
+                self.version, self.history.get_data()]
 
     async def build_from_pickle_data(self, data):
         """
@@ -99,376 +901,2101 @@ class Language:
         """
 
         self.name = data[0]
-        self.words = data[1]
         self.channel_id = data[2]
         self.rules = data[3]
         self.intro_message_id = data[4]
         self.amendments = data[5]
+        self.search_index = None
+        self.duplicate_index = None
+        self.pending_texts = Counter()
+        for amendment in self.amendments:
+            await self.reserve_texts(amendment.get_new_texts())
+
+        self.words = {}
+        self.related = {}
+        self.recording = None
+        if len(data) > 7:
+            self.next_word_id = data[7]
+        if len(data) > 9:  # Saved with version history.
+            self.version = data[8]
+            self.history = LanguageHistory.from_data(data[9])
+        for word in data[1]:
+            await self.add_word(word)
+        await self.rebuild_word_index()
+
+        if len(data) > 6:
+            for word_id, related_id in data[6]:
+                await self.relate_words(self.words[word_id], self.words[related_id])
+        else:  # Saved before ids. Words held their related words (or just their text) in a list.
+            for word in data[1]:
+                legacy_related_words = getattr(word, "related_words", [])
+                if hasattr(word, "related_words"):
+                    del word.related_words
+                for related_word in legacy_related_words:
+                    if not isinstance(related_word, Word):
+                        related_word = self.word_index.get(related_word)
+                    if related_word is not None and related_word.id in self.words:
+                        await self.relate_words(word, related_word)
+
+
+class LanguageVersion:
+    """
+    LanguageVersion
 
-
-def get_command_list(full_command):
+    A read-only look at a language as it was at an older version. Only what's
+    different from now is kept; everything else is read from the language itself.
     """
-    Helper function that *painfully* parses the string given to a usable format.
-    :param full_command: The raw command minus the prefix.
-    :return: Ideally a list of commands and parameters. None if there was an error.
-    """
-
-    original_command = full_command
-    first_command_index = original_command.find('\"')
-    if first_command_index == -1:
-        return [full_command]
-    command_list = [original_command[:first_command_index]]  # Create a list of commands starting with the base command.
-    command_list[0] = command_list[0].replace(' ',
-                                              '')  # Replace any spaces since the first command can never have them.
-    original_command = original_command[first_command_index:]  # Remove that first command from the rest of the string.
-    while len(original_command) > 0:  # Until everything is drained form the string of commands.
-        check_same = original_command
-        command_list.append(original_command[1:original_command.find('\"', 1)])
-        original_command = original_command[original_command.find('\"', 1) + 1:]
-        original_command = original_command[
-                           original_command.find('\"'):]  # Get rid of spaces left over between parameters.
-        if check_same == original_command:  # Check if we are stuck in a loop due to formatting errors.
-            return None
 
-    print(command_list)
-    return command_list
+    __slots__ = ("language", "version", "word_states", "related_ids", "name", "rules")
 
+    def __init__(self, language, version):
+        self.language = language
+        self.version = version
+        self.word_states, self.related_ids, rules, name = language.history.get_overrides(version)
+        self.rules = tuple(language.rules) if rules is None else rules
+        self.name = language.name if name is None else name
 
-async def make_change(change, language):
-    """
-    Modifies the language in accordance to the change presented.
-    This is what is called when the changes are ready to be put into place from voting.
-    :param change: The change that is about to happen, including all the data needed to know what to do.
-    :param language: The language to modify.
-    :return: Nothing
-    """
+    def get_word_state(self, word_id):
+        """
+        :param word_id: A word id.
+        :return: The word's (text, pronunciation, definition) at this version, or None if it didn't exist.
+        """
 
-    change_type = change.change_type
+        if word_id in self.word_states:
+            return self.word_states[word_id]
+        word = self.language.words.get(word_id)
+        return None if word is None else (word.text, word.pronunciation, word.definition)
 
-    if change_type == ChangeType.ADDWORD:
-        new_word = Word(change.text, change.pronunciation, change.definition, related_words=change.related_words)
-        language.words.append(new_word)
+    def get_related_ids(self, word_id):
+        """
+        :param word_id: A word id.
+        :return: A set of the ids of the words related to it at this version.
+        """
 
-    elif change_type == ChangeType.EDITWORD:
-        word = await language.get_word(change.text)
-        if word is not None:
-            if change.parameter == "text":
-                word.text = change.modification
-            elif change.parameter == "pronunciation":
-                word.pronunciation = change.modification
-            elif change.parameter == "definition":
-                word.definition = change.modification
+        if word_id in self.related_ids:
+            return set(self.related_ids[word_id])
+        return set(self.language.related.get(word_id, ()))
 
-    elif change_type == ChangeType.REMOVEWORD:
-        word = await language.get_word(change.text)
-        if word is not None:
-            language.words.remove(word)
+    async def get_rows(self):
+        """
+        :return: Every word at this version as (text, pronunciation, definition, list of related word texts), oldest first.
+        """
 
-    elif change_type == ChangeType.ADDRULE:
-        language.rules.append(change.rule_desc)
-        language.should_update_rules = True
+        rows = []
+        for word_id in sorted(set(self.language.words).union(self.word_states)):
+            state = self.get_word_state(word_id)
+            if state is not None:
+                related_texts = [self.get_word_state(related_id)[0] for related_id in sorted(self.get_related_ids(word_id))]
+                rows.append((state[0], state[1], state[2], related_texts))
+        return rows
 
-    elif change_type == ChangeType.EDITRULE:
-        if 1 <= change.rule_number <= len(language.rules):
-            language.rules[change.rule_number - 1] = change.rule_desc
-            language.should_update_rules = True
+    async def search(self, query, limit=10):
+        """
+        Searches the language's search index, leaving out the words that have changed
+        since this version, plus a small index of just those words as they were.
+        :param query: What to look for.
+        :param limit: Most results to return.
+        :return: A list of Words as they were at this version, best match first.
+        """
 
-    elif change_type == ChangeType.REMOVERULE:
-        if 1 <= change.rule_number <= len(language.rules):
-            del language.rules[change.rule_number - 1]
-            language.should_update_rules = True
+        changed_texts = set()
+        old_words = {}  # Text -> Word as it was, for words that have changed since.
+        old_index = SearchIndex()
+        for word_id, state in self.word_states.items():
+            word = self.language.words.get(word_id)
+            if word is not None:
+                changed_texts.add(word.text)
+            if state is not None:
+                old_word = Word(state[0], state[1], state[2])
+                old_word.id = word_id
+                old_words.setdefault(old_word.text, old_word)
+                old_index.add(old_word.text, old_word.pronunciation, old_word.definition)
+
+        ranked = [(score, text, self.language.word_index.get(text)) for text, score in self.language.search_index.search(query, limit + len(changed_texts)) if text not in changed_texts]
+        ranked += [(score, text, old_words[text]) for text, score in old_index.search(query, limit)]
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+
+        results = []
+        seen_texts = set()
+        for _, text, word in ranked:
+            if word is not None and text not in seen_texts:
+                seen_texts.add(text)
+                results.append(word)
+        return results[:limit]
+
+
+class ChangeJournal:
+    """
+    ChangeJournal
 
-    elif change_type == ChangeType.CHANGENAME:
-        language.name = change.new_name
-        language.should_update_rules = True
+    Append-only log of everything that changes the languages
+    (new languages, new amendments, resolved amendments). Each record is
+    pickled on its own and appended to the file, so saving costs as much
+    as the change itself instead of the whole data set. Records are fsync'd
+    in batches, and the journal is rotated out whenever a snapshot is taken.
+    """
 
-    elif change_type == ChangeType.ADDRELATEDWORD:
-        word = await language.get_word(change.text)
-        related_word = await language.get_word(change.related_word_text)
-        if (word is not None) and (related_word is not None):
-            word.related_words.append(related_word)
+    def __init__(self, path, batch_size=32, flush_delay=1.0):
+        self.path = path
+        self.compacting_path = path + ".compacting"  # Where the journal is moved while a snapshot is written.
+        self.batch_size = batch_size  # How many records can be waiting before forcing an fsync.
+        self.flush_delay = flush_delay  # How long a record can wait for an fsync.
+        self.sequence = 0  # Number of the last record written. Snapshots remember this to know what to replay.
+        self.records_since_snapshot = 0
+        self.pending = 0
+        self.bytes_written = 0
+        self.flush_task = None
+        self.file = None
+
+    @staticmethod
+    def read_records(path):
+        """
+        Reads every complete record out of a journal file.
+        A record cut off by a crash ends the read.
+        :param path: The journal file to read.
+        :return: A list of the records, and the file offset just after the last good one.
+        """
 
-    elif change_type == ChangeType.REMOVERELATEDWORD:
-        word = await language.get_word(change.text)
-        related_word = await language.get_word(change.related_word_text)
-        if (word is not None) and (related_word is not None):
-            word.related_words.remove(related_word)
+        records = []
+        good_offset = 0
+        if not os.path.isfile(path):
+            return records, good_offset
+
+        file = open(path, 'rb')
+        while True:
+            try:
+                records.append(pickle.load(file))
+            except (EOFError, pickle.UnpicklingError, AttributeError, ValueError, IndexError):
+                break
+            good_offset = file.tell()
+        file.close()
+        return records, good_offset
 
+    async def recover(self):
+        """
+        Reads the leftover records from a rotated journal and the live one,
+        and opens the live journal for appending.
+        :return: The list of records, oldest first.
+        """
 
-class LanguageBot(discord.Client):
-    """
-    The meat of the program. Handles the discord bot, as well as
-    the background processes for handling the voting system.
-    Also has all of the languages instanced inside it.
-    """
+        old_records, _ = self.read_records(self.compacting_path)
+        records, good_offset = self.read_records(self.path)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.languages = []
-        self.prefix = '\\'  # What should be in front of commands. This also allows the users to *eventually* change it to prevent conflict with other bots.
-        self.run_task = self.loop.create_task(self.background_tasks())
-        if os.path.isfile("languages.cam"):
-            asyncio.get_event_loop().run_until_complete(self.load_languages())
+        self.file = open(self.path, 'ab')
+        self.file.truncate(good_offset)  # Drop a half written record so new ones don't land after garbage.
+
+        records = old_records + records
+        if len(records) > 0:
+            self.sequence = max(self.sequence, records[-1][0])
+        self.records_since_snapshot = len(records)
+        return records
 
-    async def save_languages(self):
+    async def append(self, kind, *args):
         """
-        Save all the languages to file so they are not lost.
+        Adds a record to the end of the journal.
+        :param kind: What sort of record this is. ("language", "amendment", or "resolve")
+        :param args: The data that goes with the record.
         :return: nothing.
         """
 
-        file = open("languages.cam", 'wb')
-        data = []
-        for language in self.languages:
-            data.append(await language.get_pickle_data())
-        pickle.dump(data, file)
-        file.close()
-        print("Saved File")
+        if self.file is None:
+            self.file = open(self.path, 'ab')
 
-    async def load_languages(self):
+        self.sequence += 1
+        data = pickle.dumps((self.sequence, kind) + args)
+        self.file.write(data)
+        self.bytes_written += len(data)
+        self.records_since_snapshot += 1
+        self.pending += 1
+
+        if self.pending >= self.batch_size:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.get_event_loop().create_task(self.delayed_flush())
+
+    async def delayed_flush(self):
         """
-        Load all the languages into memory from a file.
+        Waits a little so more records can join the batch, then flushes.
         :return: nothing.
         """
 
-        file = open("languages.cam", 'rb')
-        data = pickle.load(file)
-        for language_data in data:
-            new_language = Language()
-            await new_language.build_from_pickle_data(language_data)
-            self.languages.append(new_language)
-        file.close()
-        print("Loaded File")
+        await asyncio.sleep(self.flush_delay)
+        self.flush_task = None
+        await self.flush()
 
-    async def background_tasks(self):
+    async def flush(self):
         """
-        This method is initiated from the bot's constructor, and waits until
-        the bot is logged in and ready. This is essentially all the stuff that
-        needs to be done over and over constantly. (Voting, updating messages, etc.)
+        Pushes the written records to disk. The fsync runs off the event loop.
         :return: nothing.
         """
 
-        await self.wait_until_ready()
-        print("ready")
-
-        previous_time = time.time()
-        while self.is_ready():
-            # Get and reset the time.
-            time_difference = time.time() - previous_time
-            previous_time = time.time()
+        if self.file is None or self.pending == 0:
+            return
+        self.pending = 0
+        self.file.flush()
+        await asyncio.get_event_loop().run_in_executor(None, os.fsync, self.file.fileno())
 
-            for language in self.languages:
-                for amendment in language.amendments:
-                    amendment.time_remaining -= time_difference
-                    message = await self.get_channel(language.channel_id).fetch_message(amendment.voting_message_id)
+    async def rotate(self):
+        """
+        Moves the current journal aside so a snapshot can be taken. Records after
+        this go into a fresh journal.
+        :return: The sequence number the snapshot will cover.
+        """
 
-                    current_message_content = message.content
-                    current_message_content = current_message_content.replace(current_message_content[:current_message_content.find("\n")], "Time Remaining: " + str(round(amendment.time_remaining)))
+        await self.flush()
+        if self.file is not None:
+            self.file.close()
+        if os.path.isfile(self.path):
+            if os.path.isfile(self.compacting_path):  # A previous snapshot never finished, so keep its records too.
+                old_file = open(self.compacting_path, 'ab')
+                old_file.write(open(self.path, 'rb').read())
+                old_file.close()
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.compacting_path)
+        self.file = open(self.path, 'ab')
+        self.records_since_snapshot = 0
+        return self.sequence
+
+    async def finish_rotation(self):
+        """
+        Called once the snapshot is safely on disk. The rotated journal is no longer needed.
+        :return: nothing.
+        """
 
-                    await message.edit(content=current_message_content)
+        if os.path.isfile(self.compacting_path):
+            os.remove(self.compacting_path)
 
-                    if amendment.time_remaining <= 0:
-                        yes_votes = 0
-                        no_votes = 0
-                        # Get Both Reactions
 
-                        for reaction in message.reactions:
-                            if reaction.emoji == "✅":
-                                yes_votes = reaction.count - 1  # -1 Due to one made by the bot.
+def write_file_atomically(path, data):
+    """
+    Writes the data to a temporary file and swaps it in, so a crash never leaves a half written file.
+    :param path: The file to write.
+    :param data: The bytes to write.
+    :return: nothing.
+    """
 
-                            if reaction.emoji == "❌":
-                                no_votes = reaction.count - 1
+    temp_path = path + ".tmp"
+    file = open(temp_path, 'wb')
+    file.write(data)
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+    os.replace(temp_path, path)
 
-                        if yes_votes > no_votes:
-                            await make_change(amendment, language)
-                            language.amendments.remove(amendment)
-                            await self.save_languages()
-                            print("Made Change")
-                        else:
-                            language.amendments.remove(amendment)
-                            await self.save_languages()
-                            print("Rejected Change")
 
-                        await message.delete()
+class AmendmentScheduler:
+    """
+    AmendmentScheduler
 
-                if language.should_update_rules:
-                    new_message = "Language: " + language.name + "\nRules:\n"
-                    for index, rule in enumerate(language.rules):
-                        new_message += str(index + 1) + ": " + rule + "\n"
-                    message = await self.get_channel(language.channel_id).fetch_message(language.intro_message_id)
-                    await message.edit(content=new_message)
-                    language.should_update_rules = False
+    Min-heap of open amendments keyed on their deadlines, so the background
+    loop can sleep until the next vote actually ends instead of polling.
+    """
 
-            await asyncio.sleep(5)
+    def __init__(self):
+        self.heap = []  # (deadline, order, channel id, amendment)
+        self.order = itertools.count()  # Breaks ties between equal deadlines so amendments are never compared.
+        self.wake_event = asyncio.Event()
 
-    async def get_language_from_channel(self, channel_id):
+    def schedule(self, channel_id, amendment, when=None):
         """
-        Helper function that returns the language associated with a particular discord channel.
-        :param channel_id: id of the discord channel.
-        :return: The language associated.
+        Adds an amendment to the heap, waking the background loop if it now ends first.
+        :param channel_id: The channel of the amendment's language.
+        :param amendment: The amendment.
+        :param when: When it's due, if not at its deadline. (For retrying after a failure.)
+        :return: nothing.
         """
 
-        for language in self.languages:
-            if language.channel_id == channel_id:
-                return language
-        return None
+        heapq.heappush(self.heap, (amendment.deadline if when is None else when, next(self.order), channel_id, amendment))
+        if self.heap[0][3] is amendment:
+            self.wake_event.set()
 
-    async def on_message(self, message):
+    def next_deadline(self):
         """
-        This is a overwritten method from the Client base class. It is called
-        each time the bot sees someone send a message, which makes it perfect
-        for looking for commands.
-        :param message: The message sent. (discord.Message)
-        :return: nothing.
+        :return: The earliest deadline, or None if nothing is scheduled.
         """
 
-        if (message.content[:len(self.prefix)] == self.prefix) and (message.author.id != self.user.id):  # If the beginning of the message has the proper prefix.
+        if len(self.heap) == 0:
+            return None
+        return self.heap[0][0]
 
-            # PARSE THE COMMAND using functions and methods above.
-            total_command = message.content[len(self.prefix):]
-            command_list = get_command_list(total_command)
-            if command_list is None:
-                print("Error. Bad Commands.")
+    def pop_due(self, now):
+        """
+        Takes every amendment whose deadline has passed off the heap.
+        :param now: The current time.
+        :return: A list of (channel id, amendment) pairs, earliest first.
+        """
+
+        due = []
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            _, _, channel_id, amendment = heapq.heappop(self.heap)
+            due.append((channel_id, amendment))
+        return due
+
+    async def wait(self, timeout):
+        """
+        Sleeps until the timeout runs out or something new is scheduled.
+        :param timeout: Longest time to sleep, in seconds. None to sleep until woken.
+        :return: nothing.
+        """
+
+        if timeout is not None and timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(self.wake_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.wake_event.clear()
+
+
+class VoteTally:
+    """
+    VoteTally
+
+    Live count of the votes on one amendment, kept up to date from reaction events.
+    A stale tally can't be trusted and has to be recounted from the message.
+    """
+
+    def __init__(self, stale=False):
+        self.yes_votes = 0
+        self.no_votes = 0
+        self.stale = stale
+
+    def count_reaction(self, emoji, amount):
+        """
+        Adds (or takes away) a vote.
+        :param emoji: The emoji reacted with. Anything but ✅ and ❌ is ignored.
+        :param amount: 1 for an added reaction, -1 for a removed one.
+        :return: nothing.
+        """
+
+        if emoji == "✅":
+            self.yes_votes += amount
+        elif emoji == "❌":
+            self.no_votes += amount
+
+        if self.yes_votes < 0 or self.no_votes < 0:  # Must have missed an event somewhere.
+            self.stale = True
+
+
+SPACE_PATTERN = re.compile(r"\s*")  # What can go between parameters.
+ESCAPES_PATTERN = re.compile(r'(?:\\["\\])+')  # A run of escaped quotes and backslashes.
+
+
+class CommandParseError(Exception):
+    """
+    CommandParseError
+
+    Raised when a command can't be understood. Says what went wrong and where.
+    """
+
+    def __init__(self, reason, position=None):
+        self.reason = reason
+        self.position = position
+        if position is None:
+            super().__init__(reason)
+        else:
+            super().__init__(reason + " (at character " + str(position + 1) + ")")
+
+
+def get_command_list(full_command):
+    """
+    Helper function that splits a command into the command name and its quoted parameters
+    in one pass over the string. Inside quotes, \\" is a quote and \\\\ is a backslash.
+    It jumps from one quote or backslash to the next with str.find, so everything else is copied in slices.
+    :param full_command: The raw command minus the prefix.
+    :return: A list of the command and its parameters.
+    :raises CommandParseError: If the quotes don't line up.
+    """
+
+    first_quote_index = full_command.find('"')
+    if first_quote_index == -1:
+        return [full_command.replace(' ', '')]
+    command_list = [full_command[:first_quote_index].replace(' ', '')]  # The first command can never have spaces.
+
+    index = first_quote_index
+    length = len(full_command)
+    next_quote = first_quote_index
+    next_backslash = full_command.find("\\")  # Both kept from one find to the next, so no stretch is searched twice.
+    while True:
+        if index < length and full_command[index].isspace():
+            index = SPACE_PATTERN.match(full_command, index).end()
+        if index == length:
+            return command_list
+        if full_command[index] != '"':
+            raise CommandParseError("Parameters have to be in quotes", index)
+
+        quote_start = index
+        index += 1
+        piece_start = index
+        pieces = []  # Slices of the parameter, and the characters its escapes stand for.
+        while True:
+            if next_quote < index:
+                next_quote = full_command.find('"', index)
+                if next_quote == -1:
+                    raise CommandParseError("Quote is never closed", quote_start)
+            if next_backslash != -1 and next_backslash < index:
+                next_backslash = full_command.find("\\", index)
+            if next_backslash == -1 or next_quote < next_backslash:
+                pieces.append(full_command[piece_start:next_quote])
+                index = next_quote + 1
+                break
+
+            escapes = ESCAPES_PATTERN.match(full_command, next_backslash)
+            if escapes is None:
+                index = next_backslash + 1  # A backslash before anything else is just a backslash.
+            else:
+                pieces.append(full_command[piece_start:next_backslash])
+                pieces.append(escapes.group()[1::2])  # Every other character of a run of escapes is the one it stands for.
+                index = piece_start = escapes.end()
+        command_list.append("".join(pieces))
+
+
+class Argument:
+    """
+    Argument
+
+    Describes one parameter of a command: what it's called and how to convert it.
+    """
+
+    def __init__(self, name, converter=str, default=None, required=True, variadic=False):
+        self.name = name
+        self.converter = converter  # Turns the parameter's text into its value. Raises ValueError if it can't.
+        self.default = default
+        self.required = required
+        self.variadic = variadic  # Takes every parameter left over, as a list.
+
+    def convert(self, text):
+        try:
+            return self.converter(text)
+        except ValueError:
+            raise CommandParseError('"' + text + '" is not a valid ' + self.name.replace("_", " "))
+
+
+class Command:
+    """
+    Command
+
+    One entry of the bot's command table. Either a handler that runs right away,
+    or the type of change to put up for a vote.
+    """
+
+    def __init__(self, name, arguments=(), handler=None, change_type=None):
+        self.name = name
+        self.arguments = arguments
+        self.handler = handler
+        self.change_type = change_type
+
+    def parse_arguments(self, parameters):
+        """
+        Matches the parameters up with the arguments and converts them.
+        :param parameters: The parameters from get_command_list, minus the command name.
+        :return: A dictionary of argument name -> value.
+        :raises CommandParseError: If there are too many or too few, or one can't be converted.
+        """
+
+        values = {}
+        index = 0
+        for argument in self.arguments:
+            if argument.variadic:
+                values[argument.name] = [argument.convert(parameter) for parameter in parameters[index:]]
+                index = len(parameters)
+            elif index < len(parameters):
+                values[argument.name] = argument.convert(parameters[index])
+                index += 1
+            elif argument.required:
+                raise CommandParseError(self.name + " is missing " + argument.name.replace("_", " "))
+            else:
+                values[argument.name] = argument.default
+
+        if index < len(parameters):
+            raise CommandParseError("Too many parameters for " + self.name)
+        return values
+
+
+async def make_change(change, language):
+    """
+    Modifies the language in accordance to the change presented.
+    This is what is called when the changes are ready to be put into place from voting.
+    :param change: The change that is about to happen, including all the data needed to know what to do.
+    :param language: The language to modify.
+    :return: The VersionDelta recording what the change overwrote.
+    """
+
+    change_type = change.change_type
+    payload = change.payload
+    delta = VersionDelta(language.version + 1, " ".join(change.get_voting_text().replace("Change:", "").split())[:200])
+    language.recording = delta
+
+    # Proposals are checked for duplicates, but amendments saved before that, or a word renamed
+    # since, could still clash. Every word's text has to be different, so those are skipped.
+    if change_type == ChangeType.ADDWORD:
+        if await language.get_word(payload.text) is not None:
+            print('Skipped adding "' + payload.text + '". It is already a word.')
+        else:
+            new_word = Word(payload.text, payload.pronunciation, payload.definition)
+            await language.add_word(new_word)
+            for related_text in payload.related_words:
+                related_word = await language.get_word(related_text)
+                if related_word is not None:
+                    await language.relate_words(new_word, related_word)
+
+    elif change_type == ChangeType.EDITWORD:
+        word = await language.get_word(payload.text)
+        if payload.parameter == "text" and await language.get_word(payload.modification) not in (None, word):
+            print('Skipped renaming "' + payload.text + '" to "' + payload.modification + '". It is already a word.')
+        elif word is not None:
+            await language.edit_word(word, payload.parameter, payload.modification)
+
+    elif change_type == ChangeType.REMOVEWORD:
+        word = await language.get_word(payload.text)
+        if word is not None:
+            await language.remove_word(word)
+
+    elif change_type == ChangeType.ADDRULE:
+        language.remember_rules()
+        language.rules.append(payload.rule_desc)
+        language.should_update_rules = True
+
+    elif change_type == ChangeType.EDITRULE:
+        if 1 <= payload.rule_number <= len(language.rules):
+            language.remember_rules()
+            language.rules[payload.rule_number - 1] = payload.rule_desc
+            language.should_update_rules = True
+
+    elif change_type == ChangeType.REMOVERULE:
+        if 1 <= payload.rule_number <= len(language.rules):
+            language.remember_rules()
+            del language.rules[payload.rule_number - 1]
+            language.should_update_rules = True
+
+    elif change_type == ChangeType.CHANGENAME:
+        language.remember_name()
+        language.name = payload.new_name
+        language.should_update_rules = True
+
+    elif change_type == ChangeType.ADDRELATEDWORD:
+        word = await language.get_word(payload.text)
+        related_word = await language.get_word(payload.related_word_text)
+        if (word is not None) and (related_word is not None):
+            await language.relate_words(word, related_word)
+
+    elif change_type == ChangeType.REMOVERELATEDWORD:
+        word = await language.get_word(payload.text)
+        related_word = await language.get_word(payload.related_word_text)
+        if (word is not None) and (related_word is not None):
+            await language.unrelate_words(word, related_word)
+
+    elif change_type == ChangeType.BULKADDWORD:
+        await language.add_words(payload.words)
+
+    elif change_type == ChangeType.REVERT:
+        await language.revert_to(payload.version)
+
+    language.recording = None
+    language.version = delta.version
+    language.history.add(delta)
+    return delta
+
+
+class PickleStorage:
+    """
+    PickleStorage
+
+    Storage backend that keeps every language in memory, with a pickled
+    snapshot (languages.cam) plus a journal of the changes made since.
+    This is the original file format, so it is also what the migrator reads from.
+    """
+
+    def __init__(self, snapshot_path="languages.cam", journal_path="languages.journal"):
+        self.snapshot_path = snapshot_path
+        self.journal = ChangeJournal(journal_path)
+        self.languages = {}  # Channel id -> Language. Everything is loaded, so lazy loading only saves lookups.
+        self.compact_threshold = 1000  # Journal records to allow before folding them into a new snapshot.
+        self.compact_task = None
+        self.snapshot_bytes_written = 0
+
+    @property
+    def bytes_written(self):
+        return self.journal.bytes_written + self.snapshot_bytes_written
+
+    async def exists(self):
+        """
+        :return: Whether there is anything on disk for this storage.
+        """
+
+        return os.path.isfile(self.snapshot_path) or os.path.isfile(self.journal.path)
+
+    async def open(self):
+        """
+        Load all the languages into memory from the last snapshot,
+        then replay the journal on top of it.
+        :return: nothing.
+        """
+
+        sequence = 0
+        if os.path.isfile(self.snapshot_path):
+            file = open(self.snapshot_path, 'rb')
+            data = pickle.load(file)
+            file.close()
+            if isinstance(data, list):  # Files from before the journal are just the list of languages.
+                data = {"sequence": 0, "languages": data}
+            sequence = data["sequence"]
+            self.journal.sequence = sequence
+            for language_data in data["languages"]:
+                new_language = Language()
+                await new_language.build_from_pickle_data(language_data)
+                self.languages[new_language.channel_id] = new_language
+            print("Loaded File")
+
+        replayed = 0
+        for record in await self.journal.recover():
+            if record[0] > sequence:  # Anything at or before the snapshot's sequence is already in it.
+                await self.replay_record(record)
+                replayed += 1
+        if replayed > 0:
+            print("Replayed " + str(replayed) + " journal records")
+
+    async def replay_record(self, record):
+        """
+        Applies a journal record to the languages in memory.
+        :param record: The record to apply. (sequence, kind, data...)
+        :return: nothing.
+        """
+
+        kind = record[1]
+        if kind == "language":
+            new_language = Language()
+            await new_language.build_from_pickle_data(record[2])
+            self.languages[new_language.channel_id] = new_language
+
+        elif kind == "amendment":
+            language = self.languages.get(record[2])
+            if language is not None:
+                language.amendments.append(record[3])
+                await language.reserve_texts(record[3].get_new_texts())
+
+        elif kind == "resolve":
+            language = self.languages.get(record[2])
+            if language is not None:
+                for amendment in language.amendments:
+                    if amendment.voting_message_id == record[3]:
+                        language.amendments.remove(amendment)
+                        await language.release_texts(amendment.get_new_texts())
+                        if record[4]:
+                            await make_change(amendment, language)
+                        break
+
+    async def channel_ids(self):
+        """
+        :return: The channel ids of every stored language.
+        """
+
+        return set(self.languages)
+
+    async def active_channel_ids(self):
+        """
+        :return: The channel ids of languages with amendments waiting on a vote.
+        """
+
+        return set(channel_id for channel_id, language in self.languages.items() if len(language.amendments) > 0)
+
+    async def load_language(self, channel_id):
+        """
+        :param channel_id: The channel of the language to load.
+        :return: The language, or None if there isn't one.
+        """
+
+        return self.languages.get(channel_id)
+
+    async def add_language(self, language):
+        """
+        Stores a whole language, including its words, rules and amendments.
+        :param language: The language to store.
+        :return: nothing.
+        """
+
+        self.languages[language.channel_id] = language
+        await self.record("language", await language.get_pickle_data())
+
+    async def add_amendment(self, language, change):
+        """
+        Stores a newly proposed amendment.
+        :param language: The language the amendment is for.
+        :param change: The amendment.
+        :return: nothing.
+        """
+
+        await self.record("amendment", language.channel_id, change)
+
+    async def resolve_amendment(self, language, change, accepted):
+        """
+        Stores the outcome of a vote. The change has already been made to the language in memory.
+        :param language: The language the amendment was for.
+        :param change: The amendment.
+        :param accepted: Whether the change was made.
+        :return: nothing.
+        """
+
+        await self.record("resolve", language.channel_id, change.voting_message_id, accepted)
+
+    async def record(self, kind, *args):
+        """
+        Journals something that changed the languages, and starts a snapshot if the journal is getting long.
+        :param kind: What sort of record this is. ("language", "amendment", or "resolve")
+        :param args: The data that goes with the record.
+        :return: nothing.
+        """
+
+        await self.journal.append(kind, *args)
+        if self.journal.records_since_snapshot >= self.compact_threshold and self.compact_task is None:
+            self.compact_task = asyncio.get_event_loop().create_task(self.compact())
+
+    async def save(self):
+        """
+        Save a snapshot of all the languages to file. The journal is rotated first
+        so anything that happens while the snapshot is written goes into the new journal.
+        :return: nothing.
+        """
+
+        sequence = await self.journal.rotate()
+        data = {"sequence": sequence, "languages": []}
+        for language in self.languages.values():
+            data["languages"].append(await language.get_pickle_data())
+        data = pickle.dumps(data)  # Pickled here so nothing changes underneath it, but written off the event loop.
+        await asyncio.get_event_loop().run_in_executor(None, write_file_atomically, self.snapshot_path, data)
+        self.snapshot_bytes_written += len(data)
+        await self.journal.finish_rotation()
+        print("Saved File")
+
+    async def compact(self):
+        """
+        Takes a snapshot in the background once the journal has grown long enough.
+        :return: nothing.
+        """
+
+        try:
+            await self.save()
+        finally:
+            self.compact_task = None
+
+    async def close(self):
+        """
+        Makes sure the journal is on disk.
+        :return: nothing.
+        """
+
+        await self.journal.flush()
+
+
+class SQLiteStorage:
+    """
+    SQLiteStorage
+
+    Storage backend that keeps languages in a SQLite database with indexed
+    tables for words, rules, related words and amendments. Languages are only
+    read in when asked for, and saving only touches the rows a change affects.
+    All database work runs on one worker thread so the event loop never waits on disk.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS languages (
+            channel_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            intro_message_id INTEGER,
+            version INTEGER NOT NULL DEFAULT 0,
+            next_word_id INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS rules (
+            channel_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (channel_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS words (
+            id INTEGER PRIMARY KEY,
+            channel_id INTEGER NOT NULL,
+            word_id INTEGER,
+            text TEXT NOT NULL,
+            pronunciation TEXT NOT NULL,
+            definition TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS words_by_text ON words (channel_id, text);
+        CREATE TABLE IF NOT EXISTS related_words (
+            word_id INTEGER NOT NULL,
+            related_id INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS related_words_by_word ON related_words (word_id);
+        CREATE INDEX IF NOT EXISTS related_words_by_related ON related_words (related_id);
+        CREATE TABLE IF NOT EXISTS amendments (
+            channel_id INTEGER NOT NULL,
+            voting_message_id INTEGER NOT NULL,
+            data BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS amendments_by_channel ON amendments (channel_id);
+        CREATE INDEX IF NOT EXISTS amendments_by_message ON amendments (voting_message_id);
+        CREATE TABLE IF NOT EXISTS history (
+            channel_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (channel_id, version)
+        );
+    """
+
+    # Columns added after the first version of the schema, and what they're added as.
+    added_columns = [
+        ("words", "word_id", "INTEGER"),
+        ("languages", "version", "INTEGER NOT NULL DEFAULT 0"),
+        ("languages", "next_word_id", "INTEGER"),
+    ]
+
+    def __init__(self, path="languages.db"):
+        self.path = path
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1)  # One thread, so the connection is never used twice at once.
+        self.bytes_written = 0  # Size of the values written to the database, not counting SQLite's own overhead.
+        self.shard_name = None  # Set when the database is shared by several processes. Changes are only saved for languages this one owns.
+
+    async def run(self, function, *args):
+        """
+        Runs a blocking database function on the storage's worker thread.
+        :param function: The function to run.
+        :param args: Arguments for the function.
+        :return: Whatever the function returned.
+        """
+
+        return await asyncio.get_event_loop().run_in_executor(self.executor, function, *args)
+
+    async def exists(self):
+        """
+        :return: Whether there is anything on disk for this storage.
+        """
+
+        return os.path.isfile(self.path)
+
+    async def open(self):
+        """
+        Connects to the database and makes sure the tables are there.
+        :return: nothing.
+        """
+
+        await self.run(self.open_blocking)
+
+    def open_blocking(self):
+        self.connection = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)  # Waits for other processes sharing the file.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(self.schema)
+        with self.connection:
+            for table, column, definition in self.added_columns:
+                if column not in set(row[1] for row in self.connection.execute("PRAGMA table_info(" + table + ")")):
+                    self.connection.execute("ALTER TABLE " + table + " ADD COLUMN " + column + " " + definition)
+
+            # Words saved before they kept their ids get numbered the way they used to be when loaded: in order, per language.
+            next_ids = {}
+            for database_id, channel_id in self.connection.execute("SELECT id, channel_id FROM words WHERE word_id IS NULL ORDER BY id").fetchall():
+                if channel_id not in next_ids:
+                    next_ids[channel_id] = self.connection.execute("SELECT COALESCE(MAX(word_id) + 1, 0) FROM words WHERE channel_id = ?", (channel_id,)).fetchone()[0]
+                self.connection.execute("UPDATE words SET word_id = ? WHERE id = ?", (next_ids[channel_id], database_id))
+                next_ids[channel_id] += 1
+            self.connection.execute("CREATE INDEX IF NOT EXISTS words_by_word_id ON words (channel_id, word_id)")
+
+    def set_shard_name(self, name):
+        self.shard_name = name
+
+    def check_shard_owner(self, channel_id):
+        if self.shard_name is not None:
+            check_owner(self.connection, self.shard_name, channel_id)
+
+    async def channel_ids(self):
+        """
+        :return: The channel ids of every stored language.
+        """
+
+        return await self.run(self.select_channel_ids, "SELECT channel_id FROM languages")
+
+    async def active_channel_ids(self):
+        """
+        :return: The channel ids of languages with amendments waiting on a vote.
+        """
+
+        return await self.run(self.select_channel_ids, "SELECT DISTINCT channel_id FROM amendments")
+
+    def select_channel_ids(self, query):
+        return set(row[0] for row in self.connection.execute(query))
+
+    async def load_language(self, channel_id):
+        """
+        Reads one language out of the database.
+        :param channel_id: The channel of the language to load.
+        :return: The language, or None if there isn't one.
+        """
+
+        data = await self.run(self.load_language_blocking, channel_id)
+        if data is None:
+            return None
+        data[5] = [pickle.loads(amendment_data) for amendment_data in data[5]]  # Unpickled here, not on the worker thread.
+        data[9] = [pickle.loads(delta_data) for delta_data in data[9]]
+        language = Language()
+        await language.build_from_pickle_data(data)
+        return language
+
+    def load_language_blocking(self, channel_id):
+        row = self.connection.execute("SELECT name, intro_message_id, version, next_word_id FROM languages WHERE channel_id = ?", (channel_id,)).fetchone()
+        if row is None:
+            return None
+        name, intro_message_id, version, next_word_id = row
+
+        rules = [rule for rule, in self.connection.execute("SELECT text FROM rules WHERE channel_id = ? ORDER BY position", (channel_id,))]
+
+        words = []
+        word_ids = {}  # Database id -> id in the language.
+        for database_id, word_id, text, pronunciation, definition in self.connection.execute("SELECT id, word_id, text, pronunciation, definition FROM words WHERE channel_id = ? ORDER BY word_id", (channel_id,)):
+            word = Word(text, pronunciation, definition)
+            word.id = word_id
+            words.append(word)
+            word_ids[database_id] = word.id
+        if next_word_id is None:
+            next_word_id = words[-1].id + 1 if len(words) > 0 else 0
+
+        edges = []
+        for word_id, related_id in self.connection.execute("SELECT related_words.word_id, related_words.related_id FROM related_words "
+                                                           "JOIN words ON words.id = related_words.word_id WHERE words.channel_id = ?", (channel_id,)):
+            if word_id in word_ids and related_id in word_ids:
+                edges.append((word_ids[word_id], word_ids[related_id]))
+
+        amendments = [data for data, in self.connection.execute("SELECT data FROM amendments WHERE channel_id = ? ORDER BY rowid", (channel_id,))]
+        history = [data for data, in self.connection.execute("SELECT data FROM history WHERE channel_id = ? ORDER BY version", (channel_id,))]
+
+        return [name, words, channel_id, rules, intro_message_id, amendments, edges, next_word_id, version, history]
+
+    async def add_language(self, language):
+        """
+        Stores a whole language, including its words, rules and amendments.
+        :param language: The language to store.
+        :return: nothing.
+        """
+
+        data = await language.get_pickle_data()
+        data[5] = [(amendment.voting_message_id, pickle.dumps(amendment)) for amendment in data[5]]  # Pickled here, not on the worker thread.
+        data[9] = [(delta_data[0], pickle.dumps(delta_data)) for delta_data in data[9]]
+        await self.run(self.add_language_blocking, data)
+
+    def add_language_blocking(self, data):
+        name, words, channel_id, rules, intro_message_id, amendments, edges, next_word_id, version, history = data
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO languages (channel_id, name, intro_message_id, version, next_word_id) VALUES (?, ?, ?, ?, ?)",
+                                    (channel_id, name, intro_message_id, version, next_word_id))
+            self.check_shard_owner(channel_id)
+            self.write_rules(channel_id, rules)
+
+            database_ids = {}  # Id in the language -> database id.
+            for word in words:
+                database_ids[word.id] = self.insert_word(channel_id, word)
+            self.connection.executemany("INSERT INTO related_words (word_id, related_id) VALUES (?, ?)",
+                                        [(database_ids[word_id], database_ids[related_id]) for word_id, related_id in edges])
+
+            for voting_message_id, amendment_data in amendments:
+                self.insert_amendment(channel_id, voting_message_id, amendment_data)
+            for delta_version, delta_data in history:
+                self.insert_history(channel_id, delta_version, delta_data)
+
+    async def add_amendment(self, language, change):
+        """
+        Stores a newly proposed amendment.
+        :param language: The language the amendment is for.
+        :param change: The amendment.
+        :return: nothing.
+        """
+
+        await self.run(self.add_amendment_blocking, language.channel_id, change.voting_message_id, pickle.dumps(change))
+
+    def add_amendment_blocking(self, channel_id, voting_message_id, data):
+        with self.connection:
+            self.insert_amendment(channel_id, voting_message_id, data)
+            self.check_shard_owner(channel_id)
+
+    async def resolve_amendment(self, language, change, accepted):
+        """
+        Stores the outcome of a vote by removing the amendment and, if it passed,
+        writing just the rows that the change touched. The change's VersionDelta
+        says which ones those are, whatever type of change it was.
+        :param language: The language the amendment was for. (Already changed in memory.)
+        :param change: The amendment.
+        :param accepted: Whether the change was made.
+        :return: nothing.
+        """
+
+        changes = None
+        if accepted:
+            delta = language.history.deltas[-1]  # make_change just recorded it.
+            words = []
+            for word_id in delta.words:
+                word = language.words.get(word_id)
+                words.append((word_id, None if word is None else (word.text, word.pronunciation, word.definition)))
+            related = [(word_id, tuple(language.related.get(word_id, ()))) for word_id in delta.related]
+            rules = None if delta.rules is None else list(language.rules)
+            changes = (language.name, rules, language.version, language.next_word_id, words, related, pickle.dumps(delta.get_data()))
+        await self.run(self.resolve_amendment_blocking, language.channel_id, change.voting_message_id, changes)
+
+    def resolve_amendment_blocking(self, channel_id, voting_message_id, changes):
+        with self.connection:
+            self.connection.execute("DELETE FROM amendments WHERE channel_id = ? AND voting_message_id = ?", (channel_id, voting_message_id))
+            self.check_shard_owner(channel_id)
+            if changes is None:
                 return
 
-            # EXECUTE THE COMMAND
-            main_command = command_list[0]
-            if main_command == "createlanguage" and len(command_list) == 2:  # Create a Language.
-                if await self.get_language_from_channel(message.channel.id) is None:
-                    new_language = Language(name=command_list[1])
-                    new_language.channel_id = message.channel.id
-
-                    # Send and remember two messages for rules and amendments.
-                    intro_message = await message.channel.send("Language: " + new_language.name + "\nRules:\n")
-                    new_language.intro_message_id = intro_message.id
-
-                    # Pin those messages.
-                    # await intro_message.pin()
-
-                    self.languages.append(new_language)
-                    await self.save_languages()
-                    print("Created new language: " + new_language.name)
+            name, rules, version, next_word_id, words, related, delta_data = changes
+            self.connection.execute("UPDATE languages SET name = ?, version = ?, next_word_id = ? WHERE channel_id = ?", (name, version, next_word_id, channel_id))
+            self.count_bytes(name)
+            if rules is not None:
+                self.write_rules(channel_id, rules)
+
+            for word_id, state in words:
+                database_id = self.find_database_id(channel_id, word_id)
+                if state is None:
+                    if database_id is not None:
+                        self.connection.execute("DELETE FROM words WHERE id = ?", (database_id,))
+                        self.connection.execute("DELETE FROM related_words WHERE word_id = ? OR related_id = ?", (database_id, database_id))
+                elif database_id is None:
+                    word = Word(state[0], state[1], state[2])
+                    word.id = word_id
+                    self.insert_word(channel_id, word)
                 else:
-                    print("Could not create language. Channel already has one.")
-            elif main_command == "dictionary":  # Send user a text file dictionary of the language.
-                language = await self.get_language_from_channel(message.channel.id)
-                if language is not None:
-                    file = open("dictionary.txt", 'w')
-                    file.write(language.name + "\nRules:\n")
-                    for index, rule in enumerate(language.rules):
-                        file.write(str(index + 1) + ": " + rule + "\n")
-                    file.write("--------------------------\nWords:\n")
-                    for word in language.words:
-                        file.write(word.text + "\nPronunciation: " + word.pronunciation + "\nDefinition: " + word.definition + "\nRelated Words: ")
+                    self.connection.execute("UPDATE words SET text = ?, pronunciation = ?, definition = ? WHERE id = ?", (state[0], state[1], state[2], database_id))
+                    self.count_bytes(*state)
+
+            # Both ends of a changed relation are in the delta, so each word's rows can just be rewritten.
+            for word_id, related_ids in related:
+                database_id = self.find_database_id(channel_id, word_id)
+                if database_id is None:
+                    continue
+                self.connection.execute("DELETE FROM related_words WHERE word_id = ? OR related_id = ?", (database_id, database_id))
+                for related_id in related_ids:
+                    related_database_id = self.find_database_id(channel_id, related_id)
+                    if related_database_id is not None:
+                        self.relate_words(database_id, related_database_id)
+
+            self.insert_history(channel_id, version, delta_data)
+
+    def relate_words(self, word_id, related_id):
+        # Relations go both ways, so one row covers both directions.
+        if word_id == related_id:
+            return
+        existing = self.connection.execute("SELECT 1 FROM related_words WHERE (word_id = ? AND related_id = ?) OR (word_id = ? AND related_id = ?)", (word_id, related_id, related_id, word_id)).fetchone()
+        if existing is None:
+            self.connection.execute("INSERT INTO related_words (word_id, related_id) VALUES (?, ?)", (word_id, related_id))
+
+    def write_rules(self, channel_id, rules):
+        self.connection.execute("DELETE FROM rules WHERE channel_id = ?", (channel_id,))
+        self.connection.executemany("INSERT INTO rules (channel_id, position, text) VALUES (?, ?, ?)", [(channel_id, index, rule) for index, rule in enumerate(rules)])
+        self.count_bytes(*rules)
+
+    def insert_word(self, channel_id, word):
+        cursor = self.connection.execute("INSERT INTO words (channel_id, word_id, text, pronunciation, definition) VALUES (?, ?, ?, ?, ?)", (channel_id, word.id, word.text, word.pronunciation, word.definition))
+        self.count_bytes(word.text, word.pronunciation, word.definition)
+        return cursor.lastrowid
+
+    def find_database_id(self, channel_id, word_id):
+        row = self.connection.execute("SELECT id FROM words WHERE channel_id = ? AND word_id = ?", (channel_id, word_id)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def insert_amendment(self, channel_id, voting_message_id, data):
+        self.connection.execute("INSERT INTO amendments (channel_id, voting_message_id, data) VALUES (?, ?, ?)", (channel_id, voting_message_id, data))
+        self.count_bytes(data)
+
+    def insert_history(self, channel_id, version, data):
+        self.connection.execute("INSERT OR REPLACE INTO history (channel_id, version, data) VALUES (?, ?, ?)", (channel_id, version, data))
+        self.count_bytes(data)
+
+    def count_bytes(self, *values):
+        for value in values:
+            self.bytes_written += len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+
+    async def close(self):
+        """
+        Closes the database.
+        :return: nothing.
+        """
+
+        if self.connection is not None:
+            await self.run(self.connection.close)
+            self.connection = None
+
+
+async def migrate_storage(source, destination):
+    """
+    One-shot copy of every language from one storage backend to another.
+    Used to move the old languages.cam pickle file into SQLite.
+    :param source: The storage to read from. (Already opened.)
+    :param destination: The storage to write to. (Already opened.)
+    :return: The number of languages copied.
+    """
+
+    count = 0
+    for channel_id in await source.channel_ids():
+        language = await source.load_language(channel_id)
+        if language is not None:
+            await destination.add_language(language)
+            count += 1
+    return count
+
+
+class LanguageBot(discord.Client):
+    """
+    The meat of the program. Handles the discord bot, as well as
+    the background processes for handling the voting system.
+    Also has all of the languages instanced inside it.
+    """
+
+    def __init__(self, *args, storage=None, metrics_port=9108, shard_name=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = MetricsRegistry()
+        self.command_latency = self.metrics.histogram("languagebot_command_seconds", "Time taken to handle each command.", ["command"])
+        self.command_errors = self.metrics.counter("languagebot_command_errors_total", "Commands that couldn't be parsed.")
+        self.background_latency = self.metrics.histogram("languagebot_background_pass_seconds", "Time taken by each pass of the background loop.")
+        self.api_latency = self.metrics.histogram("languagebot_api_seconds", "Time taken by Discord API calls. The count is the number of calls.", ["endpoint"])
+        self.save_latency = self.metrics.histogram("languagebot_save_seconds", "Time taken to save changes to storage.", ["operation"])
+        self.metrics.counter("languagebot_storage_bytes_written_total", "Bytes written by the storage backend.", collect=self.collect_bytes_written)
+        self.metrics.gauge("languagebot_backlog", "Work waiting on the background loop.", ["queue"], collect=self.collect_backlog)
+        self.metrics.gauge("languagebot_language_words", "Words in each loaded language.", ["channel", "language"], collect=self.collect_word_counts)
+        self.metrics.gauge("languagebot_language_amendments", "Amendments being voted on in each loaded language.", ["channel", "language"], collect=self.collect_amendment_counts)
+        self.metrics_server = None if metrics_port is None else MetricsServer(self.metrics, port=metrics_port)  # None to not serve metrics at all.
+        self.profiler = SamplingProfiler()
+        self.languages = []  # Only the languages that are loaded right now.
+        self.language_index = {}  # Channel id -> Language, so incoming messages don't scan every language.
+        self.language_channels = set()  # Channel ids of every stored language, loaded or not.
+        self.language_last_used = {}  # Channel id -> time the language was last needed.
+        self.loading_languages = {}  # Channel id -> task loading that language, so it's only read once.
+        self.idle_timeout = 1800.0  # Seconds a language can go unused before it is unloaded.
+        self.scheduler = AmendmentScheduler()
+        self.resolve_tasks = {}  # Channel id -> task resolving that language's due amendments. One per language, so they stay in order.
+        self.due_amendments = {}  # Channel id -> list of due amendments waiting for that task.
+        self.resolve_semaphore = asyncio.Semaphore(8)  # Most languages resolving votes at once.
+        self.api_timeout = 10.0  # Seconds the background work waits on a slow channel before moving on.
+        self.retry_delay = 30.0  # Seconds before trying again to resolve a vote whose channel timed out.
+        self.countdown_interval = 5.0  # Seconds between updates of the "Time Remaining" lines.
+        self.edit_queue = MessageEditQueue(self, latency_histogram=self.api_latency, timeout=self.api_timeout)
+        self.open_votes = {}  # Voting message id -> (language, amendment) for every amendment being voted on.
+        self.vote_tallies = {}  # Voting message id -> VoteTally
+        self.quorum = None  # Votes on one side that end a vote early. None to always wait for the deadline.
+        self.commands = {}  # Command name -> Command
+        self.register_commands()
+        self.edit_task = self.loop.create_task(self.edit_queue.run())
+        self.prefix = '\\'  # What should be in front of commands. This also allows the users to *eventually* change it to prevent conflict with other bots.
+        if storage is None:
+            storage = SQLiteStorage("languages.db")
+        self.storage = storage
+
+        # When several processes share the database, each only handles the languages in the partitions it owns.
+        self.membership = None
+        self.membership_task = None
+        if shard_name is not None:
+            if getattr(storage, "path", None) is None:
+                raise ValueError("Running as a shard needs SQLiteStorage, so every process shares the same database.")
+            self.membership = ShardMembership(storage.path, shard_name)
+            storage.set_shard_name(shard_name)  # So storage refuses to save changes to languages that were handed over.
+            self.membership_task = self.loop.create_task(self.sync_membership())
+
+        self.run_task = self.loop.create_task(self.background_tasks())
+        asyncio.get_event_loop().run_until_complete(self.load_languages())
+
+    async def load_languages(self):
+        """
+        Opens the storage and loads the languages that need to be in memory right away
+        (the ones with votes going on). Everything else is loaded when its channel is used.
+        The first time SQLite storage is used, the old languages.cam file is migrated into it.
+        :return: nothing.
+        """
+
+        is_new = not await self.storage.exists()
+        await self.storage.open()
+        if is_new and isinstance(self.storage, SQLiteStorage):
+            old_storage = PickleStorage()
+            if await old_storage.exists():
+                await old_storage.open()
+                count = await migrate_storage(old_storage, self.storage)
+                await old_storage.close()
+                print("Migrated " + str(count) + " languages from languages.cam")
+
+        self.language_channels = await self.storage.channel_ids()
+        for channel_id in await self.storage.active_channel_ids():
+            if self.owns_channel(channel_id):
+                await self.get_language_from_channel(channel_id)
+        print("Loaded Languages")
+
+    def owns_channel(self, channel_id):
+        """
+        :param channel_id: A channel id.
+        :return: Whether this process handles that channel's language. Always true unless running as a shard.
+        """
+
+        return self.membership is None or self.membership.owns(channel_id)
+
+    async def sync_membership(self):
+        """
+        Runs for as long as the bot does when it's a shard, taking and handing over partitions.
+        :return: nothing.
+        """
+
+        while True:
+            try:
+                await self.update_membership()
+            except Exception as error:  # The database being busy for a moment shouldn't stop the heartbeats for good.
+                print("Error syncing shard membership: " + repr(error))
+            await asyncio.sleep(self.membership.heartbeat_interval)
+
+    async def update_membership(self):
+        """
+        Drops the languages in partitions this process is giving up, then lets the partitions go.
+        Loads the languages with votes going on in partitions it just took.
+        :return: nothing.
+        """
+
+        gained, lost = await self.membership.sync()
+        if len(lost) > 0:
+            await self.drop_unowned_languages()
+            await self.membership.release(lost)
+            print("Handed over partitions " + str(sorted(lost)))
+
+        if len(gained) > 0:
+            self.language_channels = await self.storage.channel_ids()  # Other processes may have made languages since.
+            for channel_id in await self.storage.active_channel_ids():
+                if self.owns_channel(channel_id):
+                    await self.get_language_from_channel(channel_id)
+            print("Took partitions " + str(sorted(gained)))
+
+    async def drop_unowned_languages(self):
+        for language in list(self.languages):
+            if not self.owns_channel(language.channel_id):
+                await self.drop_language(language)
+
+    async def lose_language(self, language):
+        """
+        Called when storage wouldn't save a change because the language's partition was taken away,
+        which only happens if this process stalled for longer than the coordinator waits. Drops
+        everything in that partition without saving, since the new owner has the stored copy.
+        :param language: The language whose change wasn't saved.
+        :return: nothing.
+        """
+
+        print("Error. " + language.name + " was handed over to another process while this one was stalled. Dropping it.")
+        self.membership.forget(language.channel_id)
+        await self.drop_unowned_languages()
+
+    async def drop_language(self, language):
+        """
+        Forgets a language and its votes, once whatever is changing it has been saved.
+        Used when its partition goes to another process.
+        :param language: The language.
+        :return: nothing.
+        """
+
+        async with language.lock:
+            if self.language_index.get(language.channel_id) is not language:
+                return
+            self.languages.remove(language)
+            del self.language_index[language.channel_id]
+            self.language_last_used.pop(language.channel_id, None)
+            self.due_amendments.pop(language.channel_id, None)
+            for amendment in language.amendments:
+                self.open_votes.pop(amendment.voting_message_id, None)
+                self.vote_tallies.pop(amendment.voting_message_id, None)
+                await self.edit_queue.forget(amendment.voting_message_id)
+
+    async def unload_idle_languages(self):
+        """
+        Drops languages from memory that haven't been used in a while and have nothing going on.
+        :return: When the next of the languages left could be dropped, or None if none are loaded.
+        """
+
+        now = time.time()
+        next_unload = None
+        for language in list(self.languages):
+            idle_time = now - self.language_last_used.get(language.channel_id, now)
+            if idle_time > self.idle_timeout and len(language.amendments) == 0 and not language.should_update_rules and not language.lock.locked():
+                self.languages.remove(language)
+                del self.language_index[language.channel_id]
+                del self.language_last_used[language.channel_id]
+                continue
+            if idle_time > self.idle_timeout:  # Idle but busy. Looked at again once another timeout has gone by.
+                unload_time = now + self.idle_timeout
+            else:
+                unload_time = now - idle_time + self.idle_timeout
+            if next_unload is None or unload_time < next_unload:
+                next_unload = unload_time
+        return next_unload
+
+    async def close(self):
+        """
+        Overwritten from the Client base class so the storage is on disk before shutting down.
+        :return: nothing.
+        """
+
+        self.profiler.stop()
+        if self.membership is not None:
+            self.membership_task.cancel()
+            await self.membership.leave()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.storage.close()
+        await super().close()
+
+    def collect_bytes_written(self):
+        return [({}, getattr(self.storage, "bytes_written", 0))]
+
+    def collect_backlog(self):
+        return [({"queue": "open_votes"}, len(self.open_votes)),
+                ({"queue": "scheduled_deadlines"}, len(self.scheduler.heap)),
+                ({"queue": "pending_edits"}, len(self.edit_queue.pending)),
+                ({"queue": "due_amendments"}, sum(len(amendments) for amendments in self.due_amendments.values())),
+                ({"queue": "loaded_languages"}, len(self.languages))]
+
+    def collect_word_counts(self):
+        return [({"channel": language.channel_id, "language": language.name}, len(language.word_index)) for language in self.languages]
+
+    def collect_amendment_counts(self):
+        return [({"channel": language.channel_id, "language": language.name}, len(language.amendments)) for language in self.languages]
+
+    async def api_call(self, endpoint, coroutine, timeout=None):
+        """
+        Awaits a Discord API call and records how long it took.
+        :param endpoint: Name of the call, for the metrics.
+        :param coroutine: The call.
+        :param timeout: Seconds to wait before giving up with asyncio.TimeoutError. None to wait as long as it takes.
+        :return: Whatever the call returned.
+        """
 
-                        for related_word in word.related_words:
-                            file.write(related_word.text + ", ")
-                        file.write("\n\n")
+        with self.api_latency.time(endpoint=endpoint):
+            if timeout is None:
+                return await coroutine
+            return await asyncio.wait_for(coroutine, timeout)
 
-                    file.close()
+    async def save(self, operation, *args):
+        """
+        Calls one of the storage's save methods and records how long it took.
+        :param operation: Name of the storage method.
+        :param args: Arguments for it.
+        :return: nothing.
+        """
 
-                    discord_file = discord.File(open("dictionary.txt", 'rb'))
-                    dm = await message.author.create_dm()
-                    await dm.send(file=discord_file)
+        with self.save_latency.time(operation=operation):
+            await getattr(self.storage, operation)(*args)
 
-            else:  # Everything else can be treated as submitting something as an ammendment.
-                correct_message = True
-                new_change = Change()
-                voting_message_string = None
-                if main_command == "addrule" and len(command_list) == 2:
-                    new_change.change_type = ChangeType.ADDRULE
-                    new_change.rule_desc = command_list[1]
+    async def background_tasks(self):
+        """
+        This method is initiated from the bot's constructor, and waits until
+        the bot is logged in and ready. This is essentially all the stuff that
+        needs to be done over and over constantly. (Voting, updating messages, etc.)
+        :return: nothing.
+        """
 
-                    voting_message_string = "Time Remaining: " + str(new_change.time_remaining) + "\nChange:\nAdd Rule: " + command_list[1]
+        if self.metrics_server is not None:
+            try:
+                await self.metrics_server.start()
+            except OSError as error:  # Port taken. The bot works fine without metrics.
+                print("Could not serve metrics: " + str(error))
+                self.metrics_server = None
 
-                elif main_command == "editrule" and len(command_list) == 3:
-                    new_change.change_type = ChangeType.EDITRULE
+        await self.wait_until_ready()
+        print("ready")
+
+        # Recount anything that could have been voted on while the bot was offline. A few channels at a time,
+        # and a channel that doesn't answer is just left stale to be recounted when its vote ends.
+        async def reconcile_language(language):
+            async with self.resolve_semaphore:
+                for amendment in list(language.amendments):
                     try:
-                        rule_number = int(command_list[1])
-                    except:
-                        print("Error converting integer.")
-                        return
-                    new_change.rule_number = rule_number
-                    new_change.rule_desc = command_list[2]
+                        await self.reconcile_tally(language, amendment)
+                    except Exception as error:
+                        print("Error recounting votes in " + language.name + ": " + repr(error))
+
+        await asyncio.gather(*[reconcile_language(language) for language in list(self.languages)])
+
+        next_countdown = time.time()
+        while self.is_ready():
+            pass_start = time.perf_counter()
+            now = time.time()
+
+            # Only the amendments that are actually due get resolved. Each language does its own on its own task,
+            # so a slow channel only holds up itself.
+            for channel_id, amendment in self.scheduler.pop_due(now):
+                language = self.language_index.get(channel_id)
+                if language is not None and amendment in language.amendments:  # Skip anything already resolved.
+                    self.due_amendments.setdefault(channel_id, []).append(amendment)
+                    if channel_id not in self.resolve_tasks:
+                        self.resolve_tasks[channel_id] = self.loop.create_task(self.resolve_due_amendments(language))
+
+            if now >= next_countdown:
+                for language in list(self.languages):
+                    # Busy channels get coarser countdowns so their edits stay within the channel's budget.
+                    granularity = self.edit_queue.countdown_granularity(len(language.amendments), self.countdown_interval)
+                    for amendment in list(language.amendments):
+                        await self.update_countdown(language, amendment, granularity)
+                next_countdown = now + self.countdown_interval
+
+            for language in list(self.languages):
+                if language.should_update_rules:
+                    new_message = "Language: " + language.name + "\nRules:\n"
+                    for index, rule in enumerate(language.rules):
+                        new_message += str(index + 1) + ": " + rule + "\n"
+                    await self.edit_queue.request(language.channel_id, language.intro_message_id, new_message)
+                    language.should_update_rules = False
 
-                    voting_message_string = "Time Remaining: " + str(new_change.time_remaining) + "\nChange:\nChange rule " + str(rule_number) + " to " + '"' + command_list[2] + '"'
+            next_unload = await self.unload_idle_languages()
+            self.background_latency.observe(time.perf_counter() - pass_start)
 
-                elif main_command == "removerule" and len(command_list) == 2:
-                    new_change.change_type = ChangeType.REMOVERULE
+            # Sleep until the next vote ends, or the next countdown update if any votes are open,
+            # or until a language could be unloaded.
+            wake_time = self.scheduler.next_deadline()
+            if wake_time is not None:
+                wake_time = min(wake_time, next_countdown)
+            if next_unload is not None:
+                wake_time = next_unload if wake_time is None else min(wake_time, next_unload)
+            await self.scheduler.wait(None if wake_time is None else wake_time - time.time())
+
+    async def resolve_due_amendments(self, language):
+        """
+        Resolves a language's due amendments one after another. Runs as its own task,
+        alongside the other languages', up to the semaphore's limit.
+        If the channel is too slow to answer, or anything else goes wrong, the vote is tried again later.
+        :param language: The language.
+        :return: nothing.
+        """
+
+        due = self.due_amendments.get(language.channel_id, [])
+        try:
+            async with self.resolve_semaphore:
+                while len(due) > 0 and self.owns_channel(language.channel_id):
+                    amendment = due.pop(0)
+                    if amendment not in language.amendments:  # Scheduled twice (ended early by the quorum) and already resolved.
+                        continue
                     try:
-                        rule_number = int(command_list[1])
-                    except:
-                        print("Error converting integer.")
-                        return
-                    new_change.rule_number = rule_number
-                    voting_message_string = "Time Remaining: " + str(new_change.time_remaining) + "\nChange:\nRemove Rule " + str(rule_number)
-
-                elif main_command == "changename" and len(command_list) == 2:
-                    new_change.change_type = ChangeType.CHANGENAME
-                    new_change.new_name = command_list[1]
-
-                    voting_message_string = "Time Remaining: " + str(new_change.time_remaining) + '\nChange:\nChange language name to "' + command_list[1] + '"'
-
-                elif main_command == "addword" and len(command_list) >= 4:
-                    new_change.change_type = ChangeType.ADDWORD
-                    new_change.text = command_list[1]
-                    new_change.pronunciation = command_list[2]
-                    new_change.definition = command_list[3]
-                    related_words = []
-                    if len(command_list) > 4:
-                        for i in range(4, len(command_list)):
-                            related_words.append(command_list[i])
-                    new_change.related_words = related_words
-
-                    voting_message_string = "Time Remaining: " + str(new_change.time_remaining) + "\nChange: Add Word\nText: " + command_list[1] + "\nPronunciation: " + command_list[2] + "\nDefinition: " + command_list[3] + "\nRelated Words: "
-                    for word in related_words:
-                        voting_message_string += word + ", "
-
-                elif main_command == "removeword" and len(command_list) == 2:
-                    new_change.change_type = ChangeType.REMOVEWORD
-                    new_change.text = command_list[1]
-
-                    voting_message_string = "Time Remaining: " + str(new_change.time_remaining) + "\nChange:\nRemove Word: " + command_list[1]
-
-                elif main_command == "editword" and len(command_list) == 4:
-                    new_change.change_type = ChangeType.EDITWORD
-                    new_change.text = command_list[1]
-                    new_change.parameter = command_list[2].lower()
-                    new_change.modification = command_list[3]
-
-                    voting_message_string = "Time Remaining: " + str(new_change.time_remaining) + "\nChange:\nChange \"" + command_list[1] + "\"'s " + command_list[2].lower() + " to " + command_list[3]
-
-                elif main_command == "addrelatedword" and len(command_list) == 3:
-                    new_change.change_type = ChangeType.ADDRELATEDWORD
-                    new_change.text = command_list[1]
-                    new_change.related_word_text = command_list[2]
-
-                    voting_message_string = "Time Remaining: " + str(new_change.time_remaining) + "\nChange:\nAdd \"" + command_list[2] + "\" as a related word to \"" + command_list[1] + '"'
-
-                elif main_command == "removerelatedword" and len(command_list) == 3:
-                    new_change.change_type = ChangeType.REMOVERELATEDWORD
-                    new_change.text = command_list[1]
-                    new_change.related_word_text = command_list[2]
-
-                    voting_message_string = "Time Remaining: " + str(new_change.time_remaining) + "\nChange:\nRemove \"" + command_list[2] + "\" as a related word to \"" + command_list[1] + '"'
-
-                else:  # If none of these commands were triggered, something went wrong.
-                    print("Incorrect Message")
-                    correct_message = False
-
-                if correct_message:
-                    language = await self.get_language_from_channel(message.channel.id)
-                    if language is not None:  # Common logic for all of the amendments.
-                        voting_message = await message.channel.send(voting_message_string)
-                        new_change.voting_message_id = voting_message.id
-                        await voting_message.add_reaction("✅")
-                        await voting_message.add_reaction("❌")
-                        language.amendments.append(new_change)
-                        await self.save_languages()  # Save when important stuff happens.
-                    else:
-                        print("Error, no language in channel.")  # Command was invoked in a language-less channel.
-
-            await message.delete()  # Get rid of all the junk (not the bot's messages though)
-
-
-bot = LanguageBot()
-bot.run("")
+                        await self.resolve_amendment(language, amendment)
+                    except (asyncio.TimeoutError, discord.HTTPException) as error:
+                        print("Couldn't resolve a vote in channel " + str(language.channel_id) + " (" + repr(error) + "). Trying again later.")
+                        self.scheduler.schedule(language.channel_id, amendment, time.time() + self.retry_delay)
+                    except Exception as error:  # It's already off the schedule, so it has to go back on or it never ends.
+                        print("Error resolving a vote in channel " + str(language.channel_id) + ": " + repr(error) + ". Trying again later.")
+                        self.scheduler.schedule(language.channel_id, amendment, time.time() + self.retry_delay)
+        finally:
+            del self.resolve_tasks[language.channel_id]
+            if len(due) > 0 and self.owns_channel(language.channel_id):  # Only if the task was cancelled part way.
+                self.resolve_tasks[language.channel_id] = self.loop.create_task(self.resolve_due_amendments(language))
+            else:
+                self.due_amendments.pop(language.channel_id, None)
+
+    async def update_countdown(self, language, amendment, granularity):
+        """
+        Queues an edit of an amendment's voting message with its current time remaining.
+        Nothing is sent unless the shown number actually changes.
+        :param language: The language the amendment is for.
+        :param amendment: The amendment.
+        :param granularity: How coarse the countdown is, in seconds.
+        :return: nothing.
+        """
+
+        await self.edit_queue.request(language.channel_id, amendment.voting_message_id, amendment.get_voting_message(granularity))
+
+    async def track_amendment(self, language, amendment, stale=False):
+        """
+        Starts keeping track of an amendment: its deadline and its votes.
+        :param language: The language the amendment is for.
+        :param amendment: The amendment.
+        :param stale: Whether votes could already be on it that the bot hasn't seen.
+        :return: nothing.
+        """
+
+        self.scheduler.schedule(language.channel_id, amendment)
+        self.open_votes[amendment.voting_message_id] = (language, amendment)
+        if stale or amendment.voting_message_id not in self.vote_tallies:  # Votes may already be counted from while it was being set up.
+            self.vote_tallies[amendment.voting_message_id] = VoteTally(stale=stale)
+
+    async def reconcile_tally(self, language, amendment):
+        """
+        Recounts an amendment's votes from its message. Only needed at startup or when the
+        live count might have missed something. Raises asyncio.TimeoutError if the channel is too slow,
+        and discord.NotFound if the voting message was deleted.
+        :param language: The language the amendment is for.
+        :param amendment: The amendment.
+        :return: The recounted VoteTally.
+        """
+
+        tally = VoteTally()
+        message = await self.api_call("fetch_message", self.get_channel(language.channel_id).fetch_message(amendment.voting_message_id), self.api_timeout)
+        for reaction in message.reactions:
+            votes = reaction.count
+            if reaction.me:
+                votes -= 1  # Don't count the one made by the bot.
+            tally.count_reaction(reaction.emoji, votes)
+        tally.stale = False
+        self.vote_tallies[amendment.voting_message_id] = tally
+        return tally
+
+    async def on_raw_reaction_add(self, payload):
+        """
+        Overwritten from the Client base class. Counts a vote as it comes in.
+        :param payload: The reaction event. (discord.RawReactionActionEvent)
+        :return: nothing.
+        """
+
+        await self.count_vote(payload, 1)
+
+    async def on_raw_reaction_remove(self, payload):
+        """
+        Overwritten from the Client base class. Takes back a vote.
+        :param payload: The reaction event. (discord.RawReactionActionEvent)
+        :return: nothing.
+        """
+
+        await self.count_vote(payload, -1)
+
+    async def count_vote(self, payload, amount):
+        """
+        Updates the tally of the amendment a reaction was on, if it was on one,
+        and ends the vote early if it reached the quorum.
+        :param payload: The reaction event.
+        :param amount: 1 for an added reaction, -1 for a removed one.
+        :return: nothing.
+        """
+
+        tally = self.vote_tallies.get(payload.message_id)
+        if tally is None or payload.user_id == self.user.id:
+            return
+        tally.count_reaction(payload.emoji.name, amount)
+
+        if self.quorum is not None and not tally.stale and max(tally.yes_votes, tally.no_votes) >= self.quorum:
+            language, amendment = self.open_votes[payload.message_id]
+            amendment.deadline = time.time()
+            self.scheduler.schedule(language.channel_id, amendment)
+
+    async def on_resumed(self):
+        """
+        Overwritten from the Client base class. Reactions could have been missed while
+        disconnected, so every tally gets recounted before it is used.
+        :return: nothing.
+        """
+
+        for tally in self.vote_tallies.values():
+            tally.stale = True
+
+    async def resolve_amendment(self, language, amendment):
+        """
+        Tallies the votes on an amendment whose time is up, makes the change if it passed,
+        and cleans up the voting message.
+        :param language: The language the amendment is for.
+        :param amendment: The amendment.
+        :return: nothing.
+        """
+
+        message_deleted = False
+        tally = self.vote_tallies.get(amendment.voting_message_id)
+        if tally is None or tally.stale:
+            try:
+                tally = await self.reconcile_tally(language, amendment)
+            except discord.NotFound:
+                # Someone deleted the voting message, so the votes can't ever be counted. It's rejected.
+                print("The voting message " + str(amendment.voting_message_id) + " was deleted.")
+                message_deleted = True
+                tally = VoteTally()
+
+        try:
+            async with language.lock:  # Only held for the change and the save, not while waiting on Discord.
+                if self.language_index.get(language.channel_id) is not language:
+                    return  # Handed over to another process while the votes were being counted.
+                accepted = tally.yes_votes > tally.no_votes
+                delta = await make_change(amendment, language) if accepted else None
+                try:
+                    await self.save("resolve_amendment", language, amendment, accepted)
+                except Exception:
+                    # The amendment stays open with the language as it was, so the vote can be tried again.
+                    if delta is not None:
+                        await language.undo_change(delta)
+                    raise
+                language.amendments.remove(amendment)
+                await language.release_texts(amendment.get_new_texts())
+        except PartitionLostError:
+            await self.lose_language(language)  # The change in memory goes with it. The new owner resolves the vote.
+            return
+        print("Made Change" if accepted else "Rejected Change")
+        if language.should_update_rules:
+            self.scheduler.wake_event.set()  # The loop could be asleep with no votes left to wake it for the rules message.
+
+        self.open_votes.pop(amendment.voting_message_id, None)
+        self.vote_tallies.pop(amendment.voting_message_id, None)
+        await self.edit_queue.forget(amendment.voting_message_id)
+        if not message_deleted:
+            self.loop.create_task(self.delete_voting_message(language.channel_id, amendment.voting_message_id))  # The next vote doesn't need to wait for this.
+
+    async def delete_voting_message(self, channel_id, message_id):
+        """
+        Deletes the voting message of a resolved amendment.
+        :param channel_id: The channel it's in.
+        :param message_id: The message.
+        :return: nothing.
+        """
+
+        try:
+            await self.api_call("delete_message", self.get_channel(channel_id).get_partial_message(message_id).delete(), self.api_timeout)
+        except (asyncio.TimeoutError, discord.HTTPException) as error:
+            print("Couldn't delete the voting message " + str(message_id) + ": " + repr(error))
+
+    async def get_language_from_channel(self, channel_id):
+        """
+        Helper function that returns the language associated with a particular discord channel.
+        :param channel_id: id of the discord channel.
+        :return: The language associated.
+        """
+
+        language = self.language_index.get(channel_id)
+        if language is None:
+            if channel_id not in self.language_channels:
+                return None
+
+            # Load the language the first time its channel sees traffic.
+            if channel_id not in self.loading_languages:
+                self.loading_languages[channel_id] = self.loop.create_task(self.storage.load_language(channel_id))
+            try:
+                language = await self.loading_languages[channel_id]
+            finally:
+                self.loading_languages.pop(channel_id, None)
+            if language is None:
+                return None
+            if channel_id not in self.language_index:
+                self.languages.append(language)
+                self.language_index[channel_id] = language
+                self.scheduler.wake_event.set()  # The loop could be asleep with nothing to wake it for unloading this.
+                for amendment in language.amendments:
+                    await self.track_amendment(language, amendment, stale=True)  # Votes may have come in while the bot was down.
+            language = self.language_index[channel_id]
+
+        self.language_last_used[channel_id] = time.time()
+        return language
+
+    async def add_language(self, language):
+        """
+        Adds a new language to the bot and to storage.
+        :param language: The language to add.
+        :return: nothing.
+        """
+
+        self.languages.append(language)
+        self.language_index[language.channel_id] = language
+        self.language_channels.add(language.channel_id)
+        self.language_last_used[language.channel_id] = time.time()
+        self.scheduler.wake_event.set()  # The loop could be asleep with nothing to wake it for unloading this.
+        try:
+            await self.save("add_language", language)
+        except PartitionLostError:
+            await self.lose_language(language)
+
+    def register_commands(self):
+        """
+        Fills in the command table. Commands with a change type are put up for a vote.
+        :return: nothing.
+        """
+
+        for command in [
+            Command("createlanguage", [Argument("name")], handler=self.create_language),
+            Command("dictionary", [Argument("export_format", str.lower, default="text", required=False), Argument("version", int, required=False)], handler=self.send_dictionary),
+            Command("search", [Argument("query"), Argument("version", int, required=False)], handler=self.send_search_results),
+            Command("history", [], handler=self.send_history),
+            Command("diff", [Argument("old_version", int), Argument("new_version", int, required=False)], handler=self.send_diff),
+            Command("revert", [Argument("version", int)], handler=self.propose_revert),
+            Command("wordfamily", [Argument("text")], handler=self.send_word_family),
+            Command("relationpath", [Argument("text"), Argument("other_text")], handler=self.send_relation_path),
+            Command("wordgroups", [], handler=self.send_word_groups),
+            Command("profile", [Argument("action", str.lower)], handler=self.toggle_profiler),
+            Command("addrule", [Argument("rule_desc")], change_type=ChangeType.ADDRULE),
+            Command("editrule", [Argument("rule_number", int), Argument("rule_desc")], change_type=ChangeType.EDITRULE),
+            Command("removerule", [Argument("rule_number", int)], change_type=ChangeType.REMOVERULE),
+            Command("changename", [Argument("new_name")], change_type=ChangeType.CHANGENAME),
+            Command("addword", [Argument("text"), Argument("pronunciation"), Argument("definition"), Argument("related_words", variadic=True)], change_type=ChangeType.ADDWORD),
+            Command("removeword", [Argument("text")], change_type=ChangeType.REMOVEWORD),
+            Command("editword", [Argument("text"), Argument("parameter", str.lower), Argument("modification")], change_type=ChangeType.EDITWORD),
+            Command("addrelatedword", [Argument("text"), Argument("related_word_text")], change_type=ChangeType.ADDRELATEDWORD),
+            Command("removerelatedword", [Argument("text"), Argument("related_word_text")], change_type=ChangeType.REMOVERELATEDWORD),
+            Command("importwords", [], handler=self.propose_import),
+        ]:
+            self.commands[command.name] = command
+
+    async def on_message(self, message):
+        """
+        This is a overwritten method from the Client base class. It is called
+        each time the bot sees someone send a message, which makes it perfect
+        for looking for commands.
+        :param message: The message sent. (discord.Message)
+        :return: nothing.
+        """
+
+        if not self.owns_channel(message.channel.id):
+            return  # Another process is handling this channel.
+
+        if (message.content[:len(self.prefix)] == self.prefix) and (message.author.id != self.user.id):  # If the beginning of the message has the proper prefix.
+
+            # PARSE THE COMMAND using functions and methods above.
+            total_command = message.content[len(self.prefix):]
+            try:
+                command_list = get_command_list(total_command)
+                command = self.commands.get(command_list[0])
+                if command is None:
+                    raise CommandParseError('Unknown command "' + command_list[0] + '"')
+                arguments = command.parse_arguments(command_list[1:])
+            except CommandParseError as error:
+                self.command_errors.inc()
+                print("Error. Bad Commands. " + str(error))
+                await self.api_call("delete_message", message.delete())  # Mistyped commands are junk too.
+                dm = await self.api_call("create_dm", message.author.create_dm())
+                await self.api_call("send_message", dm.send(("Couldn't read your command: " + str(error))[:2000]))  # Discord's message length limit.
+                return
+
+            # EXECUTE THE COMMAND
+            with self.command_latency.time(command=command.name):
+                if command.change_type is None:
+                    await command.handler(message, **arguments)
+                else:  # Everything else is submitted as an amendment.
+                    await self.propose_change(message, command.change_type, arguments)
+
+                await self.api_call("delete_message", message.delete())  # Get rid of all the junk (not the bot's messages though)
+
+    async def create_language(self, message, name):
+        """
+        Creates a language in the channel the command was sent in.
+        :param message: The command message.
+        :param name: The language's name.
+        :return: nothing.
+        """
+
+        if await self.get_language_from_channel(message.channel.id) is None:
+            new_language = Language(name=name)
+            new_language.channel_id = message.channel.id
+
+            # Send and remember two messages for rules and amendments.
+            intro_message = await self.api_call("send_message", message.channel.send("Language: " + new_language.name + "\nRules:\n"))
+            new_language.intro_message_id = intro_message.id
+
+            # Pin those messages.
+            # await intro_message.pin()
+
+            await self.add_language(new_language)
+            print("Created new language: " + new_language.name)
+        else:
+            print("Could not create language. Channel already has one.")
+
+    async def send_dictionary(self, message, export_format, version):
+        """
+        Sends the user a dictionary file of the language.
+        :param message: The command message.
+        :param export_format: One of the export formats.
+        :param version: Which version of the language, or None for the current one.
+        :return: nothing.
+        """
+
+        language = await self.get_language_from_channel(message.channel.id)
+        if language is not None and export_format in EXPORT_FORMATS and (version is None or await language.has_version(version)):
+            data, filename = await language.export(export_format, version)
+            discord_file = discord.File(io.BytesIO(data), filename=filename)
+            dm = await self.api_call("create_dm", message.author.create_dm())
+            await self.api_call("send_message", dm.send(file=discord_file))
+        else:
+            print("Error. No language here, unknown dictionary format, or no such version.")
+
+    async def send_search_results(self, message, query, version):
+        """
+        DMs the user the words that best match a search.
+        :param message: The command message.
+        :param query: What to search for.
+        :param version: Which version of the language to search, or None for the current one.
+        :return: nothing.
+        """
+
+        language = await self.get_language_from_channel(message.channel.id)
+        if language is not None and (version is None or await language.has_version(version)):
+            results = await language.search(query, version=version)
+            results_string = 'Search results for "' + query + '" in ' + language.name
+            if version is not None:
+                results_string += " (version " + str(version) + ")"
+            results_string += ":\n"
+            if len(results) == 0:
+                results_string += "No words found."
+            for index, word in enumerate(results):
+                results_string += str(index + 1) + ": " + word.text + " (" + word.pronunciation + ") - " + word.definition[:150] + "\n"
+            dm = await self.api_call("create_dm", message.author.create_dm())
+            await self.api_call("send_message", dm.send(results_string[:2000]))  # Discord's message length limit.
+
+    async def send_word_family(self, message, text):
+        """
+        DMs the user every word connected to a word through related words, closest first.
+        :param message: The command message.
+        :param text: The word to start from.
+        :return: nothing.
+        """
+
+        language = await self.get_language_from_channel(message.channel.id)
+        if language is None:
+            return
+        word = await language.get_word(text)
+        if word is None:
+            results_string = '"' + text + '" is not a word in ' + language.name + "."
+        else:
+            family = await language.get_word_family(word, max_words=100)
+            results_string = 'Words related to "' + word.text + '" (steps away):\n'
+            if len(family) == 0:
+                results_string += "None."
+            results_string += ", ".join(family_word.text + " (" + str(distance) + ")" for family_word, distance in family)
+        dm = await self.api_call("create_dm", message.author.create_dm())
+        await self.api_call("send_message", dm.send(results_string[:2000]))  # Discord's message length limit.
+
+    async def send_relation_path(self, message, text, other_text):
+        """
+        DMs the user the shortest chain of related words between two words.
+        :param message: The command message.
+        :param text: The word to start from.
+        :param other_text: The word to get to.
+        :return: nothing.
+        """
+
+        language = await self.get_language_from_channel(message.channel.id)
+        if language is None:
+            return
+        word = await language.get_word(text)
+        other_word = await language.get_word(other_text)
+        if word is None or other_word is None:
+            results_string = "Both words have to be in " + language.name + "."
+        else:
+            path = await language.get_relation_path(word, other_word)
+            if path is None:
+                results_string = '"' + word.text + '" and "' + other_word.text + '" are not connected.'
+            else:
+                results_string = " -> ".join(path_word.text for path_word in path)
+        dm = await self.api_call("create_dm", message.author.create_dm())
+        await self.api_call("send_message", dm.send(results_string[:2000]))  # Discord's message length limit.
+
+    async def send_word_groups(self, message):
+        """
+        DMs the user the groups of words that are connected through related words.
+        :param message: The command message.
+        :return: nothing.
+        """
+
+        language = await self.get_language_from_channel(message.channel.id)
+        if language is None:
+            return
+        groups = await language.get_word_groups()
+        results_string = str(len(groups)) + " groups of related words in " + language.name + ":\n"
+        for index, group in enumerate(groups[:20]):
+            results_string += str(index + 1) + ": " + str(len(group)) + " words - " + ", ".join(group_word.text for group_word in group[:10]) + "\n"
+        dm = await self.api_call("create_dm", message.author.create_dm())
+        await self.api_call("send_message", dm.send(results_string[:2000]))  # Discord's message length limit.
+
+    async def send_history(self, message):
+        """
+        DMs the user the most recent versions of the language and what changed in each.
+        :param message: The command message.
+        :return: nothing.
+        """
+
+        language = await self.get_language_from_channel(message.channel.id)
+        if language is None:
+            return
+        results_string = language.name + " is at version " + str(language.version) + ". Versions back to " + str(language.history.get_oldest_version(language.version)) + " can be viewed.\n"
+        for delta in reversed(language.history.deltas[-20:]):
+            results_string += str(delta.version) + " (" + time.strftime("%Y-%m-%d %H:%M", time.gmtime(delta.time)) + "): " + delta.description[:80] + "\n"
+        dm = await self.api_call("create_dm", message.author.create_dm())
+        await self.api_call("send_message", dm.send(results_string[:2000]))  # Discord's message length limit.
+
+    async def send_diff(self, message, old_version, new_version):
+        """
+        DMs the user a file listing what changed between two versions.
+        :param message: The command message.
+        :param old_version: The earlier version.
+        :param new_version: The later version, or None for the current one.
+        :return: nothing.
+        """
+
+        language = await self.get_language_from_channel(message.channel.id)
+        if language is None:
+            return
+        if new_version is None:
+            new_version = language.version
+        old_version, new_version = min(old_version, new_version), max(old_version, new_version)
+        if not (await language.has_version(old_version) and await language.has_version(new_version)):
+            print("Error. No such version.")
+            return
+
+        lines = await language.diff_versions(old_version, new_version)
+        summary = language.name + ": " + str(len(lines)) + " differences from version " + str(old_version) + " to " + str(new_version) + "."
+        discord_file = discord.File(io.BytesIO(("\n".join(lines) + "\n").encode("utf-8")), filename="v" + str(old_version) + "-v" + str(new_version) + ".diff")
+        dm = await self.api_call("create_dm", message.author.create_dm())
+        await self.api_call("send_message", dm.send(summary, file=discord_file))
+
+    async def propose_revert(self, message, version):
+        """
+        Puts reverting the language to an older version up for a vote.
+        :param message: The command message.
+        :param version: The version to go back to.
+        :return: nothing.
+        """
+
+        language = await self.get_language_from_channel(message.channel.id)
+        if language is None or not await language.has_version(version) or version == language.version:
+            print("Error. No language here, or can't revert to that version.")
+            return
+        await self.propose_change(message, ChangeType.REVERT, {"version": version})
+
+    async def propose_change(self, message, change_type, arguments):
+        """
+        Puts a change up for a vote in the channel's language.
+        :param message: The command message.
+        :param change_type: The type of change.
+        :param arguments: The command's arguments, which become the change's data.
+        :return: nothing.
+        """
+
+        language = await self.get_language_from_channel(message.channel.id)
+        if language is None:
+            print("Error, no language in channel.")  # Command was invoked in a language-less channel.
+            return
+
+        new_change = Change(change_type, Change.payload_types[change_type](**arguments))
+        if change_type == ChangeType.ADDWORD:  # Voters get to see if it looks like a word that's already there.
+            new_change.payload.similar_words = tuple(await language.find_similar_words(new_change.payload.text, new_change.payload.pronunciation, limit=3))
+        await self.put_up_for_vote(message, language, new_change)
+
+    async def propose_import(self, message):
+        """
+        Reads a CSV or JSON word list attached to the command and puts the good words up
+        for a vote as one amendment. The voting message gets a diff of the words, and the
+        user is DM'd about any rows that were skipped.
+        :param message: The command message, with the word list attached.
+        :return: nothing.
+        """
+
+        language = await self.get_language_from_channel(message.channel.id)
+        if language is None:
+            print("Error, no language in channel.")
+            return
+        if len(message.attachments) == 0 or message.attachments[0].size > MAX_IMPORT_BYTES:
+            print("Error. importwords needs a CSV or JSON file attached, at most " + str(MAX_IMPORT_BYTES // (1024 * 1024)) + " MB.")
+            return
+
+        attachment = message.attachments[0]
+        data = await self.api_call("fetch_attachment", attachment.read())
+        existing_texts = set(language.word_index)  # Copied so they can be read on another thread.
+        pending_texts = set(language.pending_texts)
+        try:
+            words, errors = await asyncio.get_event_loop().run_in_executor(None, parse_word_file, data, attachment.filename, existing_texts, pending_texts)
+        except WordFileError as error:
+            words, errors = [], [(attachment.filename, str(error))]
+
+        if len(errors) > 0:
+            results_string = "Importing " + attachment.filename + ": " + str(len(words)) + " words ok, " + str(len(errors)) + " problems:\n"
+            results_string += "".join(str(number) + ": " + problem + "\n" for number, problem in errors[:30])
+            dm = await self.api_call("create_dm", message.author.create_dm())
+            await self.api_call("send_message", dm.send(results_string[:2000]))  # Discord's message length limit.
+        if len(words) == 0:
+            return
+
+        # The keys take the longest to work out, so that's done off the event loop. Looking them up is quick.
+        keys = await asyncio.get_event_loop().run_in_executor(None, get_keys_for_words, [(word[0], word[1]) for word in words])
+        similar = {}
+        for (text, pronunciation, _, _), word_keys in zip(words, keys):
+            similar_words = await language.find_similar_words(text, pronunciation, 3, word_keys)
+            if len(similar_words) > 0:
+                similar[text] = similar_words
+
+        new_change = Change(ChangeType.BULKADDWORD, BulkAddWordPayload(words=tuple(words), source_name=attachment.filename))
+        diff_file = discord.File(io.BytesIO(build_import_diff(words, errors, similar)), filename="import.diff")
+        await self.put_up_for_vote(message, language, new_change, diff_file)
+
+    async def put_up_for_vote(self, message, language, new_change, file=None):
+        """
+        Sends the voting message for a new amendment and starts tracking it.
+        :param message: The command message.
+        :param language: The language the amendment is for.
+        :param new_change: The amendment.
+        :param file: A discord.File to attach to the voting message, if any.
+        :return: nothing.
+        """
+
+        # Every word's text has to be different, so a word that's already there or already up for a vote is turned down.
+        # Its text is reserved from here on, before anything is awaited.
+        new_texts = new_change.get_new_texts()
+        taken_texts = await language.claim_texts(new_texts)
+        if len(taken_texts) > 0:
+            results_string = "Not put up for a vote. Already a word or up for a vote in " + language.name + ": " + ", ".join(taken_texts[:20])
+            print("Error. " + results_string)
+            dm = await self.api_call("create_dm", message.author.create_dm())
+            await self.api_call("send_message", dm.send(results_string[:2000]))  # Discord's message length limit.
+            return
+
+        voting_message = None
+        try:
+            voting_message_string = new_change.get_voting_message()
+            voting_message = await self.api_call("send_message", message.channel.send(voting_message_string, file=file))
+            new_change.voting_message_id = voting_message.id
+            # People can vote as soon as the message is up, so votes are counted from here on, not once it's all set up.
+            self.open_votes[voting_message.id] = (language, new_change)
+            self.vote_tallies[voting_message.id] = VoteTally()
+            await self.edit_queue.remember(voting_message.id, voting_message_string)
+            await self.api_call("add_reaction", voting_message.add_reaction("✅"))
+            await self.api_call("add_reaction", voting_message.add_reaction("❌"))
+        except Exception:
+            await language.release_texts(new_texts)  # Never made it to a vote.
+            if voting_message is not None:
+                self.open_votes.pop(voting_message.id, None)
+                self.vote_tallies.pop(voting_message.id, None)
+            raise
+
+        try:
+            async with language.lock:
+                if self.language_index.get(language.channel_id) is not language:
+                    print("Error. The language was handed over to another process.")
+                    self.open_votes.pop(voting_message.id, None)
+                    self.vote_tallies.pop(voting_message.id, None)
+                    return
+                language.amendments.append(new_change)
+                await self.track_amendment(language, new_change)
+                await self.save("add_amendment", language, new_change)  # Save when important stuff happens.
+        except PartitionLostError:
+            await self.lose_language(language)
+            self.loop.create_task(self.delete_voting_message(language.channel_id, voting_message.id))  # Never saved, so nobody would resolve it.
+
+    async def toggle_profiler(self, message, action):
+        """
+        Lets a server admin start the sampling profiler, and stop it to get the results by DM.
+        :param message: The command message.
+        :param action: "start" or "stop".
+        :return: nothing.
+        """
+
+        permissions = getattr(message.author, "guild_permissions", None)  # Not there for DMs.
+        if permissions is None or not permissions.administrator:
+            print("Error. Only server administrators can use the profiler.")
+            return
+
+        if action == "start":
+            self.profiler.start()  # Called from the event loop's thread, so that's the one sampled.
+            print("Profiler started")
+        elif action == "stop" and self.profiler.is_running:
+            self.profiler.stop()
+            results_string = "Profiled " + str(round(time.time() - self.profiler.started_at)) + "s, " + str(sum(self.profiler.samples.values())) + " samples.\n"
+            results_string += "Busiest functions (running / on stack):\n"
+            for function, own_samples, total_samples in self.profiler.get_top_functions():
+                results_string += str(own_samples) + " / " + str(total_samples) + " " + function + "\n"
+            discord_file = discord.File(io.BytesIO(self.profiler.get_collapsed_stacks().encode("utf-8")), filename="profile.txt")
+            dm = await self.api_call("create_dm", message.author.create_dm())
+            await self.api_call("send_message", dm.send(results_string[:2000], file=discord_file))  # Discord's message length limit.
+        else:
+            print("Error. Unknown profiler action, or the profiler isn't running.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discord bot for building languages together.")
+    parser.add_argument("--shard", help="Name of this process, to run several of them with the coordinator in Sharding.py.")
+    parser.add_argument("--metrics-port", type=int, default=9108, help="Port to serve metrics on. Each process needs its own.")
+    arguments = parser.parse_args()
+
+    bot = LanguageBot(metrics_port=arguments.metrics_port, shard_name=arguments.shard)
+    bot.run("")
@@ -0,0 +1,294 @@
+# Metrics for the bot's hot paths, served over a small local HTTP endpoint in
+# Prometheus' text format, plus a sampling profiler that can be switched on while running.
+# No extra packages needed: the HTTP server is plain asyncio and the profiler is a thread.
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter as SampleCounter
+
+
+def format_labels(labels):
+    if len(labels) == 0:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(name + '="' + value + '"')
+    return "{" + ",".join(parts) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Metric
+
+    Base for the metric types. Values are kept per set of label values.
+    If a collect function is given, it's called at scrape time and returns
+    (labels, value) pairs instead, for numbers that are cheaper to read than to track.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, description, label_names=(), collect=None):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.collect = collect
+        self.values = {}  # Tuple of label values -> value
+
+    def get_key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self):
+        """
+        :return: The metric in Prometheus text format.
+        """
+
+        if self.collect is not None:
+            self.values = {}
+            for labels, value in self.collect():
+                self.values[self.get_key(labels)] = value
+
+        lines = ["# HELP " + self.name + " " + self.description, "# TYPE " + self.name + " " + self.kind]
+        for key, value in sorted(self.values.items()):
+            lines.append(self.name + format_labels(list(zip(self.label_names, key))) + " " + format_value(value))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.values[self.get_key(labels)] = value
+
+
+class HistogramTimer:
+    """
+    Context manager that observes how long its block took.
+    Works around awaits too, since it only looks at the clock.
+    """
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, description, label_names=(), buckets=default_buckets):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self.get_key(labels)
+        data = self.values.get(key)
+        if data is None:
+            data = [[0] * len(self.buckets), 0.0, 0]  # Bucket counts, sum, count.
+            self.values[key] = data
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                data[0][index] += 1
+                break
+        data[1] += value
+        data[2] += 1
+
+    def time(self, **labels):
+        return HistogramTimer(self, labels)
+
+    def render(self):
+        lines = ["# HELP " + self.name + " " + self.description, "# TYPE " + self.name + " histogram"]
+        for key, (bucket_counts, total, count) in sorted(self.values.items()):
+            labels = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(self.name + "_bucket" + format_labels(labels + [("le", format_value(bound))]) + " " + str(cumulative))
+            lines.append(self.name + "_sum" + format_labels(labels) + " " + format_value(total))
+            lines.append(self.name + "_count" + format_labels(labels) + " " + str(count))
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    """
+    MetricsRegistry
+
+    Holds every metric so they can be rendered together.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, description, label_names=(), collect=None):
+        return self.register(Counter(name, description, label_names, collect))
+
+    def gauge(self, name, description, label_names=(), collect=None):
+        return self.register(Gauge(name, description, label_names, collect))
+
+    def histogram(self, name, description, label_names=(), buckets=Histogram.default_buckets):
+        return self.register(Histogram(name, description, label_names, buckets))
+
+    def render(self):
+        """
+        :return: Every metric in Prometheus text format.
+        """
+
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+class MetricsServer:
+    """
+    MetricsServer
+
+    Tiny HTTP server that answers GET /metrics with the registry's metrics.
+    Meant to listen on localhost for a Prometheus scraper.
+    """
+
+    def __init__(self, registry, host="127.0.0.1", port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print("Metrics on http://" + self.host + ":" + str(self.port) + "/metrics")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):  # Skip the headers.
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status = "200 OK"
+                body = self.registry.render().encode("utf-8")
+            else:
+                status = "404 Not Found"
+                body = b"Not Found\n"
+
+            writer.write(("HTTP/1.1 " + status + "\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                          "Content-Length: " + str(len(body)) + "\r\nConnection: close\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+class SamplingProfiler:
+    """
+    SamplingProfiler
+
+    Every interval, a background thread looks at what the watched thread
+    (normally the one running the event loop) is doing and counts its stack.
+    Cheap enough to leave on for a while in production, unlike cProfile.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = SampleCounter()  # Stack (tuple of frame names, outermost first) -> times seen.
+        self.thread = None
+        self.thread_id = None
+        self.running = False
+        self.started_at = None
+
+    @property
+    def is_running(self):
+        return self.running
+
+    def start(self, thread_id=None):
+        """
+        Starts sampling. Clears any previous samples.
+        :param thread_id: Thread to watch. Defaults to the calling thread.
+        :return: nothing.
+        """
+
+        if self.running:
+            return
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = SampleCounter()
+        self.running = True
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self.run, name="SamplingProfiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops sampling and waits for the sampling thread to finish.
+        :return: nothing.
+        """
+
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(code.co_name + " (" + os.path.basename(code.co_filename) + ":" + str(code.co_firstlineno) + ")")
+                frame = frame.f_back
+            if len(stack) > 0:
+                stack.reverse()
+                self.samples[tuple(stack)] += 1
+            time.sleep(self.interval)
+
+    def get_collapsed_stacks(self):
+        """
+        :return: The samples in collapsed stack format ("outer;inner count" per line), which flame graph tools read.
+        """
+
+        return "\n".join(";".join(stack) + " " + str(count) for stack, count in self.samples.most_common()) + "\n"
+
+    def get_top_functions(self, count=15):
+        """
+        :param count: How many functions to return.
+        :return: A list of (function, samples where it was running, samples where it was on the stack), busiest first.
+        """
+
+        own = SampleCounter()
+        total = SampleCounter()
+        for stack, samples in self.samples.items():
+            own[stack[-1]] += samples
+            for function in set(stack):
+                total[function] += samples
+        return [(function, own[function], total[function]) for function, _ in total.most_common(count)]
@@ -0,0 +1,286 @@
+# Search index for a language's dictionary. It only deals with the text of words,
+# so the language maps the results back to its Word objects.
+# It's built once, in one go, then updated one word at a time as changes are made.
+import bisect
+import itertools
+import re
+from collections import Counter
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Definition tokens used by more words than this (like "the" or "a") don't pick out
+# words by themselves. Their words are only looked through when nothing rarer matches.
+COMMON_TOKEN_LIMIT = 2000
+
+
+def get_trigrams(text):
+    """
+    Splits text into overlapping three letter chunks. The ends are padded so short words still get some.
+    :param text: Lowercase text.
+    :return: A set of the trigrams.
+    """
+
+    padded = "  " + text + " "
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def get_tokens(text):
+    """
+    :param text: Any text.
+    :return: A set of the lowercase words in it.
+    """
+
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+
+def prepare_words(words):
+    """
+    Works out everything the index needs for a batch of words, grouped so that
+    SearchIndex.add_prepared only has to merge it in. Safe to run off the event loop.
+    :param words: A list of (text, pronunciation, definition).
+    :return: The batch's sorted prefix keys, text -> trigram count, trigram -> texts and token -> texts.
+    """
+
+    keys = []
+    trigram_counts = {}
+    trigrams = {}
+    tokens = {}
+    for text, pronunciation, definition in words:
+        key = text.lower()
+        keys.append((key, text))
+        word_trigrams = get_trigrams(key)
+        trigram_counts[text] = len(word_trigrams)
+        for trigram in word_trigrams:
+            trigrams.setdefault(trigram, []).append(text)
+        for token in get_tokens(pronunciation) | get_tokens(definition):
+            tokens.setdefault(token, []).append(text)
+    keys.sort()
+    return keys, trigram_counts, trigrams, tokens
+
+
+class SearchIndex:
+    """
+    SearchIndex
+
+    Finds words by prefix, substring, close spelling (for typos), or by
+    words in their definition and pronunciation, and ranks the results.
+
+    Prefixes use a sorted list of keys (a bisect finds where the prefix starts,
+    which is what a trie would give, with far less memory in Python), spelling
+    uses trigrams, and definitions use an inverted index of tokens.
+    """
+
+    def __init__(self):
+        self.sorted_keys = []  # (lowercase text, text), sorted, for prefix lookups.
+        self.trigrams = {}  # Trigram -> set of texts containing it.
+        self.tokens = {}  # Definition/pronunciation token -> set of texts whose word uses it.
+        self.trigram_counts = {}  # Text -> number of trigrams, for scoring similarity.
+
+    def __len__(self):
+        return len(self.trigram_counts)
+
+    def add(self, text, pronunciation, definition):
+        """
+        Indexes a word.
+        :param text: The word's text.
+        :param pronunciation: The word's pronunciation.
+        :param definition: The word's definition.
+        :return: nothing.
+        """
+
+        key = text.lower()
+        bisect.insort(self.sorted_keys, (key, text))
+        self.index_word(key, text, pronunciation, definition)
+
+    def add_many(self, words):
+        """
+        Indexes a batch of words, sorting the prefix keys once at the end instead
+        of inserting them one at a time. Use it to build the index in the first place.
+        Safe to run off the event loop as long as nothing else touches the index.
+        :param words: A list of (text, pronunciation, definition).
+        :return: nothing.
+        """
+
+        for text, pronunciation, definition in words:
+            key = text.lower()
+            self.sorted_keys.append((key, text))
+            self.index_word(key, text, pronunciation, definition)
+        self.sorted_keys.sort()
+
+    def add_prepared(self, batch):
+        """
+        Indexes a batch of words from prepare_words. Each trigram and token is
+        touched once for the whole batch, and the prefix keys are merged in with one sort.
+        :param batch: What prepare_words returned.
+        :return: nothing.
+        """
+
+        keys, trigram_counts, trigrams, tokens = batch
+        self.sorted_keys.extend(keys)
+        self.sorted_keys.sort()  # Two sorted runs, so this is a merge.
+        self.trigram_counts.update(trigram_counts)
+        for trigram, texts in trigrams.items():
+            self.trigrams.setdefault(trigram, set()).update(texts)
+        for token, texts in tokens.items():
+            self.tokens.setdefault(token, set()).update(texts)
+
+    def index_word(self, key, text, pronunciation, definition):
+        """
+        Adds a word's trigrams and tokens. Its prefix key is left to the caller.
+        """
+
+        trigrams = get_trigrams(key)
+        self.trigram_counts[text] = len(trigrams)
+        for trigram in trigrams:
+            self.trigrams.setdefault(trigram, set()).add(text)
+
+        for token in get_tokens(pronunciation) | get_tokens(definition):
+            self.tokens.setdefault(token, set()).add(text)
+
+    def remove(self, text, pronunciation, definition):
+        """
+        Takes a word out of the index. Needs the same values it was added with.
+        :param text: The word's text.
+        :param pronunciation: The word's pronunciation.
+        :param definition: The word's definition.
+        :return: nothing.
+        """
+
+        key = text.lower()
+        index = bisect.bisect_left(self.sorted_keys, (key, text))
+        if index < len(self.sorted_keys) and self.sorted_keys[index] == (key, text):
+            del self.sorted_keys[index]
+
+        self.trigram_counts.pop(text, None)
+        for trigram in get_trigrams(key):
+            self.discard(self.trigrams, trigram, text)
+
+        for token in get_tokens(pronunciation) | get_tokens(definition):
+            self.discard(self.tokens, token, text)
+
+    @staticmethod
+    def discard(index, key, text):
+        texts = index.get(key)
+        if texts is not None:
+            texts.discard(text)
+            if len(texts) == 0:
+                del index[key]
+
+    def find_prefix(self, prefix, limit):
+        """
+        :param prefix: Lowercase start of the words to find.
+        :param limit: Most words to return.
+        :return: Texts of words starting with the prefix, in alphabetical order.
+        """
+
+        results = []
+        index = bisect.bisect_left(self.sorted_keys, (prefix, ""))
+        while index < len(self.sorted_keys) and len(results) < limit:
+            key, text = self.sorted_keys[index]
+            if not key.startswith(prefix):
+                break
+            results.append(text)
+            index += 1
+        return results
+
+    def find_similar(self, query):
+        """
+        Scores words by how many trigrams they share with the query. Also picks out
+        the words containing the query, since those must have every one of its inner trigrams.
+        :param query: Lowercase text to look for.
+        :return: A dictionary of text -> similarity (0 to 1), and a list of texts containing the query.
+        """
+
+        query_trigrams = get_trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            texts = self.trigrams.get(trigram)
+            if texts is not None:
+                shared.update(texts)
+
+        similarity = {}
+        for text, count in shared.items():
+            similarity[text] = 2.0 * count / (len(query_trigrams) + self.trigram_counts[text])
+
+        containing = []
+        if len(query) >= 3:
+            inner_trigrams = [query[i:i + 3] for i in range(len(query) - 2)]
+            candidates = None
+            for trigram in sorted(inner_trigrams, key=lambda t: len(self.trigrams.get(t, ()))):  # Rarest first.
+                texts = self.trigrams.get(trigram, set())
+                candidates = set(texts) if candidates is None else candidates & texts
+                if len(candidates) == 0:
+                    break
+            for text in candidates:
+                if query in text.lower():
+                    containing.append(text)
+
+        return similarity, containing
+
+    def find_tokens(self, query, limit):
+        """
+        Finds words by the query's rarer tokens first, then scores just those words against every token.
+        Very common tokens only bring in words when the rarer ones find fewer than the limit: first the
+        words that have all of them, or failing that a sample of the words with the rarest of them.
+        :param query: Text to look for in definitions and pronunciations.
+        :param limit: How many words the caller wants.
+        :return: A dictionary of text -> fraction of the query's words found in that word's definition or pronunciation.
+        """
+
+        query_tokens = get_tokens(query)
+        postings = sorted((self.tokens[token] for token in query_tokens if token in self.tokens), key=len)  # Rarest first.
+        rare = [texts for texts in postings if len(texts) <= COMMON_TOKEN_LIMIT]
+        common = postings[len(rare):]
+
+        candidates = set()
+        for texts in rare:
+            candidates |= texts
+        if len(candidates) < limit and len(common) > 0:
+            shared = common[0]
+            for texts in common[1:]:
+                shared = shared & texts
+                if len(shared) == 0:
+                    break
+            if len(shared) == 0:
+                shared = common[0]
+            candidates.update(itertools.islice(shared, COMMON_TOKEN_LIMIT))
+
+        return dict((text, sum(text in texts for texts in postings) / len(query_tokens)) for text in candidates)
+
+    def search(self, query, limit=10, min_similarity=0.3):
+        """
+        Searches every way at once and ranks the results. Exact matches come first,
+        then prefixes, words containing the query, close spellings, and finally definition matches.
+        :param query: What to look for.
+        :param limit: Most results to return.
+        :param min_similarity: How close a spelling has to be to count as a typo match.
+        :return: A list of (text, score) with the best first.
+        """
+
+        key = query.lower().strip()
+        if key == "":
+            return []
+        scores = {}
+
+        def score(text, value):
+            if value > scores.get(text, 0.0):
+                scores[text] = value
+
+        for text in self.find_prefix(key, limit):
+            if text.lower() == key:
+                score(text, 1000.0)
+            else:
+                score(text, 500.0 - len(text))
+
+        similarity, containing = self.find_similar(key)
+        for text in containing:
+            score(text, 300.0 - len(text))
+        for text, value in similarity.items():
+            if value >= min_similarity:
+                score(text, 200.0 * value)
+
+        for text, value in self.find_tokens(query, limit).items():
+            score(text, 100.0 * value)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
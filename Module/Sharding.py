@@ -0,0 +1,268 @@
+# Lets several bot processes share the languages in one SQLite database.
+# Languages are split into partitions by channel id. A coordinator process decides which
+# worker should own each partition, and workers hand partitions over between themselves
+# through the database: the old owner lets go before the new one takes it, so a language
+# is never changed by two processes at once.
+# Run the coordinator with:
+#     python Module/Sharding.py --db languages.db --partitions 16
+import argparse
+import asyncio
+import math
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS shard_settings (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS shard_workers (
+        name TEXT PRIMARY KEY,
+        heartbeat REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS shard_partitions (
+        partition INTEGER PRIMARY KEY,
+        owner TEXT,
+        target TEXT
+    );
+"""
+
+
+class PartitionLostError(Exception):
+    """
+    Raised when a process tries to save a change to a language in a partition it no longer owns.
+    """
+
+
+def get_partition(channel_id, partition_count):
+    """
+    :param channel_id: A language's channel id.
+    :param partition_count: How many partitions there are.
+    :return: The partition the language belongs to.
+    """
+
+    return channel_id % partition_count
+
+
+def check_owner(connection, name, channel_id):
+    """
+    Makes sure a process still owns a language's partition. Call it inside the transaction that saves
+    a change, after its first write, so the partition can't be handed over before the change is committed.
+    :param connection: The connection the change is being saved on.
+    :param name: The name of the process saving the change.
+    :param channel_id: The language's channel id.
+    :return: nothing.
+    :raises PartitionLostError: If another process owns it now, or nobody does.
+    """
+
+    row = connection.execute("SELECT shard_partitions.owner FROM shard_partitions, shard_settings WHERE shard_settings.name = 'partition_count' "
+                             "AND shard_partitions.partition = ? % shard_settings.value", (channel_id,)).fetchone()
+    if row is None or row[0] != name:
+        raise PartitionLostError("Channel " + str(channel_id) + " is not in a partition " + name + " owns.")
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")  # Lets the bots read while another process writes.
+    connection.executescript(SCHEMA)
+    connection.commit()
+    return connection
+
+
+class ShardCoordinator:
+    """
+    ShardCoordinator
+
+    Keeps the partitions spread evenly over the workers that are alive.
+    A worker that stops sending heartbeats is dropped, and its partitions are freed.
+    Partitions only move to even things out, so a new worker takes some from the busiest ones.
+    """
+
+    def __init__(self, path, partition_count=16, worker_timeout=10.0, interval=2.0):
+        self.path = path
+        self.partition_count = partition_count
+        self.worker_timeout = worker_timeout  # Seconds without a heartbeat before a worker counts as dead.
+        self.interval = interval
+        self.connection = None
+
+    def open(self):
+        self.connection = connect(self.path)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO shard_settings (name, value) VALUES ('partition_count', ?)", (self.partition_count,))
+            self.connection.executemany("INSERT OR IGNORE INTO shard_partitions (partition) VALUES (?)", [(partition,) for partition in range(self.partition_count)])
+            self.connection.execute("DELETE FROM shard_partitions WHERE partition >= ?", (self.partition_count,))
+
+    def rebalance(self, now=None):
+        """
+        Works out which worker each partition should go to, and frees the ones held by dead workers.
+        :param now: The current time.
+        :return: A dictionary of worker name -> number of partitions it should have.
+        """
+
+        if now is None:
+            now = time.time()
+        with self.connection:
+            self.connection.execute("DELETE FROM shard_workers WHERE heartbeat < ?", (now - self.worker_timeout,))
+            workers = sorted(name for name, in self.connection.execute("SELECT name FROM shard_workers"))
+            self.connection.execute("UPDATE shard_partitions SET owner = NULL WHERE owner NOT IN (SELECT name FROM shard_workers)")
+            partitions = self.connection.execute("SELECT partition, target FROM shard_partitions ORDER BY partition").fetchall()
+
+            loads = dict((name, 0) for name in workers)
+            if len(workers) == 0:
+                self.connection.execute("UPDATE shard_partitions SET target = NULL")
+                return loads
+
+            # Keep partitions where they are when that worker is alive and isn't over its share.
+            quota = math.ceil(len(partitions) / len(workers))
+            targets = {}
+            for partition, target in partitions:
+                if target in loads and loads[target] < quota:
+                    targets[partition] = target
+                    loads[target] += 1
+            for partition, target in partitions:
+                if partition not in targets:
+                    target = min(workers, key=lambda name: (loads[name], name))
+                    targets[partition] = target
+                    loads[target] += 1
+
+            self.connection.executemany("UPDATE shard_partitions SET target = ? WHERE partition = ?", [(target, partition) for partition, target in targets.items()])
+        return loads
+
+    async def run(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        await asyncio.get_event_loop().run_in_executor(executor, self.open)
+        last_loads = None
+        while True:
+            loads = await asyncio.get_event_loop().run_in_executor(executor, self.rebalance)
+            if loads != last_loads:
+                print("Partitions per worker: " + str(loads))
+                last_loads = loads
+            await asyncio.sleep(self.interval)
+
+
+class ShardMembership:
+    """
+    ShardMembership
+
+    A bot process's side of sharding. Sends heartbeats, takes the partitions the
+    coordinator gives it once their old owner has let go, and lets go of the ones
+    it should give up. All the database work runs on one worker thread.
+    """
+
+    def __init__(self, path, name, heartbeat_interval=2.0):
+        self.path = path
+        self.name = name
+        self.heartbeat_interval = heartbeat_interval
+        self.partition_count = None  # Set by the coordinator. Nothing is owned until it is.
+        self.owned = set()  # Partitions this process owns right now.
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def run(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.executor, function, *args)
+
+    def owns(self, channel_id):
+        """
+        :param channel_id: A language's channel id.
+        :return: Whether this process is the one that handles that language.
+        """
+
+        return self.partition_count is not None and get_partition(channel_id, self.partition_count) in self.owned
+
+    async def sync(self):
+        """
+        Sends a heartbeat and takes any partitions that were given to this process and are free.
+        Partitions to give up are stopped being owned here, but stay claimed in the database until release is called.
+        :return: The partitions just taken, and the ones to give up.
+        """
+
+        gained, lost = await self.run(self.sync_blocking, set(self.owned))
+        self.owned.update(gained)
+        self.owned.difference_update(lost)
+        return gained, lost
+
+    def forget(self, channel_id):
+        """
+        Stops owning a language's partition without touching the database, after finding out it was taken away.
+        :param channel_id: The language's channel id.
+        :return: nothing.
+        """
+
+        if self.partition_count is not None:
+            self.owned.discard(get_partition(channel_id, self.partition_count))
+
+    def sync_blocking(self, owned):
+        if self.connection is None:
+            self.connection = connect(self.path)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO shard_workers (name, heartbeat) VALUES (?, ?)", (self.name, time.time()))
+            row = self.connection.execute("SELECT value FROM shard_settings WHERE name = 'partition_count'").fetchone()
+            if row is None:
+                return set(), set()
+            if row[0] != self.partition_count:  # Partition count changed (or first sync). Start over.
+                lost = set(owned)
+                self.partition_count = row[0]
+                return set(), lost
+
+            gained = set()
+            lost = set()
+            for partition, owner, target in self.connection.execute("SELECT partition, owner, target FROM shard_partitions").fetchall():
+                if partition in owned and owner != self.name:
+                    lost.add(partition)  # Freed (and maybe taken) while this process was stalled past the worker timeout.
+                elif owner == self.name and target != self.name:
+                    lost.add(partition)
+                elif target == self.name and owner is None:
+                    cursor = self.connection.execute("UPDATE shard_partitions SET owner = ? WHERE partition = ? AND owner IS NULL", (self.name, partition))
+                    if cursor.rowcount == 1:
+                        gained.add(partition)
+                elif owner == self.name and partition not in owned:
+                    gained.add(partition)  # Still ours from before a restart.
+            return gained, lost
+
+    async def release(self, partitions):
+        """
+        Lets go of partitions once everything in them is saved, so their new owner can take them.
+        :param partitions: The partitions.
+        :return: nothing.
+        """
+
+        await self.run(self.release_blocking, list(partitions))
+
+    def release_blocking(self, partitions):
+        with self.connection:
+            self.connection.executemany("UPDATE shard_partitions SET owner = NULL WHERE partition = ? AND owner = ?", [(partition, self.name) for partition in partitions])
+
+    async def leave(self):
+        """
+        Lets go of everything and stops counting as a worker, for a clean shutdown.
+        :return: nothing.
+        """
+
+        if self.connection is not None:
+            await self.run(self.leave_blocking)
+        self.owned = set()
+
+    def leave_blocking(self):
+        with self.connection:
+            self.connection.execute("UPDATE shard_partitions SET owner = NULL WHERE owner = ?", (self.name,))
+            self.connection.execute("DELETE FROM shard_workers WHERE name = ?", (self.name,))
+        self.connection.close()
+        self.connection = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coordinator for running LanguageBot as several processes.")
+    parser.add_argument("--db", default="languages.db", help="The database the bots share.")
+    parser.add_argument("--partitions", type=int, default=16, help="How many pieces to split the languages into.")
+    parser.add_argument("--worker-timeout", type=float, default=10.0, help="Seconds without a heartbeat before a worker is dropped.")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between rebalances.")
+    arguments = parser.parse_args()
+
+    coordinator = ShardCoordinator(arguments.db, arguments.partitions, arguments.worker_timeout, arguments.interval)
+    asyncio.get_event_loop().run_until_complete(coordinator.run())
+
+
+if __name__ == "__main__":
+    main()